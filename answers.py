@@ -0,0 +1,365 @@
+"""
+Кэш ответов на повторяющиеся вопросы, не зависящие от истории чата.
+
+Кэш используется, только если вопрос заведомо самостоятельный: в чате не было активности последние
+quiet_seconds (вопросу не к чему отсылать) и is_standalone() не нашёл в нём ссылок на предыдущий
+разговор на языке вопроса («это», «там», «ещё», «it», «then», «the place», «esse», «quello», начальные
+«and…» и «¿está…», «пункт 3»…) при не меньше чем MIN_WORDS словах. Только такие вопросы отвечаются без сводки
+и последних сообщений, и только их ответы попадают в общий для всех чатов кэш; в остальных случаях
+промпт строится с историей, как раньше.
+
+Вопрос переводится в вектор локально: хэшированные символьные n-граммы слов и сами слова с
+весами TF-IDF, нормированные по L2. Таблица IDF строится заранее по сообщениям из chat_history:
+
+    python answers.py build-idf
+
+и хранится в models/answer_idf.json (без неё все веса IDF равны 1). Похожий вопрос ищется по
+косинусной близости среди записей того же языка через инвертированный индекс признаков;
+ответ выдаётся, если близость не ниже threshold.
+
+Записи хранятся в SQLite (таблица answer_cache в cache.db) с TTL и загружаются в память при старте;
+в каждом языке держится не больше max_entries записей, лишние вытесняются по давности последнего
+попадания (LRU). Метрики: answer_cache.hits, .misses, .bypassed (ссылки в вопросе),
+.bypassed_recent (недавняя активность в чате), .stored, .evicted.
+Оценка доли попаданий и ложных попаданий на логах: benchmarks/eval_answer_cache.py.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import logging
+import sqlite3
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import metrics
+from db import Database
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+ANSWER_IDF_FILE = os.path.join(MODELS_DIR, "answer_idf.json")
+
+# Подобран по benchmarks/eval_answer_cache.py: ниже 0.8 резко растёт доля ложных попаданий
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+# Чат считается «тихим», если в нём не было сообщений и нажатий кнопок столько секунд
+DEFAULT_QUIET_SECONDS = 30 * 60
+MIN_WORDS = 3
+
+HASH_BUCKETS = 2 ** 20
+NGRAM_RANGE = (3, 5)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Ссылки на предыдущий разговор для каждого языка из i18n.LANGUAGES: местоимения, указательные слова,
+# «ещё/тоже/другой», «тогда», порядковые числительные, а после «|» — союзы, с которых начинается
+# продолжение («and how much…», «e esse…», «а там…»), через запятую. Список намеренно широкий: лишнее слово только
+# отправляет вопрос по обычному пути с историей, а пропущенное — отдаёт ответ без неё и кладёт его в общий кэш.
+_REFERENCES = {
+    "en": "it its it's that this these those there they them their he she him her his more also again same "
+          "another other others else then previous above first second third one ones former latter too instead "
+          "the_place the_spot "
+          "| and, but, so, or, ok, okay, what about, how about",
+    "es": "eso esto ese esa este esta esos esas estos estas aquel aquella ahí allí allá más también otro otra otros "
+          "otras mismo misma él ella ellos ellas entonces anterior primero primera segundo segunda tercero "
+          "el_lugar el_sitio | y, pero, o, e, vale, bueno, qué tal, está, abre, cierra",
+    "fr": "ce c'est ces cet cette ça cela ceci celui celle ceux celles là encore aussi autre autres même mêmes lui elle eux leur alors "
+          "précédent premier première deuxième second | et, mais, ou, donc",
+    "pt": "isso isto esse essa este esta esses essas aquele aquela aquilo lá aí ali mais também outro outra outros "
+          "outras mesmo mesma ele ela eles elas dele dela então anterior primeiro primeira segundo segunda "
+          "| e, mas, ou",
+    "de": "es er ihn ihm dies diese dieser dieses diesen jene dort dorthin dahin da dann davon darüber dazu noch auch andere "
+          "anderen weitere gleiche erste zweite | und, aber, oder",
+    "it": "quello quella quelli quelle questo questa questi queste lì là ancora anche altro altra altri altre stesso "
+          "stessa lui lei loro allora poi primo prima secondo seconda | e, ma, o",
+    "ru": "это этот эта эти этом этого этой тот та те того том то там туда оттуда его её ее их ему ей ним ней них "
+          "он она они оно ещё еще тоже также другой другая другие другое больше тогда потом первый второй третий "
+          "| и, а, но, или, ок, ладно, хорошо",
+    "uk": "це цей ця ці цього цьому той та ті там туди його її їх йому їй ним нею них він вона вони воно ще теж "
+          "також інший інша інші більше тоді потім перший другий третій | і, й, а, але, або",
+    "pl": "to tego tym ten ta te tamten tamto tam jego jej ich on ona oni one jeszcze też także inny inna inne "
+          "więcej wtedy potem pierwszy drugi | a, i, ale, albo",
+    "cs": "to toho tom ten ta ty tam jeho její jejich on ona oni ještě také taky jiný jiná jiné více víc pak tedy "
+          "první druhý | a, i, ale, nebo",
+    "nl": "dat dit deze die daar het hij zij ze hem haar hun nog ook ander andere meer dan eerste tweede "
+          "| en, maar, of",
+    "sv": "det den dessa de där dit han hon dem honom henne deras mer mera också även andra annan samma då sedan "
+          "första | och, men, eller",
+    "da": "det den disse de der derhen han hun dem ham hende deres mere også anden andre samme så første "
+          "| og, men, eller",
+    "no": "det den disse de der dit han hun dem ham henne deres mer mere også annen andre samme så da første "
+          "| og, men, eller",
+    "tr": "bu şu o bunu şunu onu bunlar şunlar onlar orada oraya orası daha başka aynı sonra ilk ikinci "
+          "| ve, ama, veya, peki",
+    "el": "αυτό αυτή αυτός αυτά αυτοί εκεί εκείνο εκείνη εκείνος ακόμα επίσης άλλο άλλη άλλα ίδιο ίδια τότε "
+          "πρώτο δεύτερο | και, αλλά, ή",
+    "ar": "هذا هذه ذلك تلك هؤلاء هناك هو هي هم هن أيضا أيضًا آخر أخرى المزيد نفس ثم إذن | لكن, أو",
+    "he": "זה זאת זו אלה אלו שם הוא היא הם הן עוד גם אחר אחרת אחרים אותו אותה אותם אז | אבל, או",
+}
+# В японском, корейском и китайском слова не разделяются пробелами — ищем подстроки
+_REFERENCE_SUBSTRINGS = {
+    "ja": "これ それ あれ この その あの そこ あそこ もっと また 他の ほか 同じ じゃあ では",
+    "ko": "그거 그것 이거 이것 저거 저것 거기 그곳 그럼 그러면 다른 같은",
+    "zh": "这 那 它 他 她 还有 也 再 别的 其他 同样",
+}
+
+
+def _alternatives(words) -> str:
+    # Длинные варианты раньше коротких; пробел внутри фразы — любой пробельный промежуток
+    return "|".join(re.escape(w).replace("\\ ", r"\s+") for w in sorted(set(words), key=len, reverse=True))
+
+
+def _context_re(langs: Iterable[str]) -> "re.Pattern":
+    words, leading, substrings = [], [], []
+    for lang in langs:
+        if lang in _REFERENCES:
+            references, _, conjunctions = _REFERENCES[lang].partition("|")
+            # Подчёркивание соединяет слова фразы («the_place»)
+            words.extend(w.replace("_", " ") for w in references.split())
+            leading.extend(c.strip() for c in conjunctions.split(",") if c.strip())
+        substrings.extend(_REFERENCE_SUBSTRINGS.get(lang, "").split())
+    parts = [r"\b(" + _alternatives(words) + r")\b", r"^\W*(" + _alternatives(leading) + r")\b"]
+    if substrings:
+        parts.append(_alternatives(substrings))
+    # Номера пунктов и вариантов («пункт 3», «option 2»)
+    parts.append(r"\d")
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+# Проверяются слова языка вопроса и английские (гости часто пишут вперемешку); для неизвестного
+# языка — слова всех языков
+_CONTEXT_RES = {lang: _context_re({lang, "en"}) for lang in list(_REFERENCES) + list(_REFERENCE_SUBSTRINGS)}
+_ANY_CONTEXT_RE = _context_re(list(_REFERENCES) + list(_REFERENCE_SUBSTRINGS))
+
+
+def is_standalone(text: str, lang: Optional[str] = None) -> bool:
+    """Вопрос на языке lang понятен без истории чата: достаточно длинный и без ссылок на предыдущее."""
+    context_re = _CONTEXT_RES.get((lang or "")[:2].lower(), _ANY_CONTEXT_RE)
+    return len(_WORD_RE.findall(text)) >= MIN_WORDS and not context_re.search(text)
+
+
+def _grams(text: str) -> List[int]:
+    grams = []
+    for token in _WORD_RE.findall(text.lower()):
+        grams.append(f"w:{token}")
+        padded = f" {token} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return [zlib.crc32(gram.encode("utf-8")) % HASH_BUCKETS for gram in grams]
+
+
+def vectorize(text: str, idf: Dict[int, float], default_idf: float = 1.0) -> Dict[int, float]:
+    """Разреженный вектор TF-IDF (сублинейный TF), нормированный по L2."""
+    weights = {idx: (1.0 + math.log(tf)) * idf.get(idx, default_idf) for idx, tf in Counter(_grams(text)).items()}
+    norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+    return {idx: w / norm for idx, w in weights.items()}
+
+
+def build_idf(texts: Iterable[str]) -> Tuple[Dict[int, float], float]:
+    """Сглаженный IDF по документам и значение для признаков, которых не было в документах."""
+    df: Counter = Counter()
+    documents = 0
+    for text in texts:
+        documents += 1
+        df.update(set(_grams(text)))
+    idf = {idx: math.log((1 + documents) / (1 + count)) + 1.0 for idx, count in df.items()}
+    return idf, math.log(1 + documents) + 1.0
+
+
+def save_idf(idf: Dict[int, float], default_idf: float, path: str = ANSWER_IDF_FILE) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {
+        "buckets": HASH_BUCKETS,
+        "ngram_range": list(NGRAM_RANGE),
+        "default": round(default_idf, 6),
+        "idf": {str(idx): round(w, 6) for idx, w in sorted(idf.items())},
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_idf(path: str = ANSWER_IDF_FILE) -> Tuple[Dict[int, float], float]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("buckets") != HASH_BUCKETS or tuple(data.get("ngram_range", ())) != NGRAM_RANGE:
+        raise ValueError("IDF table was built with different feature settings")
+    return {int(idx): w for idx, w in data["idf"].items()}, data["default"]
+
+
+class AnswerIndex:
+    """Векторы вопросов в памяти с инвертированным индексом по признакам, раздельно по языкам."""
+
+    def __init__(self):
+        self._vectors: Dict[Hashable, Tuple[str, Dict[int, float]]] = {}
+        self._postings: Dict[Tuple[str, int], Dict[Hashable, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def add(self, key: Hashable, lang: str, vector: Dict[int, float]) -> None:
+        self.remove(key)
+        self._vectors[key] = (lang, vector)
+        for idx, weight in vector.items():
+            self._postings.setdefault((lang, idx), {})[key] = weight
+
+    def remove(self, key: Hashable) -> None:
+        item = self._vectors.pop(key, None)
+        if item is None:
+            return
+        lang, vector = item
+        for idx in vector:
+            posting = self._postings.get((lang, idx))
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[(lang, idx)]
+
+    def best(self, lang: str, vector: Dict[int, float]) -> Tuple[Optional[Hashable], float]:
+        """Самая близкая запись того же языка и её косинусная близость."""
+        scores: Dict[Hashable, float] = {}
+        for idx, weight in vector.items():
+            posting = self._postings.get((lang, idx))
+            if posting:
+                for key, entry_weight in posting.items():
+                    scores[key] = scores.get(key, 0.0) + weight * entry_weight
+        if not scores:
+            return None, 0.0
+        key = max(scores, key=scores.get)
+        return key, scores[key]
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+class SemanticAnswerCache:
+    """Ответы на самостоятельные вопросы с поиском по близости, TTL и LRU-вытеснением по языкам."""
+
+    def __init__(self, database: Database, threshold: float = DEFAULT_THRESHOLD, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, quiet_seconds: float = DEFAULT_QUIET_SECONDS,
+                 idf_path: str = ANSWER_IDF_FILE):
+        self.database = database
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.quiet_seconds = quiet_seconds
+        self.idf_path = idf_path
+        self._idf: Dict[int, float] = {}
+        self._default_idf = 1.0
+        self._index = AnswerIndex()
+        # (язык, нормализованный вопрос) -> [ответ, истекает, последнее попадание]
+        self._entries: Dict[Tuple[str, str], list] = {}
+        metrics.register_gauge("answer_cache.entries", lambda: len(self._entries))
+
+    async def load(self) -> None:
+        """Загружает таблицу IDF и неистёкшие записи из базы."""
+        try:
+            self._idf, self._default_idf = load_idf(self.idf_path)
+            logger.info(f"Answer cache IDF table loaded: {len(self._idf)} features.")
+        except FileNotFoundError:
+            logger.info(f"Answer cache IDF table {self.idf_path} not found, using plain TF.")
+        except Exception as e:
+            logger.error(f"Error loading answer cache IDF table: {e}")
+        await self.database.execute("DELETE FROM answer_cache WHERE expires_at <= ?", (time.time(),))
+        rows = await self.database.fetch_all("SELECT lang, query, answer, expires_at, last_hit_at FROM answer_cache")
+        for lang, query, answer, expires_at, last_hit_at in rows:
+            self._add((lang, query), answer, expires_at, last_hit_at)
+        logger.info(f"Answer cache loaded: {len(self._entries)} entries.")
+
+    def _add(self, key: Tuple[str, str], answer: str, expires_at: float, last_hit_at: float) -> None:
+        self._entries[key] = [answer, expires_at, last_hit_at]
+        self._index.add(key, key[0], vectorize(key[1], self._idf, self._default_idf))
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        del self._entries[key]
+        self._index.remove(key)
+
+    def cacheable(self, text: str, lang: str, last_activity_at: Optional[float] = None) -> bool:
+        """Можно ли ответить на вопрос без истории (и взять ответ из кэша или положить в него)."""
+        if last_activity_at is not None and time.time() - last_activity_at < self.quiet_seconds:
+            metrics.inc("answer_cache.bypassed_recent")
+            return False
+        if not is_standalone(text, lang):
+            metrics.inc("answer_cache.bypassed")
+            return False
+        return True
+
+    async def lookup(self, text: str, lang: str) -> Optional[str]:
+        """Ответ на достаточно близкий вопрос того же языка или None."""
+        query = normalize_query(text)
+        key, score = self._index.best(lang, vectorize(query, self._idf, self._default_idf))
+        now = time.time()
+        if key is not None and score >= self.threshold:
+            entry = self._entries[key]
+            if entry[1] > now:
+                entry[2] = now
+                metrics.inc("answer_cache.hits")
+                logger.info(f"Answer cache hit ({score:.2f}): {text!r} ~ {key[1]!r}")
+                await self.database.execute(
+                    "UPDATE answer_cache SET last_hit_at = ?, hits = hits + 1 WHERE lang = ? AND query = ?",
+                    (now, key[0], key[1])
+                )
+                return entry[0]
+            self._drop(key)
+            await self.database.execute("DELETE FROM answer_cache WHERE lang = ? AND query = ?", key)
+        metrics.inc("answer_cache.misses")
+        return None
+
+    async def store(self, text: str, lang: str, answer: str) -> None:
+        key = (lang, normalize_query(text))
+        now = time.time()
+        await self.database.execute(
+            "INSERT INTO answer_cache (lang, query, answer, stored_at, expires_at, last_hit_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(lang, query) DO UPDATE SET answer = excluded.answer, stored_at = excluded.stored_at, "
+            "expires_at = excluded.expires_at, last_hit_at = excluded.last_hit_at",
+            (key[0], key[1], answer, now, now + self.ttl, now)
+        )
+        self._add(key, answer, now + self.ttl, now)
+        metrics.inc("answer_cache.stored")
+        await self._evict(lang)
+
+    async def _evict(self, lang: str) -> None:
+        entries = [(entry[2], key) for key, entry in self._entries.items() if key[0] == lang]
+        excess = len(entries) - self.max_entries
+        if excess <= 0:
+            return
+        stale = [key for _, key in sorted(entries)[:excess]]
+        for key in stale:
+            self._drop(key)
+        await self.database.execute_many("DELETE FROM answer_cache WHERE lang = ? AND query = ?", stale)
+        metrics.inc("answer_cache.evicted", len(stale))
+
+
+def logged_queries(history_db: str) -> List[str]:
+    """Сообщения пользователей из chat_history в порядке поступления, кроме нажатий кнопок меню."""
+    from i18n import MENU_LABELS
+
+    with sqlite3.connect(history_db) as conn:
+        rows = conn.execute(
+            "SELECT message_text FROM chat_history WHERE role = 'user' AND message_text IS NOT NULL ORDER BY id"
+        ).fetchall()
+    skip = {label.lower() for label in MENU_LABELS.values()}
+    return [row[0].strip() for row in rows if row[0].strip() and row[0].strip().lower() not in skip]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) < 2 or sys.argv[1] != "build-idf":
+        print("Usage: python answers.py build-idf [chat_history.db]")
+        sys.exit(1)
+    history_db = sys.argv[2] if len(sys.argv) > 2 else "chat_history.db"
+    queries = sorted(set(normalize_query(text) for text in logged_queries(history_db)))
+    idf, default_idf = build_idf(queries)
+    save_idf(idf, default_idf)
+    logger.info(f"IDF table built from {len(queries)} distinct queries: {len(idf)} features -> {ANSWER_IDF_FILE}")
+
+
+if __name__ == "__main__":
+    main()
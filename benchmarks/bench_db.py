@@ -0,0 +1,84 @@
+"""
+Микробенчмарк накладных расходов SQLite на одно текстовое сообщение.
+
+На каждое сообщение бот сохраняет его в chat_history и читает сводку беседы. Сравниваются
+прежний подход (sqlite3.connect на каждый вызов) и долгоживущие соединения db.Database
+(синхронно и через async-обёртки с пулом потоков). Работает на временной копии chat_history.db.
+
+Запуск: python benchmarks/bench_db.py [--messages 2000]
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from db import Database  # noqa: E402
+
+INSERT_SQL = "INSERT INTO chat_history (chat_id, user_id, role, message_text) VALUES (?, ?, ?, ?)"
+SUMMARY_SQL = "SELECT summary FROM conversation_summary WHERE chat_id = ?"
+
+
+def legacy_message(path: str, i: int) -> None:
+    with sqlite3.connect(path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(INSERT_SQL, ("bench", "bench", "user", f"message {i}"))
+        conn.commit()
+    with sqlite3.connect(path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(SUMMARY_SQL, ("bench",))
+        cursor.fetchone()
+
+
+def pooled_message(database: Database, i: int) -> None:
+    database.execute_sync(INSERT_SQL, ("bench", "bench", "user", f"message {i}"))
+    database.fetch_one_sync(SUMMARY_SQL, ("bench",))
+
+
+async def pooled_async(database: Database, messages: int) -> None:
+    for i in range(messages):
+        await database.execute(INSERT_SQL, ("bench", "bench", "user", f"message {i}"))
+        await database.fetch_one(SUMMARY_SQL, ("bench",))
+
+
+def report(name: str, elapsed: float, messages: int) -> None:
+    print(f"{name:<28} {elapsed / messages * 1e6:8.1f} µs/message")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chat_history.db")
+        shutil.copy(os.path.join(ROOT, "chat_history.db"), path)
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+
+        started = time.perf_counter()
+        for i in range(args.messages):
+            legacy_message(path, i)
+        report("connect-per-call", time.perf_counter() - started, args.messages)
+
+        database = Database(path)
+        database.set_wal_mode()
+        started = time.perf_counter()
+        for i in range(args.messages):
+            pooled_message(database, i)
+        report("long-lived (sync)", time.perf_counter() - started, args.messages)
+
+        started = time.perf_counter()
+        asyncio.run(pooled_async(database, args.messages))
+        report("long-lived (async, off-loop)", time.perf_counter() - started, args.messages)
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
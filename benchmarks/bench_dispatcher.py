@@ -0,0 +1,80 @@
+"""
+Бенчмарк конкурентной обработки апдейтов.
+
+Сравнивает последовательную обработку (поведение ApplicationBuilder по умолчанию) с
+ChatOrderedUpdateProcessor: несколько чатов присылают серию сообщений, обработчик «думает»
+случайное время. Дополнительно проверяется, что порядок сообщений внутри чата сохранён и что
+два обработчика одного чата никогда не выполнялись одновременно.
+
+Запуск: python benchmarks/bench_dispatcher.py [--chats 20] [--messages 5] [--limit 32]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+
+from dispatcher import ChatOrderedUpdateProcessor  # noqa: E402
+
+
+async def simulate(processor, chats: int, messages: int, seed: int = 42):
+    rng = random.Random(seed)
+    delays = {(c, m): rng.uniform(0.05, 0.3) for c in range(chats) for m in range(messages)}
+    seen = {c: [] for c in range(chats)}
+    running = {c: 0 for c in range(chats)}
+    overlaps = 0
+
+    async def handler(chat: int, msg: int):
+        nonlocal overlaps
+        running[chat] += 1
+        if running[chat] > 1:
+            overlaps += 1
+        seen[chat].append(msg)
+        await asyncio.sleep(delays[(chat, msg)])
+        running[chat] -= 1
+
+    # Апдейты приходят вперемешку, как из getUpdates; порядок внутри чата — по номеру сообщения
+    updates = [(c, m) for m in range(messages) for c in range(chats)]
+    started = time.perf_counter()
+    async with processor:
+        if processor.max_concurrent_updates > 1:
+            tasks = [
+                asyncio.create_task(processor.process_update(
+                    SimpleNamespace(effective_chat=SimpleNamespace(id=c)), handler(c, m)))
+                for c, m in updates
+            ]
+            await asyncio.gather(*tasks)
+        else:
+            for c, m in updates:
+                await processor.process_update(SimpleNamespace(effective_chat=SimpleNamespace(id=c)), handler(c, m))
+    elapsed = time.perf_counter() - started
+    ordered = all(seen[c] == list(range(messages)) for c in range(chats))
+    return elapsed, ordered, overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=32)
+    args = parser.parse_args()
+
+    for name, processor in (
+        ("serial", SimpleUpdateProcessor(1)),
+        (f"concurrent(limit={args.limit})", ChatOrderedUpdateProcessor(args.limit)),
+    ):
+        elapsed, ordered, overlaps = asyncio.run(simulate(processor, args.chats, args.messages))
+        total = args.chats * args.messages
+        print(f"{name:<22} updates={total:<4} time={elapsed:6.2f}s "
+              f"throughput={total / elapsed:6.1f} upd/s per-chat-order={'ok' if ordered else 'BROKEN'} "
+              f"same-chat-overlaps={overlaps}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Бенчмарк markup.validate_html и длительная проверка свойств validate_html и chunk_html.
+
+Свойства и генераторы случайных входов — в tests/test_markup.py (там они прогоняются pytest
+с небольшим числом случаев на фиксированных seed). Скрипт:
+1) проверяет на --cases случайных строках, что validate_html совпадает с прежней реализацией на
+   BeautifulSoup символ в символ; при расхождении печатает минимальный найденный пример и
+   завершается с кодом 1;
+2) проверяет на --chunk-cases случайных ответах, что chunk_html укладывает части в лимиты,
+   сохраняет баланс тегов и не теряет видимый текст;
+3) сравнивает время на ответах размером 4 КБ и 40 КБ.
+
+Запуск: python benchmarks/bench_html.py [--cases 20000] [--chunk-cases 3000] [--seed 1] [--repeat 50]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from markup import validate_html  # noqa: E402
+from tests.test_markup import (  # noqa: E402
+    find_chunk_problem, find_mismatch, llm_answer, reference_validate_html,
+)
+
+
+def check(cases: int, seed: int) -> bool:
+    text = find_mismatch(cases, seed)
+    if text is not None:
+        print(f"MISMATCH on {text!r}")
+        print(f"  expected {reference_validate_html(text)!r}")
+        print(f"  got      {validate_html(text)!r}")
+        return False
+    print(f"equivalence: {cases} random cases identical")
+    return True
+
+
+def check_chunks(cases: int, seed: int) -> bool:
+    problem = find_chunk_problem(cases, seed)
+    if problem is not None:
+        print(f"CHUNKING PROBLEM: {problem}")
+        return False
+    print(f"chunking: {cases} random answers split within limits with balanced tags")
+    return True
+
+
+def bench(repeat: int) -> None:
+    for size in (4 * 1024, 40 * 1024):
+        text = llm_answer(size)
+        assert validate_html(text) == reference_validate_html(text)
+        timings = {}
+        for name, func in (("beautifulsoup", reference_validate_html), ("markup", validate_html)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                func(text)
+            timings[name] = (time.perf_counter() - started) / repeat * 1000
+        print(f"{size // 1024:>3} KB  beautifulsoup={timings['beautifulsoup']:.2f} ms  "
+              f"markup={timings['markup']:.3f} ms  x{timings['beautifulsoup'] / timings['markup']:.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--chunk-cases", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    if not check(args.cases, args.seed) or not check_chunks(args.chunk_cases, args.seed):
+        sys.exit(1)
+    bench(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Бенчмарк определения языка: прежний способ против language.LanguageDetector.
+
+Для каждого пользовательского сообщения из chat_history.db (и ответа LLM к нему — записи о
+местах в формате answer_system_prompt на языке сообщения) считается процессорное время:
+- прежний способ: detect(text) дважды в handle_message и detect(answer) дважды в finalize_answer,
+  без фиксированного зерна;
+- LanguageDetector: один вызов на текст, нормализация, пропуск коротких, LRU по хэшу.
+
+Сообщения прогоняются --passes раз (повторные прогоны показывают эффект кэша на повторяющихся
+запросах). Отдельно выводится число текстов, для которых прежний способ дал разный язык в
+--runs повторах, — у LanguageDetector результат фиксирован.
+
+Запуск: python benchmarks/bench_language.py [--passes 2] [--runs 5] [--limit 0]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langdetect import DetectorFactory, detect  # noqa: E402
+from langdetect.lang_detect_exception import LangDetectException  # noqa: E402
+
+from language import LanguageDetector  # noqa: E402
+
+DB_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "chat_history.db")
+
+ANSWER_ENTRIES = {
+    "es": "<b>Café Frida</b> 💲💲\n- <a href='https://www.google.com/maps/place/?q=place_id:ChIJ123'>Ver en el mapa</a>\n"
+          "<b>Rating: 4.5</b>\n<i>Comida tradicional de Chiapas y un café excelente cerca de la catedral.</i>\n\n",
+    "en": "<b>Café Frida</b> 💲💲\n- <a href='https://www.google.com/maps/place/?q=place_id:ChIJ123'>View on map</a>\n"
+          "<b>Rating: 4.5</b>\n<i>Traditional Chiapas food and great coffee near the cathedral.</i>\n\n",
+    "ru": "<b>Café Frida</b> 💲💲\n- <a href='https://www.google.com/maps/place/?q=place_id:ChIJ123'>На карте</a>\n"
+          "<b>Rating: 4.5</b>\n<i>Традиционная кухня Чьяпаса и отличный кофе рядом с собором.</i>\n\n",
+}
+
+
+def load_messages(limit: int) -> list:
+    conn = sqlite3.connect(DB_HISTORY)
+    try:
+        rows = conn.execute("SELECT message_text FROM chat_history WHERE role = 'user' ORDER BY id").fetchall()
+    finally:
+        conn.close()
+    messages = [row[0] for row in rows if row[0] and row[0].strip()]
+    return messages[:limit] if limit else messages
+
+
+def answer_for(n: int, text: str, detector: LanguageDetector) -> str:
+    """Ответ на языке сообщения; номер сообщения делает каждый ответ уникальным."""
+    entry = ANSWER_ENTRIES.get(detector.detect(text), ANSWER_ENTRIES["en"])
+    return "".join(entry.replace("Café Frida", f"Café Frida {n}-{i}") for i in range(5))
+
+
+def old_detect(text: str):
+    try:
+        return detect(text)
+    except LangDetectException:
+        return None
+
+
+def old_way(text: str, answer: str) -> None:
+    # handle_message: language_code_to_target(detect(text)) if detect(text) else lang
+    if old_detect(text):
+        old_detect(text)
+    # finalize_answer: то же для ответа
+    if old_detect(answer):
+        old_detect(answer)
+
+
+def new_way(detector: LanguageDetector, text: str, answer: str) -> None:
+    detector.detect(text, default="en")
+    detector.detect(answer, hint="en")
+
+
+def measure(func, pairs: list, passes: int) -> float:
+    started = time.process_time()
+    for _ in range(passes):
+        for text, answer in pairs:
+            func(text, answer)
+    return time.process_time() - started
+
+
+def unstable_count(texts: list, runs: int) -> int:
+    unstable = 0
+    for text in texts:
+        if len({old_detect(text) for _ in range(runs)}) > 1:
+            unstable += 1
+    return unstable
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--passes", type=int, default=2)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=0)
+    args = parser.parse_args()
+
+    messages = load_messages(args.limit)
+    pairs = [(text, answer_for(n, text, LanguageDetector())) for n, text in enumerate(messages)]
+    total = len(pairs) * args.passes
+
+    seed = DetectorFactory.seed
+    DetectorFactory.seed = None
+    try:
+        unstable = unstable_count(messages, args.runs)
+        old_seconds = measure(old_way, pairs, args.passes)
+    finally:
+        DetectorFactory.seed = seed
+    detector = LanguageDetector()
+    new_seconds = measure(lambda text, answer: new_way(detector, text, answer), pairs, args.passes)
+
+    print(f"{len(messages)} messages x {args.passes} passes")
+    print(f"  unseeded langdetect: {unstable} of {len(messages)} messages changed language across {args.runs} runs")
+    print(f"  old:  {old_seconds / total * 1000:.2f} ms CPU per message")
+    print(f"  new:  {new_seconds / total * 1000:.2f} ms CPU per message  "
+          f"(saved {(old_seconds - new_seconds) / total * 1000:.2f} ms, x{old_seconds / max(new_seconds, 1e-9):.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Бенчмарк спекулятивного определения намерения.
+
+Моделирует сообщения, для которых локальный классификатор не уверен и нужен GPT. Задержки
+внешних вызовов заданы случайно в типичных пределах: GPT-классификатор, поиск Google Places,
+генерация ответа. Сравниваются два варианта:
+- последовательный (прежний): классификатор → выбранная ветка;
+- спекулятивный: классификатор, поиск мест и обычный ответ стартуют одновременно через
+  speculation.run_speculative, невыбранная ветка отменяется.
+
+Выводятся p50/p99 полной задержки и число лишних (отменённых) вызовов генерации — цена спекуляции.
+С --per-minute ограничение SpeculationGuard применяется так же, как в боте.
+
+Запуск: python benchmarks/bench_speculation.py [--messages 200] [--places-share 0.5] [--per-minute 0]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from speculation import SpeculationGuard, run_speculative  # noqa: E402
+
+# Пределы задержек, секунды
+INTENT_LATENCY = (0.4, 1.2)
+SEARCH_LATENCY = (0.2, 0.6)
+ANSWER_LATENCY = (1.5, 4.0)
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Message:
+    def __init__(self, rng: random.Random, places_share: float):
+        self.is_places = rng.random() < places_share
+        self.intent = rng.uniform(*INTENT_LATENCY)
+        self.search = rng.uniform(*SEARCH_LATENCY)
+        self.answer = rng.uniform(*ANSWER_LATENCY)
+
+
+class Stats:
+    def __init__(self):
+        self.generations_started = 0
+        self.generations_cancelled = 0
+
+
+async def classify(msg: Message) -> bool:
+    await asyncio.sleep(msg.intent)
+    return msg.is_places
+
+
+async def search(msg: Message, cache: set) -> None:
+    if id(msg) in cache:
+        return
+    await asyncio.sleep(msg.search)
+    cache.add(id(msg))
+
+
+async def generate(msg: Message, stats: Stats) -> str:
+    stats.generations_started += 1
+    try:
+        await asyncio.sleep(msg.answer)
+    except asyncio.CancelledError:
+        stats.generations_cancelled += 1
+        raise
+    return "answer"
+
+
+async def handle_sequential(msg: Message, stats: Stats, cache: set, guard) -> None:
+    if await classify(msg):
+        await search(msg, cache)
+    await generate(msg, stats)
+
+
+async def handle_speculative(msg: Message, stats: Stats, cache: set, guard: SpeculationGuard) -> None:
+    if not guard.try_acquire():
+        await handle_sequential(msg, stats, cache, guard)
+        return
+    try:
+        is_places, _ = await run_speculative(
+            classify(msg),
+            {True: lambda: search(msg, cache), False: lambda: generate(msg, stats)},
+        )
+    finally:
+        guard.release()
+    if is_places:
+        # Поиск уже в кэше, остаётся только ответ по найденным местам
+        await search(msg, cache)
+        await generate(msg, stats)
+
+
+async def run(handler, messages: list, guard) -> tuple:
+    stats, cache = Stats(), set()
+    latencies = []
+
+    async def one(msg: Message, delay: float):
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        await handler(msg, stats, cache, guard)
+        latencies.append(time.perf_counter() - started)
+
+    # Сообщения приходят равномерно в течение ~10 секунд
+    await asyncio.gather(*(one(msg, i * 10.0 / len(messages)) for i, msg in enumerate(messages)))
+    return latencies, stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--places-share", type=float, default=0.5)
+    parser.add_argument("--per-minute", type=float, default=0, help="лимит SpeculationGuard (0 — без лимита)")
+    parser.add_argument("--in-flight", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    messages = [Message(rng, args.places_share) for _ in range(args.messages)]
+    per_minute = args.per_minute or 10 ** 9
+    for name, handler in (("sequential", handle_sequential), ("speculative", handle_speculative)):
+        guard = SpeculationGuard(per_minute, args.in_flight)
+        latencies, stats = asyncio.run(run(handler, messages, guard))
+        print(f"{name:<12} p50={percentile(latencies, 50):.2f}s p99={percentile(latencies, 99):.2f}s "
+              f"generations={stats.generations_started} cancelled={stats.generations_cancelled}")
+
+
+if __name__ == "__main__":
+    main()
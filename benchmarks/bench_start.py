@@ -0,0 +1,94 @@
+"""
+Бенчмарк проверки нового чата в /start на большой истории.
+
+Создаёт временную базу со схемой chat_history.db и заданным числом строк истории, затем
+сравнивает прежний запрос is_new_chat (полный просмотр chat_history) с поиском в таблице chats
+после применения миграций из migrations.HISTORY_MIGRATIONS.
+
+Запуск: python benchmarks/bench_start.py [--rows 1000000] [--chats 20000] [--lookups 200]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from db import Database  # noqa: E402
+from migrations import HISTORY_MIGRATIONS  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    role TEXT,
+    message_text TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE conversation_summary (chat_id TEXT PRIMARY KEY, summary TEXT, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    message_text TEXT NOT NULL,
+    rating TEXT NOT NULL,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def populate(path: str, rows: int, chats: int) -> None:
+    rng = random.Random(1)
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA)
+        batch = []
+        for i in range(rows):
+            chat_id = str(rng.randrange(chats))
+            batch.append((chat_id, chat_id, "user", f"message number {i} about coffee and tours"))
+            if len(batch) == 50000:
+                conn.executemany("INSERT INTO chat_history (chat_id, user_id, role, message_text) VALUES (?, ?, ?, ?)", batch)
+                batch.clear()
+        if batch:
+            conn.executemany("INSERT INTO chat_history (chat_id, user_id, role, message_text) VALUES (?, ?, ?, ?)", batch)
+
+
+def time_lookups(database: Database, query: str, chat_ids: list) -> float:
+    started = time.perf_counter()
+    for chat_id in chat_ids:
+        database.fetch_one_sync(query, (chat_id,))
+    return (time.perf_counter() - started) / len(chat_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=20_000)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "chat_history.db")
+        print(f"Populating {args.rows} history rows...")
+        populate(path, args.rows, args.chats)
+        database = Database(path)
+        # Половина запросов — существующие чаты, половина — новые (худший случай для полного просмотра)
+        chat_ids = [str(i) for i in range(args.lookups // 2)] + [f"new-{i}" for i in range(args.lookups // 2)]
+
+        legacy = time_lookups(database, "SELECT chat_id FROM chat_history WHERE chat_id = ?", chat_ids)
+        print(f"before migrations: {legacy * 1e3:9.3f} ms per /start (full scan of chat_history)")
+
+        started = time.perf_counter()
+        database.migrate(HISTORY_MIGRATIONS)
+        print(f"migrations applied in {time.perf_counter() - started:.1f}s")
+
+        registry = time_lookups(database, "SELECT 1 FROM chats WHERE chat_id = ?", chat_ids)
+        print(f"after migrations:  {registry * 1e3:9.3f} ms per /start (chats primary key)")
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Офлайн-оценка кэша ответов (answers.SemanticAnswerCache) на сообщениях из chat_history.
+
+Сообщения пользователей (кроме кнопок меню) прогоняются в порядке поступления с теми же
+условиями, что и в боте: сообщение, перед которым в чате была активность (любая запись
+chat_history) меньше --quiet-seconds назад, и сообщение со ссылками на историю пропускаются
+(bypass), остальные ищутся в индексе того же языка; промах добавляет вопрос в индекс, как после
+генерации ответа. Для нескольких порогов близости выводятся доля попаданий среди всех сообщений
+и среди кэшируемых, число попаданий на точные повторы и на перефразировки и доля ложных попаданий.
+
+Уточняющие вопросы («is it open late tonight?», «e esse lugar…», «quello è aperto stasera?») в логах
+почти не встречаются, поэтому они заданы списком FOLLOW_UPS на языках бота. Каждый прогоняется
+как пришедший в «тихий» чат (худший случай: сразу после сообщения его отсекает проверка активности):
+если is_standalone его пропускает, ответ был бы построен без истории и попал бы в общий кэш —
+это утечка (столбец «fu leak»), а если в индексе нашёлся похожий вопрос — ещё и чужой ответ
+(«fu hit»). Утечки входят в долю ложных: false % = (ложные попадания + утечки) / (попадания + утечки).
+
+Ложное попадание по умолчанию определяется эвристикой: в одном из вопросов есть значимое слово
+(от 4 букв, кроме связок вроде «расскажи», «tell me about»), которому нет близкого слова в другом
+(«кофе» против «чай», «рестораны» против «рестораны в центре»). С --gpt каждое
+неточное попадание дополнительно оценивает GPT («требуют ли вопросы одного ответа?», нужен
+OPENAI_API_KEY). С --show печатаются все неточные попадания для ручной проверки.
+
+Таблица IDF (models/answer_idf.json) строится по тем же логам; --no-idf оценивает без неё.
+
+Запуск: python benchmarks/eval_answer_cache.py [--thresholds 0.7,0.75,0.8,0.85,0.9] [--quiet-seconds 1800]
+        [--no-idf] [--show] [--gpt]
+"""
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import argparse
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dotenv import load_dotenv  # noqa: E402
+
+import answers  # noqa: E402
+from language import LanguageDetector  # noqa: E402
+from clients import chat_completion, close_clients  # noqa: E402
+
+DB_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "chat_history.db")
+
+# Уточняющие вопросы, понятные только с историей чата: (язык, текст)
+FOLLOW_UPS = [
+    ("en", "is it open late tonight?"), ("en", "and how much does it cost?"),
+    ("en", "what about for vegetarians then?"), ("en", "how do I get there from the centre?"),
+    ("en", "can you give me the address of the second one?"), ("en", "which of them is cheaper?"),
+    ("en", "do they take credit cards?"), ("en", "ok and for tomorrow evening?"),
+    ("en", "is the place open on sunday?"), ("en", "how far is it from the cathedral?"),
+    ("es", "¿y cuánto cuesta?"), ("es", "¿está abierto hoy por la noche?"),
+    ("es", "¿cómo llego allí desde el centro?"), ("es", "¿y el otro restaurante?"),
+    ("pt", "e esse lugar fica aberto até tarde?"), ("pt", "quanto custa a entrada lá?"),
+    ("it", "quello è aperto stasera?"), ("it", "e quanto costa il biglietto?"),
+    ("fr", "c'est ouvert le dimanche ?"), ("fr", "et combien ça coûte ?"),
+    ("de", "ist es heute abend geöffnet?"), ("de", "und wie komme ich dorthin?"),
+    ("ru", "а сколько это стоит?"), ("ru", "он открыт вечером?"), ("ru", "как туда добраться из центра?"),
+    ("uk", "а скільки це коштує?"), ("pl", "czy to jest otwarte wieczorem?"), ("nl", "is het vanavond open?"),
+    ("tr", "orası akşam açık mı?"),
+]
+
+
+# Слова-связки, которые не меняют смысла вопроса
+FILLER_WORDS = {
+    "tell", "about", "please", "hello", "okay", "want", "would", "like", "could", "give", "info", "find", "looking",
+    "hola", "dime", "favor", "busco", "quiero", "puedes", "привет", "ладно", "расскажи", "пожалуйста", "ищу",
+    "подскажи", "можешь", "хочу", "слушай", "хорошо", "bonjour", "merci",
+}
+
+
+def significant_words(text: str) -> set:
+    return {word for word in answers.normalize_query(text).split() if len(word) >= 4 and word not in FILLER_WORDS}
+
+
+def heuristic_false_hit(a: str, b: str) -> bool:
+    """Есть значимое слово без близкого (с учётом опечаток и окончаний) слова в другом вопросе."""
+    words_a, words_b = answers.normalize_query(a).split(), answers.normalize_query(b).split()
+    for significant, others in ((significant_words(a), words_b), (significant_words(b), words_a)):
+        for word in significant:
+            if not any(SequenceMatcher(None, word, other).ratio() >= 0.75 for other in others):
+                return True
+    return False
+
+
+async def gpt_same_answer(a: str, b: str) -> bool:
+    prompt = ("Would one answer correctly serve both of these questions from a tourist in San Cristóbal de las Casas? "
+              f"Answer only 'yes' or 'no'.\n\nQuestion 1: {a}\nQuestion 2: {b}")
+    response = await chat_completion(messages=[{"role": "user", "content": prompt}], temperature=0)
+    return "yes" in response.choices[0].message.content.strip().lower()
+
+
+def load_messages(quiet_seconds: float) -> list:
+    """(текст, тихий ли чат перед ним) для сообщений пользователей, кроме кнопок меню, по порядку."""
+    from i18n import MENU_LABELS
+
+    with sqlite3.connect(DB_HISTORY) as conn:
+        rows = conn.execute(
+            "SELECT chat_id, CAST(strftime('%s', timestamp) AS REAL), role, message_text FROM chat_history ORDER BY id"
+        ).fetchall()
+    skip = {label.lower() for label in MENU_LABELS.values()}
+    last_activity = {}
+    messages = []
+    for chat_id, timestamp, role, text in rows:
+        previous = last_activity.get(chat_id)
+        last_activity[chat_id] = timestamp
+        text = (text or "").strip()
+        if role != "user" or not text or text.lower() in skip:
+            continue
+        messages.append((text, previous is None or timestamp - previous >= quiet_seconds))
+    return messages
+
+
+def simulate(messages: list, langs: list, threshold: float, idf: dict, default_idf: float) -> dict:
+    index = answers.AnswerIndex()
+    stored = {}
+    bypassed = 0
+    hits = []
+    latencies = []
+    for (text, quiet), lang in zip(messages, langs):
+        if not quiet or not answers.is_standalone(text, lang):
+            bypassed += 1
+            continue
+        query = answers.normalize_query(text)
+        started = time.perf_counter()
+        vector = answers.vectorize(query, idf, default_idf)
+        key, score = index.best(lang, vector)
+        latencies.append(time.perf_counter() - started)
+        if key is not None and score >= threshold:
+            hits.append((text, stored[key], score))
+            continue
+        key = (lang, query)
+        stored[key] = text
+        index.add(key, lang, vector)
+    # Уточняющие вопросы в «тихом» чате после всех сообщений из логов
+    follow_up_leaks, follow_up_hits = [], []
+    for lang, text in FOLLOW_UPS:
+        if not answers.is_standalone(text, lang):
+            continue
+        follow_up_leaks.append(text)
+        key, score = index.best(lang, answers.vectorize(answers.normalize_query(text), idf, default_idf))
+        if key is not None and score >= threshold:
+            follow_up_hits.append((text, stored[key], score))
+    return {"bypassed": bypassed, "hits": hits, "latencies": latencies, "entries": len(index),
+            "follow_up_leaks": follow_up_leaks, "follow_up_hits": follow_up_hits}
+
+
+async def judge_with_gpt(pairs: list, concurrency: int = 8) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def judge(pair):
+        async with semaphore:
+            return pair, await gpt_same_answer(pair[0], pair[1])
+
+    try:
+        return dict(await asyncio.gather(*(judge(pair) for pair in pairs)))
+    finally:
+        await close_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thresholds", default="0.7,0.75,0.8,0.85,0.9")
+    parser.add_argument("--quiet-seconds", type=float, default=answers.DEFAULT_QUIET_SECONDS,
+                        help="без активности в чате столько секунд вопрос может идти в кэш (0 — без проверки)")
+    parser.add_argument("--no-idf", action="store_true")
+    parser.add_argument("--show", action="store_true", help="напечатать неточные попадания")
+    parser.add_argument("--gpt", action="store_true", help="оценить неточные попадания GPT (платные запросы)")
+    args = parser.parse_args()
+
+    messages = load_messages(args.quiet_seconds)
+    detector = LanguageDetector()
+    langs = [detector.detect(text) for text, _ in messages]
+    idf, default_idf = ({}, 1.0) if args.no_idf else answers.load_idf()
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    quiet = sum(1 for _, is_quiet in messages if is_quiet)
+    print(f"{len(messages)} logged messages ({quiet} in a quiet chat, quiet period {args.quiet_seconds:.0f}s), "
+          f"{len(FOLLOW_UPS)} follow-up cases, IDF: {'off' if args.no_idf else f'{len(idf)} features'}")
+
+    results = {t: simulate(messages, langs, t, idf, default_idf) for t in thresholds}
+    gpt_verdicts = {}
+    if args.gpt:
+        load_dotenv()
+        pairs = {(a, b) for result in results.values() for a, b, _ in result["hits"]
+                 if answers.normalize_query(a) != answers.normalize_query(b)}
+        gpt_verdicts = asyncio.run(judge_with_gpt(sorted(pairs)))
+
+    cacheable = len(messages) - results[thresholds[0]]["bypassed"]
+    print(f"cacheable messages: {cacheable} ({cacheable / max(len(messages), 1):.1%})")
+    print(f"{'threshold':>9} {'hits':>6} {'of all':>7} {'of cch':>7} {'exact':>6} {'near':>5} {'false':>6} "
+          f"{'fu leak':>7} {'fu hit':>6} {'false %':>8}" + (f" {'gpt false':>9}" if args.gpt else ""))
+    for threshold, result in results.items():
+        hits = result["hits"]
+        near = [(a, b, s) for a, b, s in hits if answers.normalize_query(a) != answers.normalize_query(b)]
+        false = [(a, b, s) for a, b, s in near if heuristic_false_hit(a, b)]
+        leaks = result["follow_up_leaks"]
+        line = (f"{threshold:>9.2f} {len(hits):>6} {len(hits) / max(len(messages), 1):>7.1%} "
+                f"{len(hits) / max(cacheable, 1):>7.1%} {len(hits) - len(near):>6} {len(near):>5} {len(false):>6} "
+                f"{len(leaks):>7} {len(result['follow_up_hits']):>6} "
+                f"{(len(false) + len(leaks)) / max(len(hits) + len(leaks), 1):>8.1%}")
+        if args.gpt:
+            gpt_false = sum(1 for a, b, _ in near if not gpt_verdicts.get((a, b), True))
+            line += f" {gpt_false:>9}"
+        print(line)
+        if args.show:
+            for a, b, score in near:
+                mark = "FALSE" if heuristic_false_hit(a, b) else "ok"
+                print(f"    {score:.2f} {mark:>5}  {a!r} ~ {b!r}")
+            for text in result["follow_up_leaks"]:
+                print(f"    follow-up answered without history: {text!r}")
+    latencies = sorted(results[thresholds[0]]["latencies"])
+    if latencies:
+        print(f"lookup latency: p50={latencies[len(latencies) // 2] * 1000:.3f} ms  "
+              f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.3f} ms "
+              f"({results[thresholds[0]]['entries']} entries)")
+
+
+if __name__ == "__main__":
+    main()
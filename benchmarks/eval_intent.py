@@ -0,0 +1,123 @@
+"""
+Офлайн-оценка классификатора намерения «поиск мест».
+
+На размеченных запросах (models/places_intent_labels.jsonl) локальный классификатор проверяется
+кросс-валидацией по k частям: модель обучается без проверяемой части, поэтому точность не
+завышена запоминанием. Выводятся точность, доля сообщений, решённых локально (по уровням), и
+задержка на сообщение, а также точность каждого уровня отдельно. Правила
+лексического уровня не обучаются и не содержат фраз из разметки — только общие слова категорий
+мест, разговора о боте, перевода, маршрутов и приветствий; при добавлении правил точность уровня
+нужно проверять на новых запросах, а не подбирать правила под этот набор. С --gpt те же запросы прогоняются через прежний GPT-классификатор
+(нужен OPENAI_API_KEY) для сравнения точности и задержки.
+
+Запуск: python benchmarks/eval_intent.py [--folds 5] [--gpt] [--concurrency 8]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dotenv import load_dotenv  # noqa: E402
+
+import intent  # noqa: E402
+from clients import close_clients  # noqa: E402
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def evaluate_local(labels: list, folds: int) -> dict:
+    items = labels[:]
+    random.Random(1).shuffle(items)
+    tiers = {"lexical": 0, "model": 0, "none": 0}
+    tier_correct = {"lexical": 0, "model": 0}
+    correct_local = correct_all = 0
+    latencies = []
+    for fold in range(folds):
+        test = items[fold::folds]
+        train = [item for i, item in enumerate(items) if i % folds != fold]
+        classifier = intent.PlacesIntentClassifier(fallback=None)
+        classifier.model = intent.IntentModel.fit([i["text"] for i in train], [i["places"] for i in train])
+        for item in test:
+            started = time.perf_counter()
+            label, _, tier = classifier.classify_local(item["text"])
+            latencies.append(time.perf_counter() - started)
+            if label is None:
+                tiers["none"] += 1
+                # Для точности «без GPT» неуверенный прогноз модели округляем по 0.5
+                label = classifier.model.predict_proba(item["text"]) >= 0.5
+            else:
+                tiers[tier] += 1
+                tier_correct[tier] += label == item["places"]
+                correct_local += label == item["places"]
+            correct_all += label == item["places"]
+    resolved = tiers["lexical"] + tiers["model"]
+    return {
+        "accuracy": correct_all / len(items),
+        "accuracy_resolved": correct_local / resolved if resolved else 0.0,
+        "tiers": tiers,
+        "tier_accuracy": {t: tier_correct[t] / tiers[t] if tiers[t] else 0.0 for t in tier_correct},
+        "latencies": latencies,
+    }
+
+
+async def evaluate_gpt(labels: list, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def classify(item):
+        async with semaphore:
+            started = time.perf_counter()
+            label = await intent.llm_places_intent(item["text"])
+            latencies.append(time.perf_counter() - started)
+            return label == item["places"]
+
+    try:
+        results = await asyncio.gather(*(classify(item) for item in labels))
+    finally:
+        await close_clients()
+    return {"accuracy": sum(results) / len(results), "latencies": latencies}
+
+
+def print_latency(name: str, latencies: list) -> None:
+    print(f"{name}: p50={percentile(latencies, 50) * 1000:.3f} ms  p99={percentile(latencies, 99) * 1000:.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--gpt", action="store_true", help="сравнить с GPT-классификатором (платные запросы)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    labels = intent.load_labels()
+    if not labels:
+        sys.exit(f"No labelled queries in {intent.INTENT_LABELS_FILE}")
+    positives = sum(item["places"] for item in labels)
+    print(f"{len(labels)} labelled queries ({positives} places / {len(labels) - positives} other), {args.folds}-fold CV")
+
+    local = evaluate_local(labels, args.folds)
+    tiers = local["tiers"]
+    print(f"local accuracy (uncertain rounded at 0.5): {local['accuracy']:.3f}")
+    print(f"local accuracy on confident answers:       {local['accuracy_resolved']:.3f}")
+    print(f"resolved by lexical tier: {tiers['lexical']}, by model: {tiers['model']}, "
+          f"left to GPT: {tiers['none']} ({tiers['none'] / len(labels):.1%})")
+    accuracy = local["tier_accuracy"]
+    print(f"accuracy by tier: lexical {accuracy['lexical']:.3f}, model {accuracy['model']:.3f}")
+    print_latency("local latency per message", local["latencies"])
+
+    if args.gpt:
+        load_dotenv()
+        gpt = asyncio.run(evaluate_gpt(labels, args.concurrency))
+        print(f"GPT accuracy: {gpt['accuracy']:.3f}")
+        print_latency("GPT latency per message", gpt["latencies"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Нагрузочный тест асинхронного клиентского слоя.
+
+Имитирует N чатов, одновременно отправляющих сообщения: каждый «чат» вызывает generate_answer
+и search_places. Сетевые вызовы подменяются заглушками с фиксированной задержкой, поэтому тест
+не требует ключей API. Для сравнения запускается режим "blocking", в котором заглушка спит
+синхронно (как прежние openai/requests внутри async-обработчиков).
+
+Запуск: python benchmarks/load_test.py [--chats 50] [--latency 0.5]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bot  # noqa: E402
+
+ANSWER = "<b>Café Museo</b> 💲💲\n<b>Rating: 4.6</b>\n<i>Great coffee in the centre of San Cristóbal.</i>"
+
+
+def make_fakes(latency: float, blocking: bool):
+    def fake_response():
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=ANSWER))])
+
+    async def fake_chat_completion(messages, **kwargs):
+        if blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        return fake_response()
+
+    async def fake_http_get_json(url, params):
+        if blocking:
+            time.sleep(latency / 5)
+        else:
+            await asyncio.sleep(latency / 5)
+        return 200, {"results": []}, ""
+
+    return fake_chat_completion, fake_http_get_json
+
+
+async def one_chat(i: int, started: float) -> float:
+    # Задержка считается от общего момента «прихода» сообщений, как её видит пользователь
+    await bot.search_places(f"coffee {i}", (16.737, -92.637))
+    await bot.generate_answer(f"Where can I drink coffee? #{i}", language="en")
+    return time.perf_counter() - started
+
+
+async def run(chats: int) -> list:
+    started = time.perf_counter()
+    return await asyncio.gather(*(one_chat(i, started) for i in range(chats)))
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="имитируемая задержка LLM, сек")
+    args = parser.parse_args()
+
+    # Прогрев: первая загрузка модели определения языка не должна попасть в замеры
+    bot.language_detector.detect(ANSWER)
+
+    for mode in ("blocking", "async"):
+        fake_chat, fake_http = make_fakes(args.latency, blocking=(mode == "blocking"))
+        bot.chat_completion = fake_chat
+        bot.http_get_json = fake_http
+        for chats in sorted({1, 10, args.chats}):
+            latencies = asyncio.run(run(chats))
+            print(f"{mode:<9} chats={chats:<3} p50={percentile(latencies, 50):6.3f}s "
+                  f"p99={percentile(latencies, 99):6.3f}s")
+
+
+if __name__ == "__main__":
+    main()
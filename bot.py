@@ -1,20 +1,17 @@
 import os
 import re
 import logging
-import sqlite3
-import textwrap
 import html
+import hashlib
 import random
 import datetime
+import time
 import asyncio
 import nest_asyncio
 import pytz
-import requests
-from typing import Tuple
-from bs4 import BeautifulSoup
-from langdetect import detect
+from typing import Optional, Tuple
 from geopy.geocoders import Nominatim
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Message, Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import (
     ApplicationBuilder,
@@ -30,6 +27,29 @@ from dotenv import load_dotenv
 from deep_translator import GoogleTranslator
 from deep_translator.exceptions import TranslationNotFound
 from telegram.error import TimedOut, BadRequest 
+from clients import chat_completion, chat_completion_stream, http_get_json, run_blocking, close_clients
+from dispatcher import ChatOrderedUpdateProcessor
+from db import Database, WriteBehindQueue
+from migrations import MAIN_MIGRATIONS, HISTORY_MIGRATIONS, CACHE_MIGRATIONS
+from cache import LRUCache, TieredCache
+from i18n import (
+    UICatalogue, UI_CATALOGUE_FILE, LANGUAGES, load_catalogue, WELCOME_GREETINGS, WELCOME_BODY,
+    MENU_LABELS, MENU_LAYOUT, RESET_BUTTON, google_language_code
+)
+from intent import PlacesIntentClassifier
+from streaming import StreamingReply
+from speculation import SpeculationGuard, run_speculative
+from geocoding import GeocodingService
+from content import ContentStore
+from cards import Card, CardCache
+from markup import TELEGRAM_MAX_CAPTION_LENGTH, TELEGRAM_MAX_MESSAGE_LENGTH, chunk_html, split_caption, validate_html
+from language import LanguageDetector
+from jobs import DebouncedJobQueue
+from prompts import PromptBuilder, TokenCounter
+from answers import SemanticAnswerCache
+from flight import SingleFlight
+from prefetch import Prefetcher
+import metrics
 
 # Инициализация geopy с корректным User-Agent
 osm_geolocator = Nominatim(user_agent="SanCrisGo/1.0 (estaticmona@gmail.com)")
@@ -47,6 +67,7 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 openai.api_key = OPENAI_API_KEY
 DB_NAME = "main.db"
 DB_HISTORY = "chat_history.db"
+CACHE_DB = "cache.db"
 admin_chat_id = os.getenv("ADMIN_CHAT_ID")
 # Настройка логирования с ротацией: максимум 10 МБ на файл, 5 резервных копий
 logger = logging.getLogger(__name__)
@@ -55,7 +76,8 @@ from logging.handlers import RotatingFileHandler
 handler = RotatingFileHandler("bot.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 handler.setFormatter(formatter)
-logger.addHandler(handler)
+# Обработчик подключаем к корневому логгеру, чтобы логи вспомогательных модулей (clients и др.) тоже попадали в bot.log
+logging.getLogger().addHandler(handler)
 WHATSAPP_LINK = "https://wa.me/529984842518"  # Замените your-number на нужный номер
 
 # Константа для выбора языка (ConversationHandler)
@@ -63,8 +85,71 @@ SELECTING_LANGUAGE = 1
 
 # Константы для работы с историей
 HISTORY_UPDATE_THRESHOLD = 5  # каждые 5 новых сообщений обновлять суммаризацию
+# Суммаризация выполняется в фоне: запуск откладывается на SUMMARY_DEBOUNCE_SECONDS после последнего
+# сообщения чата (но не больше чем на SUMMARY_MAX_DELAY), одновременно — не больше SUMMARY_CONCURRENCY
+SUMMARY_DEBOUNCE_SECONDS = float(os.getenv("SUMMARY_DEBOUNCE_SECONDS", "10"))
+SUMMARY_MAX_DELAY = float(os.getenv("SUMMARY_MAX_DELAY", "60"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+# Бюджет промпта (сводка + последние сообщения + запрос) в токенах модели
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+# Кэш ответов на самостоятельные вопросы (см. answers.py): порог близости, TTL и записей на язык
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.85"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Кэш используется, только если в чате не было активности столько секунд (вопросу не к чему отсылать)
+ANSWER_CACHE_QUIET_SECONDS = float(os.getenv("ANSWER_CACHE_QUIET_SECONDS", str(30 * 60)))
+# Ответ при ошибке генерации; в кэш ответов не попадает
+ANSWER_ERROR_TEXT = "I'm sorry, I couldn't generate an answer at the moment."
 LAST_MESSAGES_COUNT = 5        # для формирования запроса берём последние 5 сообщений
 
+# Поиск мест Google Places: центр Сан-Кристобаля, радиус и кэш результатов
+DEFAULT_CITY = "San Cristóbal de las Casas, Chiapas, Mexico"
+SAN_CRISTOBAL_CENTER = (16.737, -92.637)
+PLACES_SEARCH_RADIUS = 5000
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", str(24 * 3600)))
+# Места показываются порциями; следующая порция (при нехватке — со следующей страницы Google Places)
+# готовится в фоне сразу после отправки текущей и ждёт «ещё» PLACES_PREFETCH_TTL секунд
+PLACES_BATCH_SIZE = 5
+PLACES_PREFETCH_TTL = float(os.getenv("PLACES_PREFETCH_TTL", "600"))
+# next_page_token начинает действовать через пару секунд после выдачи, до этого Google отвечает INVALID_REQUEST
+PLACES_PAGE_TOKEN_DELAY = 2.0
+PLACES_PAGE_TOKEN_ATTEMPTS = 3
+PLACES_DISCLAIMER = "\n\nDisclaimer: The above information is sourced from Google Places API and may not be verified."
+PLACE_DETAILS_CACHE_VERSION = 1
+PLACE_DETAILS_CACHE_TTL = int(os.getenv("PLACE_DETAILS_CACHE_TTL", str(7 * 24 * 3600)))
+PLACE_DETAILS_MAX_STALE = 30 * 24 * 3600  # сколько ещё отдавать устаревшее описание, пока оно обновляется
+TRANSLATION_CACHE_TTL = 180 * 24 * 3600
+TRANSLATION_CACHE_MAX_ENTRIES = 50000
+GEOCODE_CACHE_TTL = 30 * 24 * 3600
+# Как часто проверять, изменилась ли main.db (PRAGMA data_version, mtime файла)
+CONTENT_POLL_INTERVAL = float(os.getenv("CONTENT_POLL_INTERVAL", "5"))
+# Языки, для которых карточки туров/жилья/мест строятся заранее после каждой загрузки контента.
+# Для en/es это только форматирование; остальные языки требуют перевода через GPT и строятся при первом нажатии
+CARD_PRERENDER_LANGUAGES = [code.strip() for code in os.getenv("CARD_PRERENDER_LANGUAGES", "en,es").split(",") if code.strip()]
+# Прогноз OpenWeather обновляется 3-часовыми слотами; город по умолчанию обновляется в фоне за FORECAST_PREFETCH_LEAD до границы
+FORECAST_SLOT_SECONDS = 3 * 3600
+FORECAST_PREFETCH_LEAD = 120
+DEFAULT_FORECAST_CITY = DEFAULT_CITY
+# Популярные запросы, которыми прогревается кэш при старте (можно переопределить через PLACES_WARM_KEYWORDS)
+POPULAR_PLACES_KEYWORDS = [
+    kw.strip() for kw in os.getenv(
+        "PLACES_WARM_KEYWORDS",
+        "coffee,tacos,mezcal bar,restaurant,bar,bakery,vegetarian restaurant,pizza,museum,market"
+    ).split(",") if kw.strip()
+]
+
+# Сколько апдейтов разных чатов обрабатывается одновременно (апдейты одного чата — всегда по очереди)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
+# Потоковая выдача ответов: сообщение редактируется по мере генерации, не чаще раза в STREAM_EDIT_INTERVAL секунд
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "1") != "0"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Спекулятивный запуск поиска мест и обычного ответа параллельно с GPT-классификатором намерения:
+# не больше SPECULATION_MAX_PER_MINUTE запусков в минуту и SPECULATION_MAX_IN_FLIGHT одновременно (0 — выключено)
+SPECULATION_MAX_PER_MINUTE = float(os.getenv("SPECULATION_MAX_PER_MINUTE", "30"))
+SPECULATION_MAX_IN_FLIGHT = int(os.getenv("SPECULATION_MAX_IN_FLIGHT", "8"))
+
 # Значения по умолчанию для баннеров
 DEFAULT_BANNERS = {
     "tours": "https://example.com/default_tours_banner.jpg",
@@ -74,6 +159,51 @@ DEFAULT_BANNERS = {
     "events": "https://example.com/default_events_banner.jpg"
 }
 
+# ==================== Базы данных, кэши и фоновые задачи ====================
+# Долгоживущие соединения к базам (один писатель + пул читателей, WAL)
+main_db = Database(DB_NAME)
+history_db = Database(DB_HISTORY)
+# Сообщения и отзывы пишутся в chat_history.db пакетами в фоне, не задерживая ответ пользователю
+history_writer = WriteBehindQueue(history_db, "history_writes", max_batch=100, flush_interval=0.5)
+cache_db = Database(CACHE_DB)
+places_cache = TieredCache("places_cache", cache_db, ttl=PLACES_CACHE_TTL, maxsize=512)
+# Описания мест по (place_id, lang); версию увеличиваем при изменении промпта или формата описания
+place_details_cache = TieredCache(
+    "place_details_cache", cache_db, ttl=PLACE_DETAILS_CACHE_TTL, maxsize=1024,
+    version=PLACE_DETAILS_CACHE_VERSION, max_stale=PLACE_DETAILS_MAX_STALE
+)
+# Переводы полей main.db через GPT, общие для всех чатов
+translation_cache = TieredCache("translation_cache", cache_db, ttl=TRANSLATION_CACHE_TTL, maxsize=4096)
+# Исходные ответы OpenWeather по городу (TTL выставляется до границы слота) и готовые таблицы по (город, язык, слот)
+forecast_cache = TieredCache("forecast_cache", cache_db, ttl=FORECAST_SLOT_SECONDS, maxsize=64)
+forecast_render_memo = LRUCache(256)
+# Геокодирование Nominatim: кэш по (запрос, область) и очередь не чаще 1 запроса в секунду
+geocode_cache = TieredCache("geocode_cache", cache_db, ttl=GEOCODE_CACHE_TTL, maxsize=512)
+geocoder = GeocodingService(osm_geolocator, geocode_cache)
+# Ответы на повторяющиеся вопросы, не зависящие от истории чата, общие для всех чатов
+answer_cache = SemanticAnswerCache(cache_db, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                                   max_entries=ANSWER_CACHE_MAX_ENTRIES, quiet_seconds=ANSWER_CACHE_QUIET_SECONDS)
+# Снимок таблиц контента и баннеров main.db в памяти; обновляется при изменении базы
+content_store = ContentStore(DB_NAME, poll_interval=CONTENT_POLL_INTERVAL)
+# Переводы статических строк интерфейса (каталог locales/ui_catalogue.json)
+ui_catalogue = UICatalogue(UI_CATALOGUE_FILE, translator=lambda text, lang: translate_if_needed(text, lang))
+# Классификатор намерения «поиск мест» (модель models/places_intent.json, см. intent.py)
+places_intent = PlacesIntentClassifier()
+language_detector = LanguageDetector()
+speculation_guard = SpeculationGuard(SPECULATION_MAX_PER_MINUTE, SPECULATION_MAX_IN_FLIGHT)
+# Следующая порция мест по чатам; запуски ограничены тем же speculation_guard
+places_prefetch = Prefetcher("places_prefetch", ttl=PLACES_PREFETCH_TTL, guard=speculation_guard)
+# Ключи place_details_cache, обновляемые в фоне прямо сейчас
+place_details_refreshing = set()
+# Одновременные одинаковые обращения к Google Places, OpenWeather, переводчикам и LLM выполняются один раз
+places_flight = SingleFlight("places_search")
+place_details_flight = SingleFlight("place_details")
+forecast_flight = SingleFlight("forecast")
+translation_flight = SingleFlight("translation")
+llm_flight = SingleFlight("llm")
+# Ссылки на фоновые задачи (см. run_in_background)
+background_tasks = set()
+
 # ==================== Функция автоматического определения языка ====================
 def language_code_to_target(lang_code: str) -> str:
     lang_code = lang_code.lower()
@@ -82,75 +212,175 @@ def language_code_to_target(lang_code: str) -> str:
     return lang_code[:2] if lang_code else "en"
 
 # ==================== Работа с базой данных ====================
-def get_info_from_db(query: str, params=()):
-    try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            result = cursor.fetchall()
-        return result
-    except Exception as e:
-        logger.error(f"Database error: {e}")
-        return []
-    
 def detect_more_intent(query: str) -> bool:
     more_keywords = {"давай еще", "more", "ещё", "дальше", "next", "siguiente"}
     return any(keyword in query.lower() for keyword in more_keywords)    
 
-def detect_places_intent(query: str) -> bool:
-    prompt = (
-        f"Определи, относится ли следующий запрос к поиску мест (например, ресторанов, кафе, отелей и т.д.):\n\n"
-        f"Запрос: {query}\n\n"
-        "Ответь 'True', если да, и 'False', если нет."
-    )
+async def detect_places_intent(text: str, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                               language: str) -> Tuple[bool, Optional[str]]:
+    """
+    Определяет, ищет ли пользователь места. Если локального классификатора мало и нужен GPT,
+    одновременно с ним запускаются поиск мест и генерация обычного ответа (в пределах
+    speculation_guard); ветка, которую классификатор не выбрал, отменяется.
+    Возвращает (поиск мест?, готовый обычный ответ или None).
+    """
+    is_places = places_intent.resolve_local(text)
+    if is_places is not None:
+        return is_places, None
+    if not speculation_guard.try_acquire():
+        metrics.inc("speculation.skipped")
+        return await places_intent.classify_fallback(text), None
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": prompt}],
-            temperature=0.1,
+        is_places, result = await run_speculative(
+            places_intent.classify_fallback(text),
+            {
+                True: lambda: search_places(query=text, location=SAN_CRISTOBAL_CENTER, radius=PLACES_SEARCH_RADIUS),
+                False: lambda: generate_general_answer(text, update, context, language),
+            }
         )
-        answer = response.choices[0].message.content.strip().lower()
-        return "true" in answer
-    except Exception as e:
-        logger.error(f"Error in intent detection: {e}")
-        return False
+    finally:
+        speculation_guard.release()
+    return is_places, None if is_places else result
+
+async def mark_chat_activity(chat_id: str, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Запоминает время текущего и предыдущего действия в чате (нужно answer_cache.cacheable)."""
+    last = context.chat_data.get("last_activity_at")
+    if last is None:
+        # Новый чат или перезапуск бота: время последнего сообщения берём из истории
+        row = await history_db.fetch_one(
+            "SELECT CAST(strftime('%s', MAX(timestamp)) AS REAL) FROM chat_history WHERE chat_id = ?", (chat_id,)
+        )
+        last = row[0] if row else None
+    context.chat_data["previous_activity_at"] = last
+    context.chat_data["last_activity_at"] = time.time()
 
+def answer_cache_allowed(text: str, context: ContextTypes.DEFAULT_TYPE, target_lang: str) -> bool:
+    # Без истории отвечаем только на заведомо самостоятельные вопросы в «тихом» чате; остальные — с историей, мимо кэша
+    return answer_cache.cacheable(text, target_lang, context.chat_data.get("previous_activity_at"))
 
-def search_places(query: str, location: tuple, radius: int = 5000) -> dict:
+async def generate_general_answer(text: str, update: Update, context: ContextTypes.DEFAULT_TYPE, language: str) -> str:
+    target_lang = language_code_to_target(language)
+    if not answer_cache_allowed(text, context, target_lang):
+        prompt = await build_prompt_with_history(text, update, context)
+        return await generate_answer(prompt, language=language)
+    cached = await answer_cache.lookup(text, target_lang)
+    if cached is not None:
+        return cached
+    answer = await generate_answer(build_standalone_prompt(text), language=language)
+    if answer != ANSWER_ERROR_TEXT:
+        await answer_cache.store(text, target_lang, answer)
+    return answer
+
+
+def normalize_places_keyword(query: str) -> str:
+    # Регистр, пунктуация и лишние пробелы не влияют на результат поиска — убираем их из ключа кэша
+    keyword = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(keyword.split())
+
+def places_cache_key(keyword: str, location: tuple, radius: int) -> str:
+    return f"{keyword}|{location[0]:.4f},{location[1]:.4f}|{radius}"
+
+async def search_places(query: str, location: tuple, radius: int = 5000) -> dict:
+    keyword = normalize_places_keyword(query) or query
+    cache_key = places_cache_key(keyword, location, radius)
+    cached = await places_cache.get(cache_key)
+    if cached is not None:
+        # next_page_token живёт несколько минут: у записей, сохранённых вместе с ним, токен не используем
+        if "next_page_token" in cached:
+            cached = {k: v for k, v in cached.items() if k != "next_page_token"}
+        return cached
+    return await places_flight.run(cache_key, lambda: fetch_places(keyword, location, radius, cache_key))
+
+async def fetch_places(keyword: str, location: tuple, radius: int, cache_key: str) -> dict:
     url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
     params = {
         "location": f"{location[0]},{location[1]}",
         "radius": radius,
-        "keyword": query,
+        "keyword": keyword,
         "key": GOOGLE_API_KEY
     }
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()
+    try:
+        status_code, data, _ = await http_get_json(url, params)
+    except Exception as e:
+        logger.error(f"Google Places request error: {e}")
+        return {"error": f"Request failed: {e}"}
+    if status_code == 200:
+        # Кэшируем только корректные ответы; ошибки квоты/ключа (OVER_QUERY_LIMIT, REQUEST_DENIED) не сохраняем
+        # next_page_token истекает через несколько минут, поэтому в кэш он не попадает: для закэшированной
+        # первой страницы листание ограничено ею, а не тремя платными запросами к истёкшему токену
+        if data.get("status") in ("OK", "ZERO_RESULTS"):
+            await places_cache.set(cache_key, {k: v for k, v in data.items() if k != "next_page_token"})
+        return data
     else:
-        return {"error": f"Request failed with status code {response.status_code}"}
-    
-def validate_html(text: str) -> str:
-    soup = BeautifulSoup(text, "html.parser")
-
-    # 1) Заменяем <br> на \n
-    for br in soup.find_all("br"):
-        br.replace_with("\n")
+        return {"error": f"Request failed with status code {status_code}"}
 
-    allowed_tags = ["b", "i", "a"]
-    for tag in soup.find_all(True):
-        if tag.name not in allowed_tags:
-            tag.unwrap()
-        elif tag.name == "a":
-            if not tag.has_attr("href"):
-                tag.unwrap()
+async def fetch_places_page(page_token: str) -> dict:
+    """Следующая страница результатов Nearby Search по next_page_token предыдущей."""
+    return await places_flight.run(("page", page_token), lambda: request_places_page(page_token))
 
-    cleaned_html = str(soup)
-
-    # Не удаляем \n
-    # Не делаем .replace("<br>", "") и т.п.
+async def request_places_page(page_token: str) -> dict:
+    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+    params = {"pagetoken": page_token, "key": GOOGLE_API_KEY}
+    for attempt in range(PLACES_PAGE_TOKEN_ATTEMPTS):
+        if attempt:
+            await asyncio.sleep(PLACES_PAGE_TOKEN_DELAY)
+        try:
+            status_code, data, _ = await http_get_json(url, params)
+        except Exception as e:
+            logger.error(f"Google Places page request error: {e}")
+            return {"error": f"Request failed: {e}"}
+        if status_code != 200:
+            return {"error": f"Request failed with status code {status_code}"}
+        if data.get("status") != "INVALID_REQUEST":
+            return data
+    # Токен так и не стал действительным или уже истёк (например, первая страница взята из кэша)
+    return {"error": "Page token is not valid"}
+
+async def prepare_places_batch(query: str, results: list, page_token: Optional[str], start: int, lang: str) -> dict:
+    """
+    Готовит порцию мест с номера start: если загруженных результатов не хватает, запрашивает следующую
+    страницу Google Places, затем генерирует описание порции. Возвращает {"results", "next_page_token",
+    "end", "answer"}; answer — None, если мест больше нет.
+    """
+    if page_token and start + PLACES_BATCH_SIZE > len(results):
+        page = await fetch_places_page(page_token)
+        if "error" in page:
+            logger.warning(f"Next places page unavailable: {page['error']}")
+        else:
+            results = results + page.get("results", [])
+        page_token = page.get("next_page_token")
+    end = min(start + PLACES_BATCH_SIZE, len(results))
+    answer = None
+    if start < end:
+        prompt = build_places_prompt(query, {"results": results[start:end]}, lang) + PLACES_DISCLAIMER
+        answer = await generate_answer(prompt, language=lang)
+    return {"results": results, "next_page_token": page_token, "end": end, "answer": answer}
+
+def prefetch_next_places_batch(chat_id: str, context: ContextTypes.DEFAULT_TYPE, lang: str) -> None:
+    """Запускает подготовку следующей порции мест, пока пользователь читает текущую."""
+    start = context.chat_data["places_shown"]
+    results = context.chat_data["places_results"]
+    page_token = context.chat_data.get("places_next_page_token")
+    if start >= len(results) and not page_token:
+        return
+    query = context.chat_data["last_places_query"]
+    places_prefetch.schedule(chat_id, (query, start, language_code_to_target(lang)),
+                             lambda: prepare_places_batch(query, results, page_token, start, lang))
 
-    return cleaned_html
+async def warm_places_cache(keywords: list = None) -> None:
+    """
+    Прогревает кэш Google Places популярными запросами для центра города.
+    Запросы, уже лежащие в кэше, повторно не выполняются.
+    """
+    warmed = 0
+    for keyword in keywords if keywords is not None else POPULAR_PLACES_KEYWORDS:
+        key = places_cache_key(normalize_places_keyword(keyword), SAN_CRISTOBAL_CENTER, PLACES_SEARCH_RADIUS)
+        if await places_cache.contains(key):
+            continue
+        result = await search_places(keyword, SAN_CRISTOBAL_CENTER, PLACES_SEARCH_RADIUS)
+        if "error" not in result:
+            warmed += 1
+    logger.info(f"Places cache warmed: {warmed} new keywords")
 
 
 def format_places_for_prompt(places: dict) -> str:
@@ -223,12 +453,11 @@ async def handle_places_query(update: Update, context: ContextTypes.DEFAULT_TYPE
     text = update.message.text.strip()
     lang = context.user_data.get("lang", "en")
     
-    center_coordinates = (16.737, -92.637)
-    places_data = search_places(query=text, location=center_coordinates, radius=5000)
+    places_data = await search_places(query=text, location=SAN_CRISTOBAL_CENTER, radius=PLACES_SEARCH_RADIUS)
     
     if "error" in places_data:
         error_msg = "Error requesting Google Places API."
-        bot_message = await send_long_message(update, translate_if_needed(error_msg, lang), ParseMode.HTML, get_persistent_menu(lang))
+        bot_message = await send_long_message(update.message, await translate_ui(error_msg, lang), ParseMode.HTML, get_persistent_menu(lang))
         if bot_message:
             context.chat_data["last_bot_message"] = {"id": bot_message.message_id, "text": error_msg}
             await add_feedback_buttons(bot_message, context, lang)
@@ -236,24 +465,26 @@ async def handle_places_query(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     results = places_data.get("results", [])
     if not results:
-        fallback_answer = generate_answer(text, language=lang)
+        fallback_answer = await generate_answer(text, language=lang)
         fallback_answer += "\n\nDisclaimer: The information provided is not verified."
-        bot_message = await send_long_message(update, validate_html(fallback_answer), ParseMode.HTML, get_persistent_menu(lang))
+        bot_message = await send_long_message(update.message, validate_html(fallback_answer), ParseMode.HTML, get_persistent_menu(lang))
         if bot_message:
             context.chat_data["last_bot_message"] = {"id": bot_message.message_id, "text": fallback_answer}
             await add_feedback_buttons(bot_message, context, lang)
         return
 
+    # Новый запрос показывается с начала списка
     context.chat_data["places_results"] = results
-    context.chat_data["places_shown"] = context.chat_data.get("places_shown", 0)
+    context.chat_data["places_next_page_token"] = places_data.get("next_page_token")
+    context.chat_data["places_shown"] = 0
     context.chat_data["last_places_query"] = text
 
-    start_idx = context.chat_data["places_shown"]
-    end_idx = min(start_idx + 5, len(results))
+    start_idx = 0
+    end_idx = min(start_idx + PLACES_BATCH_SIZE, len(results))
     current_results = results[start_idx:end_idx]
     
     prompt = build_places_prompt(text, {"results": current_results}, lang)
-    answer = generate_answer(prompt, language=lang)
+    answer = await generate_answer(prompt, language=lang)
     
     # Создаём клавиатуру с названиями мест
     keyboard = []
@@ -265,50 +496,14 @@ async def handle_places_query(update: Update, context: ContextTypes.DEFAULT_TYPE
         keyboard.append([InlineKeyboardButton(f"{name} {price_icon}", callback_data=f"place:{place_id}")])
     
     instruction = "Click on the place name below to learn more details:"
-    translated_instruction = validate_html(translate_if_needed(instruction, lang))  # Валидируем инструкцию
-    full_answer = f"{answer}\n\n{translated_instruction}"
+    translated_instruction = await translate_ui(instruction, lang)
+    full_answer = validate_html(f"{answer}\n\n{translated_instruction}")
     
     # Логируем полный ответ для отладки
     logger.debug(f"Full answer before chunking: {full_answer}")
     
-    # Разбиваем текст на чанки, сохраняя целостность записей
-    max_length = 4096
-    chunks = []
-    current_chunk = ""
-    
-    # Разбиваем по записям о местах (каждая запись заканчивается двойным переносом строки)
-    entries = full_answer.split('\n\n')
-    for entry in entries:
-        if not entry.strip():
-            continue
-        
-        # Очищаем и добавляем закрывающие теги для каждой записи
-        cleaned_entry = validate_html(entry)
-        # Разбиваем cleaned_entry на подчанки, если он превышает max_length
-        while cleaned_entry:
-            if len(current_chunk) + len(cleaned_entry) + 2 <= max_length:
-                current_chunk += cleaned_entry + '\n\n'
-                cleaned_entry = ""
-            else:
-                # Находим точку разрыва, сохраняя целостность тегов
-                chunk_end = max_length - len(current_chunk) - 2
-                if chunk_end < 0:
-                    chunk_end = 0
-                # Ищем ближайший полный тег до chunk_end
-                tag_pos = cleaned_entry.rfind('>', 0, chunk_end)
-                if tag_pos == -1 or tag_pos >= chunk_end:
-                    tag_pos = cleaned_entry.rfind('<', 0, chunk_end)
-                if tag_pos == -1:
-                    tag_pos = chunk_end
-                
-                current_chunk += validate_html(cleaned_entry[:tag_pos + 1]) + '\n'
-                cleaned_entry = validate_html(cleaned_entry[tag_pos + 1:] + '</b></i></a>')
-                if current_chunk:
-                    chunks.append(validate_html(current_chunk.strip()))
-                current_chunk = ""
-    
-    if current_chunk:
-        chunks.append(validate_html(current_chunk.strip()))
+    # Ответ очищен один раз; chunk_html режет его по записям (пустой строке) и переносит открытые теги
+    chunks = chunk_html(full_answer, TELEGRAM_MAX_MESSAGE_LENGTH)
     
     bot_message = None
     sent_chunks = 0
@@ -319,28 +514,22 @@ async def handle_places_query(update: Update, context: ContextTypes.DEFAULT_TYPE
             sent_chunks += 1
         except BadRequest as e:
             logger.error(f"Failed to send message chunk: {e}, Chunk text: {chunk}")
-            # Исправляем чанк, добавляя недостающие теги
-            fixed_chunk = validate_html(chunk)
-            try:
-                bot_message = await update.message.reply_text(fixed_chunk, parse_mode=ParseMode.HTML)
-                sent_chunks += 1
-            except BadRequest as e:
-                logger.error(f"Failed to send fixed chunk: {e}, Fixed chunk text: {fixed_chunk}")
-                fallback_text = translate_if_needed("Sorry, there was an issue displaying part of the results.", lang)
-                bot_message = await update.message.reply_text(fallback_text, parse_mode=ParseMode.HTML)
-                if sent_chunks == 0:  # Если ни один чанк не отправлен, добавляем клавиатуру
-                    await add_feedback_buttons(bot_message, context, lang, existing_keyboard=keyboard)
+            fallback_text = await translate_ui("Sorry, there was an issue displaying part of the results.", lang)
+            bot_message = await update.message.reply_text(fallback_text, parse_mode=ParseMode.HTML)
+            if sent_chunks == 0:  # Если ни один чанк не отправлен, добавляем клавиатуру
+                await add_feedback_buttons(bot_message, context, lang, existing_keyboard=keyboard)
     
     if bot_message and sent_chunks > 0:
         context.chat_data["last_bot_message"] = {"id": bot_message.message_id, "text": full_answer}
         await add_feedback_buttons(bot_message, context, lang, existing_keyboard=keyboard)
     
     context.chat_data["places_shown"] = end_idx
+    prefetch_next_places_batch(str(update.effective_chat.id), context, lang)
 
 # Новая функция для добавления кнопок обратной связи
 async def add_feedback_buttons(bot_message, context: ContextTypes.DEFAULT_TYPE, lang: str, existing_keyboard=None):
-    good_text = translate_if_needed("Good 👍", lang)
-    bad_text = translate_if_needed("Bad 👎", lang)
+    good_text = await translate_ui("Good 👍", lang)
+    bad_text = await translate_ui("Bad 👎", lang)
     
     # Создаём кнопки для отзывов
     feedback_row = [
@@ -358,7 +547,51 @@ async def add_feedback_buttons(bot_message, context: ContextTypes.DEFAULT_TYPE,
     await bot_message.edit_reply_markup(reply_markup=feedback_markup)
 
 
+def place_details_cache_key(place_id: str, lang: str) -> str:
+    return f"{place_id}|{lang}"
+
+def place_photo_url(photo_reference: str) -> str:
+    # Ключ API подставляется при выдаче, чтобы не хранить его в кэше
+    if not photo_reference:
+        return None
+    return f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=400&photoreference={photo_reference}&key={GOOGLE_API_KEY}"
+
 async def get_detailed_place_info(place_id: str, lang: str, context: ContextTypes.DEFAULT_TYPE) -> Tuple[str, str]:
+    """
+    Возвращает (описание, URL фото) места. Описание берётся из кэша по (place_id, lang);
+    устаревшая запись отдаётся сразу и обновляется в фоне (stale-while-revalidate).
+    """
+    cache_key = place_details_cache_key(place_id, lang)
+    entry = await place_details_cache.get_entry(cache_key, allow_stale=True)
+    if entry is not None:
+        if entry.expires_at <= time.time() and cache_key not in place_details_refreshing:
+            place_details_refreshing.add(cache_key)
+            task = run_in_background(refresh_place_details(place_id, lang), f"refresh-place-{cache_key}")
+            task.add_done_callback(lambda _: place_details_refreshing.discard(cache_key))
+        details = entry.value
+    else:
+        details = await refresh_place_details(place_id, lang)
+    if details is None:
+        return await translate_ui("Unable to retrieve detailed information.", lang), None
+    return details["description"], place_photo_url(details["photo_reference"])
+
+async def refresh_place_details(place_id: str, lang: str) -> dict:
+    # Фоновое обновление и запросы пользователей, нажавших ту же кнопку, ждут один ответ
+    cache_key = place_details_cache_key(place_id, lang)
+    return await place_details_flight.run(cache_key, lambda: fetch_and_cache_place_details(place_id, lang))
+
+async def fetch_and_cache_place_details(place_id: str, lang: str) -> dict:
+    details = await fetch_place_details(place_id, lang)
+    # Описание с заглушкой вместо ответа GPT не кэшируем, чтобы следующий запрос попробовал снова
+    if details is not None and details["complete"]:
+        await place_details_cache.set(place_details_cache_key(place_id, lang), details)
+    return details
+
+async def fetch_place_details(place_id: str, lang: str) -> dict:
+    """
+    Запрашивает Place Details и генерирует описание места через GPT.
+    Возвращает {"description", "photo_reference", "complete"} или None при ошибке Google Places API.
+    """
     url = "https://maps.googleapis.com/maps/api/place/details/json"
     params = {
         "place_id": place_id,
@@ -367,12 +600,12 @@ async def get_detailed_place_info(place_id: str, lang: str, context: ContextType
         "language": lang
     }
     try:
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            logger.error(f"Google Places API error: {response.status_code} - {response.text}")
-            return translate_if_needed("Unable to retrieve detailed information.", lang), None
+        status_code, data, response_text = await http_get_json(url, params)
+        if status_code != 200:
+            logger.error(f"Google Places API error: {status_code} - {response_text}")
+            return None
         
-        place_data = response.json().get("result", {})
+        place_data = data.get("result", {})
         name = place_data.get("name", "No name")
         address = place_data.get("formatted_address", "No address")
         types = ", ".join(place_data.get("types", []))
@@ -390,11 +623,9 @@ async def get_detailed_place_info(place_id: str, lang: str, context: ContextType
         phone_link = f"<a href='https://wa.me/{phone_digits}'>{phone}</a>" if phone_digits else phone
         
         # Получаем фото
-        photo_url = None
+        photo_reference = None
         if "photos" in place_data and place_data["photos"]:
             photo_reference = place_data["photos"][0].get("photo_reference")
-            if photo_reference:
-                photo_url = f"https://maps.googleapis.com/maps/api/place/photo?maxwidth=400&photoreference={photo_reference}&key={GOOGLE_API_KEY}"
         
         # Формируем до 4 отзывов
         review_summary = ""
@@ -415,8 +646,7 @@ async def get_detailed_place_info(place_id: str, lang: str, context: ContextType
             "Explain why this place might be worth visiting based on the provided information, keeping the tone friendly and engaging."
         )
         try:
-            response = openai.chat.completions.create(
-                model="gpt-4o-mini",
+            response = await chat_completion(
                 temperature=0.1,
                 messages=[
                     {"role": "system", "content": "You are a knowledgeable concierge. Provide accurate, engaging, and well-structured descriptions based on the given data."},
@@ -424,9 +654,11 @@ async def get_detailed_place_info(place_id: str, lang: str, context: ContextType
                 ]
             )
             description = response.choices[0].message.content.strip()
+            complete = True
         except Exception as e:
             logger.error(f"GPT error: {e}")
-            description = translate_if_needed("Detailed description unavailable due to an error.", lang)
+            description = await translate_ui("Detailed description unavailable due to an error.", lang)
+            complete = False
         
         opening_hours = place_data.get("opening_hours", {}).get("weekday_text", "No hours available")
         if isinstance(opening_hours, list):
@@ -450,11 +682,11 @@ async def get_detailed_place_info(place_id: str, lang: str, context: ContextType
             formatted += f"\n\n💬 <b>Guest Reviews:</b>\n<i>{review_summary}</i>"
     
         logger.debug(f"Formatted description for place_id {place_id}: length={len(formatted)}, content={formatted[:500]}...")  # Логируем первые 500 символов
-        return formatted, photo_url
+        return {"description": formatted, "photo_reference": photo_reference, "complete": complete}
     
     except Exception as e:
         logger.error(f"Error retrieving place details: {e}")
-        return translate_if_needed("Unable to retrieve detailed information.", lang), None
+        return None
         
 def weather_emoji(description: str) -> str:
     """Возвращает эмодзи для описания погоды."""
@@ -469,105 +701,158 @@ def weather_emoji(description: str) -> str:
         return "❄️"
     else:
         return ""
-def is_new_chat(chat_id: str) -> bool:
+async def is_new_chat(chat_id: str) -> bool:
     """
     Проверяет, зарегистрирован ли chat_id в таблице chats в базе chat_history.db.
     Если чат новый, возвращает True, иначе False.
     """
     try:
-        with sqlite3.connect(DB_HISTORY) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT chat_id FROM chat_history WHERE chat_id = ?", (chat_id,))
-            result = cursor.fetchone()
-            return result is None
+        result = await history_db.fetch_one("SELECT 1 FROM chats WHERE chat_id = ?", (chat_id,))
+        return result is None
     except Exception as e:
         logger.error(f"Error checking new chat: {e}")
         return False
 
-def register_chat(chat_id: str):
+async def register_chat(chat_id: str):
     """
     Регистрирует новый chat_id, добавляя его в таблицу chats в базе chat_history.db.
     """
     try:
-        with sqlite3.connect(DB_HISTORY) as conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO chat_history (chat_id) VALUES (?)", (chat_id,))
-            conn.commit()
+        await history_db.execute("INSERT OR IGNORE INTO chats (chat_id) VALUES (?)", (chat_id,))
     except Exception as e:
         logger.error(f"Error registering chat: {e}")
 
-def get_24h_forecast(city: str, lang: str = "en") -> str:
+def forecast_slot_end(timestamp: float) -> float:
+    """Ближайшая граница 3-часового слота OpenWeather (слоты выровнены по UTC) после timestamp."""
+    return (timestamp // FORECAST_SLOT_SECONDS + 1) * FORECAST_SLOT_SECONDS
+
+def forecast_cache_key(city: str) -> str:
+    return " ".join(city.lower().split())
+
+async def fetch_forecast(city: str) -> dict:
     """
-    Получает прогноз погоды на ближайшие 24 часа (с интервалом 3 часа) для указанного города
-    через API OpenWeatherMap и возвращает отформатированный текст в виде таблицы.
-    Прогноз выводится по местному времени (например, America/Mexico_City) и включает температуру, описание,
-    влажность, скорость ветра и вероятность осадков с эмодзи.
+    Запрашивает прогноз OpenWeather и кладёт исходный ответ в кэш до конца текущего слота
+    (или следующего, если до границы меньше FORECAST_PREFETCH_LEAD). Описания запрашиваются
+    на английском и переводятся при выводе, поэтому один ответ API обслуживает все языки.
     """
+    return await forecast_flight.run(forecast_cache_key(city), lambda: request_forecast(city))
+
+async def request_forecast(city: str) -> dict:
     API_KEY = os.getenv("OPENWEATHER_API_KEY")
     base_url = "https://api.openweathermap.org/data/2.5/forecast"
     params = {
         "q": city,
         "appid": API_KEY,
-        "units": "metric",
-        "lang": lang
+        "units": "metric"
     }
+    _, data, _ = await http_get_json(base_url, params)
+    if str(data.get("cod")) == "200":
+        now = time.time()
+        await forecast_cache.set(forecast_cache_key(city), data, ttl=forecast_slot_end(now + FORECAST_PREFETCH_LEAD) - now)
+    return data
+
+async def forecast_prefetch_loop(city: str = DEFAULT_FORECAST_CITY) -> None:
+    """Фоновое обновление прогноза для города по умолчанию перед каждой границей слота."""
+    first_run = True
+    while True:
+        delay = None
+        try:
+            if not first_run or not await forecast_cache.contains(forecast_cache_key(city)):
+                data = await fetch_forecast(city)
+                if str(data.get("cod")) != "200":
+                    logger.warning(f"Forecast prefetch failed: {data.get('message')}")
+                    delay = 60
+        except Exception as e:
+            logger.error(f"Forecast prefetch error: {e}")
+            delay = 60
+        first_run = False
+        if delay is None:
+            now = time.time()
+            delay = max(1.0, forecast_slot_end(now + FORECAST_PREFETCH_LEAD) - FORECAST_PREFETCH_LEAD - now)
+        await asyncio.sleep(delay)
+
+async def get_24h_forecast(city: str, lang: str = "en") -> str:
+    """
+    Прогноз погоды на ближайшие 24 часа (с интервалом 3 часа) для указанного города в виде таблицы.
+    Данные берутся из forecast_cache (OpenWeatherMap запрашивается только при промахе); готовая
+    таблица запоминается по (город, язык, слот), так что повторные запросы — только форматирование.
+    Прогноз выводится по местному времени (например, America/Mexico_City) и включает температуру, описание,
+    влажность, скорость ветра и вероятность осадков с эмодзи.
+    """
     try:
-        response = requests.get(base_url, params=params)
-        data = response.json()
-        if data.get("cod") != "200":
-            return f"Error: {data.get('message', 'Unable to get forecast data')}"
-        
-        # Определяем локальную таймзону для Сан-Кристобаля (например, для Мехико)
-        local_tz = pytz.timezone("America/Mexico_City")
-        now_local = datetime.datetime.now(local_tz)
-        
-        forecast_items = []
-        for item in data["list"]:
-            dt_item = datetime.datetime.fromtimestamp(item["dt"], pytz.utc).astimezone(local_tz)
-            if now_local < dt_item <= now_local + datetime.timedelta(hours=24):
-                forecast_items.append(item)
-        
-        if not forecast_items:
-            return "No forecast data available for the next 24 hours."
-        
-        # Используем дату первого элемента для заголовка
-        first_dt = datetime.datetime.fromtimestamp(forecast_items[0]["dt"], pytz.utc).astimezone(local_tz)
-        header_date = first_dt.strftime("%Y-%m-%d")
-        
-        # Формируем заголовок таблицы
-        header = (f"24-Hour Forecast for {city} on {header_date} (every 3 hours):\n"
-                  "Get ready for the day ahead! Here's what the skies have in store:\n\n")
-        table_header = ("Time                | Temp   | Description          | Humidity | Wind    | Precipitation\n"
-                        "-------------------------------------------------------------------------------------------\n")
-        
-        lines = []
-        for item in forecast_items:
-            dt_item = datetime.datetime.fromtimestamp(item["dt"], pytz.utc).astimezone(local_tz)
-            # Форматируем время с датой и временем
-            time_str = dt_item.strftime("%d-%m %H:%M")
-            temp = item["main"]["temp"]
-            description = item["weather"][0]["description"]
-            humidity = item["main"]["humidity"]
-            wind_speed = item["wind"]["speed"]
-            pop = int(item.get("pop", 0) * 100)
-            # Получаем эмодзи для описания погоды
-            emoji = weather_emoji(description)
-            # Добавляем эмодзи для других полей
-            humidity_emoji = "💧"
-            wind_emoji = "🌬️"
-            pop_emoji = "☔"
-            
-            line = (f"{time_str:<18} | {temp:>5}°C | {description:<20} {emoji:<2} | "
-                    f"{humidity:>3}%{humidity_emoji}  | {wind_speed:>4} m/s{wind_emoji} | {pop:>3}%{pop_emoji}")
-            lines.append(line)
-        
-        table = "\n".join(lines)
-        result = f"<pre>{header}{table_header}{table}</pre>"
-        return result
+        key = forecast_cache_key(city)
+        entry = await forecast_cache.get_entry(key)
+        if entry is None:
+            data = await fetch_forecast(city)
+            if str(data.get("cod")) != "200":
+                return f"Error: {data.get('message', 'Unable to get forecast data')}"
+            stored_at = None
+        else:
+            data, stored_at = entry.value, entry.stored_at
+
+        # Набор строк таблицы меняется только на границах слотов
+        render_key = (key, lang, int(time.time() // FORECAST_SLOT_SECONDS), stored_at)
+        rendered = forecast_render_memo.get(render_key)
+        if rendered is None:
+            rendered = await render_forecast(data, city, lang)
+            if stored_at is not None:
+                forecast_render_memo.set(render_key, rendered)
+        return rendered
     except Exception as e:
         logger.error(f"24-hour forecast API error: {e}")
         return "Sorry, I could not retrieve the 24-hour forecast information at this moment."
 
+async def render_forecast(data: dict, city: str, lang: str) -> str:
+    """Форматирует закэшированный ответ OpenWeather; описания погоды переводятся через каталог UI-строк."""
+    # Определяем локальную таймзону для Сан-Кристобаля (например, для Мехико)
+    local_tz = pytz.timezone("America/Mexico_City")
+    now_local = datetime.datetime.now(local_tz)
+    
+    forecast_items = []
+    for item in data["list"]:
+        dt_item = datetime.datetime.fromtimestamp(item["dt"], pytz.utc).astimezone(local_tz)
+        if now_local < dt_item <= now_local + datetime.timedelta(hours=24):
+            forecast_items.append(item)
+    
+    if not forecast_items:
+        return "No forecast data available for the next 24 hours."
+    
+    # Используем дату первого элемента для заголовка
+    first_dt = datetime.datetime.fromtimestamp(forecast_items[0]["dt"], pytz.utc).astimezone(local_tz)
+    header_date = first_dt.strftime("%Y-%m-%d")
+    
+    # Формируем заголовок таблицы
+    header = (f"24-Hour Forecast for {city} on {header_date} (every 3 hours):\n"
+              "Get ready for the day ahead! Here's what the skies have in store:\n\n")
+    table_header = ("Time                | Temp   | Description          | Humidity | Wind    | Precipitation\n"
+                    "-------------------------------------------------------------------------------------------\n")
+    
+    lines = []
+    for item in forecast_items:
+        dt_item = datetime.datetime.fromtimestamp(item["dt"], pytz.utc).astimezone(local_tz)
+        # Форматируем время с датой и временем
+        time_str = dt_item.strftime("%d-%m %H:%M")
+        temp = item["main"]["temp"]
+        description = item["weather"][0]["description"]
+        humidity = item["main"]["humidity"]
+        wind_speed = item["wind"]["speed"]
+        pop = int(item.get("pop", 0) * 100)
+        # Получаем эмодзи для описания погоды (по английскому описанию), затем переводим описание
+        emoji = weather_emoji(description)
+        description = await translate_ui(description, lang)
+        # Добавляем эмодзи для других полей
+        humidity_emoji = "💧"
+        wind_emoji = "🌬️"
+        pop_emoji = "☔"
+        
+        line = (f"{time_str:<18} | {temp:>5}°C | {description:<20} {emoji:<2} | "
+                f"{humidity:>3}%{humidity_emoji}  | {wind_speed:>4} m/s{wind_emoji} | {pop:>3}%{pop_emoji}")
+        lines.append(line)
+    
+    table = "\n".join(lines)
+    result = f"<pre>{header}{table_header}{table}</pre>"
+    return result
+
 def format_phone_number(phone: str) -> str:
     """
     Принимает номер телефона в виде строки, оставляет только цифры
@@ -581,44 +866,32 @@ def format_phone_number(phone: str) -> str:
 
 def set_wal_mode():
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            conn.execute("PRAGMA journal_mode=WAL;")
-            logger.info("SQLite set to WAL mode.")
+        # Соединения-писатели открываются сразу и переводят обе базы в режим WAL
+        main_db.set_wal_mode()
+        history_db.set_wal_mode()
+        cache_db.set_wal_mode()
+        logger.info("SQLite set to WAL mode.")
     except Exception as e:
         logger.error(f"Error setting WAL mode: {e}")
 
-def build_welcome_message(lang: str, user_first_name: str) -> str:
-    greeting = get_dynamic_greeting(html.escape(user_first_name))
-    base_message = (
-        f"{greeting}\n\n"
-        "I'm your AI-powered concierge for San Cristóbal de las Casas.\n\n"
-        "This bot is designed to provide you with detailed information on tours, accommodation, attractions, restaurants, advices, and events in the city.\n"
-        "You can interact with the bot using the menu commands or simply type your query. For example:\n"
-        "• I'm traveling with my partner and looking for a quiet hotel away from the center.\n"
-        "• We're on a family trip; what activities do you recommend for children?\n\n"
-        "For usage examples and to learn how to make the most of all the features, visit: "
-        "<a href='https://example.com/usage-guide'>Usage Guide</a>\n\n"
-        "I look forward to helping you explore the city!"
-    )
-    
-    if lang == "en":
-        return base_message
-    
-    # Защита и перевод
-    protected_text, placeholders = protect_names(base_message)
-    translated_text = translate_if_needed(protected_text, lang)
-    final_message = restore_names(translated_text, placeholders)
-    
-    # Дополнительная проверка результата
-    if translated_text == protected_text:
-        logger.warning(f"Translation to '{lang}' did not occur, returning English message")
-    
-    return final_message
+def run_migrations():
+    # Миграции применяются при старте; ошибка миграции останавливает запуск, чтобы не работать со старой схемой
+    main_version = main_db.migrate(MAIN_MIGRATIONS)
+    history_version = history_db.migrate(HISTORY_MIGRATIONS)
+    cache_version = cache_db.migrate(CACHE_MIGRATIONS)
+    logger.info(f"Schema versions: {DB_NAME}={main_version}, {DB_HISTORY}={history_version}, {CACHE_DB}={cache_version}")
+
+async def build_welcome_message(lang: str, user_first_name: str) -> str:
+    # Тексты приветствия берутся из предсобранного каталога (python i18n.py build)
+    greeting_template = await translate_ui(random.choice(WELCOME_GREETINGS), lang)
+    greeting = greeting_template.replace("{name}", html.escape(user_first_name))
+    body = await translate_ui(WELCOME_BODY, lang)
+    return f"{greeting}\n\n{body}"
     
 # ==================== Функции для баннеров ====================
-def get_banner(section: str) -> str:
-    result = get_info_from_db("SELECT banner_url FROM banners WHERE section = ?", (section,))
-    banner = result[0][0] if result and result[0][0] else DEFAULT_BANNERS.get(section, "")
+async def get_banner(section: str) -> str:
+    # Баннеры берутся из снимка main.db в памяти
+    banner = content_store.snapshot.banner(section) or DEFAULT_BANNERS.get(section, "")
     return banner.strip() if banner else ""
 
 # ==================== Вспомогательные функции форматирования ====================
@@ -634,36 +907,16 @@ def format_address(address: str) -> str:
     # Возвращаем HTML-ссылку с исходным текстом адреса
     return f"<a href='{url}' target='_blank'>{html.escape(address)}</a>"
 
-def split_caption_by_paragraph(caption: str, limit: int = 1024) -> Tuple[str, str]:
-    """
-    Разбивает caption на две части по абзацам, стараясь, чтобы первая часть не превышала limit символов.
-    Если невозможно найти разбиение по абзацам, возвращает полный текст и пустую строку.
-    """
-    if len(caption) <= limit:
-        return caption, ""
-    # Попытаемся разбить по двойному переносу строки
-    paragraphs = caption.split("<p>")
-    first_part = ""
-    second_part = ""
-    for i, para in enumerate(paragraphs):
-        # Если добавление очередного абзаца не превышает лимит, добавляем его
-        if len(first_part) + len(para) + 2 <= limit:
-            first_part += para + "<p>"
-        else:
-            # Остальные абзацы собираем во вторую часть
-            second_part = "<p>".join(paragraphs[i:]).strip()
-            break
-    return first_part.strip(), second_part
-
-
 async def safe_reply_photo(message_obj, photo, caption, parse_mode, context, reply_markup=None):
     try:
-        if len(caption) > 1024:
-            part1, part2 = split_caption_by_paragraph(caption, 1024)
+        if len(caption) > TELEGRAM_MAX_CAPTION_LENGTH:
+            part1, rest = split_caption(caption)
             bot_message = await message_obj.reply_photo(photo=photo, caption=part1, parse_mode=parse_mode, reply_markup=reply_markup)
-            if part2:
+            if rest:
                 lang = context.user_data.get("lang", "en")
-                await message_obj.reply_text(text=part2, parse_mode=parse_mode, reply_markup=get_persistent_menu(lang))
+                for n, chunk in enumerate(rest, 1):
+                    await message_obj.reply_text(text=chunk, parse_mode=parse_mode,
+                                                 reply_markup=get_persistent_menu(lang) if n == len(rest) else None)
             return bot_message
         else:
             return await message_obj.reply_photo(photo=photo, caption=caption, parse_mode=parse_mode, reply_markup=reply_markup)
@@ -671,6 +924,31 @@ async def safe_reply_photo(message_obj, photo, caption, parse_mode, context, rep
         logger.error(f"Error in safe_reply_photo: photo={photo}, caption_length={len(caption)}, error={e}")
         return None
     
+def make_card(text: str, photo: Optional[str]) -> Card:
+    """Готовая карточка: текст заранее делится на подпись (или первое сообщение) и продолжение."""
+    if not photo:
+        chunks = chunk_html(text) or [text]
+        return Card(chunks[0], tuple(chunks[1:]), None)
+    caption, overflow = split_caption(text)
+    return Card(caption, tuple(overflow), photo)
+
+
+async def send_card(message_obj, card: Card, context):
+    """Отправляет готовую карточку: фото с подписью (или первое сообщение) и продолжение."""
+    try:
+        if card.photo:
+            bot_message = await message_obj.reply_photo(photo=card.photo, caption=card.caption, parse_mode=ParseMode.HTML)
+        else:
+            bot_message = await message_obj.reply_text(card.caption, parse_mode=ParseMode.HTML)
+        lang = context.user_data.get("lang", "en")
+        for n, chunk in enumerate(card.overflow, 1):
+            reply_markup = get_persistent_menu(lang) if n == len(card.overflow) else None
+            await message_obj.reply_text(text=chunk, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
+        return bot_message
+    except Exception as e:
+        logger.error(f"Error in send_card: photo={card.photo}, caption_length={len(card.caption)}, error={e}")
+        return None
+    
 # ==================== Функция генерации ответа через OpenAI ====================
 def get_user_lang(context) -> str:
     try:
@@ -679,12 +957,17 @@ def get_user_lang(context) -> str:
         return "en"
     
   # ==================== Функция перевода ====================
-def translate_if_needed(text: str, lang: str) -> str:
+async def translate_if_needed(text: str, lang: str) -> str:
     target_lang = language_code_to_target(lang)
     if target_lang == "en":
         return text
+    return await translation_flight.run(("google", target_lang, text), lambda: google_translate(text, lang))
+
+async def google_translate(text: str, lang: str) -> str:
+    target_lang = language_code_to_target(lang)
     try:
-        translated = GoogleTranslator(source='auto', target=target_lang).translate(text)
+        # deep_translator синхронный — выполняем его в пуле потоков
+        translated = await run_blocking(GoogleTranslator(source='auto', target=google_language_code(lang)).translate, text)
         if translated and translated != text:  # Проверяем, что перевод выполнен
             logger.info(f"Translated text to '{target_lang}': {translated}")
             return translated
@@ -695,6 +978,10 @@ def translate_if_needed(text: str, lang: str) -> str:
         logger.error(f"Translation error to '{target_lang}': {e}")
         return text  # Fallback на исходный текст при ошибке
 
+async def translate_ui(text: str, lang: str) -> str:
+    """Перевод статической строки интерфейса: один раз на язык, далее — из каталога."""
+    return await ui_catalogue.translate(text, lang)
+
 def protect_names(text: str) -> Tuple[str, dict]:
     """
     Находит все фрагменты, заключённые в <PN> и </PN>,
@@ -740,60 +1027,92 @@ def restore_recommendations(text: str, placeholders: dict) -> str:
         text = text.replace(placeholder, f"<i>{rec}</i>")
     return text
     
-def generate_answer(prompt: str, language="English") -> str:
+def answer_system_prompt(target_lang: str) -> str:
+    return (
+        "You are a knowledgeable and reliable concierge for San Cristóbal de las Casas. "
+        f"Answer in the user's language ({target_lang}). "
+        "Incorporate relevant context from the conversation history to provide a helpful answer. "
+        "Do not fabricate or hallucinate details unless absolutely necessary. Search places only in San Cristóbal de las Casas and Chiapas state. "
+        "Ensure that your response is structured, accurate, and uses proper HTML formatting. "
+        "For each establishment, output exactly as follows:\n"
+        "1) On the first line, output: <b><Establishment Name></b> followed by a space and then the Price Level represented by the appropriate number of 💲 symbols (or 💲? if unknown).\n"
+        "2) On the second line, output: - <a href='URL'>View on map</a> (omit this line if the URL is missing or invalid).\n"
+        "3) On the third line, output: <b>Rating: <rating></b>\n"
+        "4) On the fourth line, output: <i><A short recommendation in a few sentences></i>\n"
+        "Then add a blank line to separate this entry from the next.\n"
+        "Use '\\n' to separate lines exactly, and do NOT use <br> or <br/> tags.\n"
+        "Do NOT use any tags other than <b>, <i>, and <a> with properly formatted attributes. "
+        "Ensure all HTML tags are properly opened and closed, with no extra or mismatched closing tags. "
+        "Each entry must end with </b></i></a> after the recommendation if needed, but do not replicate tags. "
+        "Double-check that your response contains no syntax errors in HTML, including no extra '>' or duplicate tags. "
+        "If you detect any duplicate, mismatched, or extra tags, remove them and ensure strict tag pairing."
+    )
+
+async def finalize_answer(answer: str, target_lang: str) -> str:
+    """Переводит ответ, если модель ответила не на том языке, и очищает HTML."""
+    # Модель просили отвечать на target_lang — это подсказка детектору
+    detected_answer_lang = language_detector.detect(answer, hint=target_lang)
+    if detected_answer_lang != target_lang:
+        protected_text, placeholders = protect_names(answer)
+        translated_text = await translate_if_needed(protected_text, target_lang)
+        answer = restore_names(translated_text, placeholders)
+    return validate_html(answer)
+
+async def generate_answer(prompt: str, language="English") -> str:
+    # Одинаковые промпты (одинаковые вопросы без истории, один и тот же список мест) генерируются один раз
     target_lang = language_code_to_target(language)
-    system_prompt = (
-    "You are a knowledgeable and reliable concierge for San Cristóbal de las Casas. "
-    "Answer in the user's language ({target_lang}). "
-    "Incorporate relevant context from the conversation history to provide a helpful answer. "
-    "Do not fabricate or hallucinate details unless absolutely necessary. Search places only in San Cristóbal de las Casas and Chiapas state. "
-    "Ensure that your response is structured, accurate, and uses proper HTML formatting. "
-    "For each establishment, output exactly as follows:\n"
-    "1) On the first line, output: <b><Establishment Name></b> followed by a space and then the Price Level represented by the appropriate number of 💲 symbols (or 💲? if unknown).\n"
-    "2) On the second line, output: - <a href='URL'>View on map</a> (omit this line if the URL is missing or invalid).\n"
-    "3) On the third line, output: <b>Rating: <rating></b>\n"
-    "4) On the fourth line, output: <i><A short recommendation in a few sentences></i>\n"
-    "Then add a blank line to separate this entry from the next.\n"
-    "Use '\\n' to separate lines exactly, and do NOT use <br> or <br/> tags.\n"
-    "Do NOT use any tags other than <b>, <i>, and <a> with properly formatted attributes. "
-    "Ensure all HTML tags are properly opened and closed, with no extra or mismatched closing tags. "
-    "Each entry must end with </b></i></a> after the recommendation if needed, but do not replicate tags. "
-    "Double-check that your response contains no syntax errors in HTML, including no extra '>' or duplicate tags. "
-    "If you detect any duplicate, mismatched, or extra tags, remove them and ensure strict tag pairing."
-)
+    return await llm_flight.run((target_lang, prompt), lambda: complete_answer(prompt, target_lang))
 
-    
+async def complete_answer(prompt: str, target_lang: str) -> str:
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
+        response = await chat_completion(
             temperature=0.1,  # Максимально низкая температура для точности
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": answer_system_prompt(target_lang)},
                 {"role": "user", "content": prompt}
             ]
         )
         answer = response.choices[0].message.content.strip()
         logger.info(f"Generated answer: {answer}")
-        
-        detected_answer_lang = language_code_to_target(detect(answer)) if detect(answer) else "en"
-        if detected_answer_lang != target_lang:
-            protected_text, placeholders = protect_names(answer)
-            translated_text = translate_if_needed(protected_text, target_lang)
-            answer = restore_names(translated_text, placeholders)
-        
-        cleaned_answer = validate_html(answer)
-        # Удаляем все дублирующиеся теги и лишние символы
-        #cleaned_answer = re.sub(r'</?[bi]>\s*?</?[bi]>', '', cleaned_answer)
-        #cleaned_answer = re.sub(r'</a>\s*?</a>', '', cleaned_answer)
-        #cleaned_answer = re.sub(r'>>+', '>', cleaned_answer)  # Удаляем лишние '>'
-        
-               
+        cleaned_answer = await finalize_answer(answer, target_lang)
         logger.debug(f"Validated and deduplicated answer: {cleaned_answer}")
         return cleaned_answer
     
     except Exception as e:
         logger.error(f"OpenAI API error: {e}")
-        return "I'm sorry, I couldn't generate an answer at the moment."
+        return ANSWER_ERROR_TEXT
+
+async def stream_answer(update: Update, prompt: str, language: str, reply_markup=None) -> Tuple[str, Optional[Message]]:
+    """
+    Генерирует ответ потоком: заглушка отправляется сразу и редактируется по мере генерации.
+    Возвращает окончательный текст и последнее отправленное сообщение.
+    """
+    target_lang = language_code_to_target(language)
+    reply = StreamingReply(update.message, render=validate_html, reply_markup=reply_markup,
+                           edit_interval=STREAM_EDIT_INTERVAL)
+    started = time.perf_counter()
+    await reply.start()
+    first_token = True
+    try:
+        with metrics.timer("llm.stream_seconds"):
+            async for delta in chat_completion_stream(
+                temperature=0.1,
+                messages=[
+                    {"role": "system", "content": answer_system_prompt(target_lang)},
+                    {"role": "user", "content": prompt}
+                ]
+            ):
+                if first_token:
+                    metrics.observe("llm.ttft_seconds", time.perf_counter() - started)
+                    first_token = False
+                await reply.feed(delta)
+        logger.info(f"Generated answer: {reply.text}")
+        answer = await finalize_answer(reply.text.strip(), target_lang)
+    except Exception as e:
+        logger.error(f"OpenAI streaming error: {e}")
+        answer = ANSWER_ERROR_TEXT
+    bot_message = await reply.finish(answer)
+    return answer, bot_message
     
 # ==================== Функции форматирования для вывода элементов ====================
 def format_tour_item(index, tour):
@@ -847,26 +1166,13 @@ def format_restaurant_item(index, rest):
             f"<b>Website/Social:</b> <i>{website}</i>\n\n"
             f"<b>Details:</b>\n<i>{extra_info}</i>\n\n")
 
-# ==================== Функция динамического приветствия ====================
-def get_dynamic_greeting(user_name: str) -> str:
-    greetings = [
-        f"Hey {user_name}, welcome to your personal concierge!",
-        f"Hello {user_name}! Great to see you here at San Cristóbal!",
-        f"Hi {user_name}, ready to explore the best of San Cristóbal?",
-        f"Greetings {user_name}, let's discover the city together!"
-    ]
-    return random.choice(greetings)
-
-def save_feedback_to_db(chat_id: str, user_id: str, message_text: str, rating: str):
+async def save_feedback_to_db(chat_id: str, user_id: str, message_text: str, rating: str):
     try:
-        with sqlite3.connect(DB_HISTORY) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO feedback (chat_id, user_id, message_text, rating) VALUES (?, ?, ?, ?)",
-                (chat_id, user_id, message_text, rating)
-            )
-            conn.commit()
-            logger.info(f"Saved feedback: chat_id={chat_id}, user_id={user_id}, rating={rating}")
+        await history_writer.put(
+            "INSERT INTO feedback (chat_id, user_id, message_text, rating) VALUES (?, ?, ?, ?)",
+            (chat_id, user_id, message_text, rating)
+        )
+        logger.info(f"Queued feedback: chat_id={chat_id}, user_id={user_id}, rating={rating}")
     except Exception as e:
         logger.error(f"Error saving feedback to DB: {e}")
         
@@ -877,16 +1183,14 @@ def language_code_to_target(lang_code: str) -> str:
     return lang_code[:2].lower() if lang_code else "en"
 
 # ==================== Функция для отправки длинных сообщений ====================
-async def send_long_message(update: Update, text: str, parse_mode=None, reply_markup=None):
-    max_length = 4096
-    if len(text) <= max_length:
-        return await update.message.reply_text(text, parse_mode=parse_mode, reply_markup=reply_markup)
-    else:
-        chunks = textwrap.wrap(text, width=max_length, break_long_words=False, replace_whitespace=False)
-        bot_message = None
-        for chunk in chunks:
-            bot_message = await update.message.reply_text(chunk, parse_mode=parse_mode, reply_markup=reply_markup if chunk == chunks[-1] else None)
-        return bot_message
+async def send_long_message(message_obj, text: str, parse_mode=None, reply_markup=None):
+    """Отправляет ответом на message_obj текст любой длины; клавиатура — у последнего сообщения."""
+    chunks = chunk_html(text, TELEGRAM_MAX_MESSAGE_LENGTH) or [text]
+    bot_message = None
+    for n, chunk in enumerate(chunks, 1):
+        bot_message = await message_obj.reply_text(chunk, parse_mode=parse_mode,
+                                                   reply_markup=reply_markup if n == len(chunks) else None)
+    return bot_message
 
 # ==================== Функции для работы с историей и суммаризацией ====================
 def init_chat_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -901,65 +1205,69 @@ def init_chat_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     context.chat_data["messages_since_summary"] = []
     context.chat_data["summary"] = ""
 
-def get_cached_translation(context, entity_type, entity_id, field, lang, original_text):
-    cache_key = f"{entity_type}_{entity_id}_{field}_{lang}"
-    if cache_key in context.chat_data:
-        logger.info(f"Retrieved from cache: {cache_key}")
-        return context.chat_data[cache_key]
-    
+async def get_cached_translation(entity_type, entity_id, field, lang, original_text):
+    """
+    Переводит поле записи main.db через GPT с общим для всех чатов кэшем.
+    Ключ включает хэш исходного текста, поэтому после правки строки в main.db старый перевод
+    не используется, а при сохранении нового переводы прежних версий поля удаляются.
+    """
     # Проверяем, нужно ли переводить поле
-    if field in ["name", "address"]:  # Не переводим name и address
-        translated = original_text
-    else:
-        # Используем GPT для перевода
-        translation_prompt = (
-            f"Translate the following text into '{lang}', but do not translate proper names or addresses:\n\n"
-            f"{original_text}"
+    if field in ["name", "address"] or not original_text:  # Не переводим name и address
+        return original_text
+
+    field_prefix = f"{entity_type}:{entity_id}:{field}:{lang}:"
+    source_hash = hashlib.sha1(original_text.encode("utf-8")).hexdigest()[:16]
+    cache_key = field_prefix + source_hash
+    cached = await translation_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return await translation_flight.run(("gpt", cache_key),
+                                        lambda: gpt_translate_field(field_prefix, cache_key, lang, original_text))
+
+async def gpt_translate_field(field_prefix: str, cache_key: str, lang: str, original_text: str) -> str:
+    # Используем GPT для перевода
+    translation_prompt = (
+        f"Translate the following text into '{lang}', but do not translate proper names or addresses:\n\n"
+        f"{original_text}"
+    )
+    try:
+        response = await chat_completion(
+            temperature=0.1,
+            messages=[
+                {"role": "system", "content": "You are a translator. Provide accurate and natural translations, preserving proper names and addresses."},
+                {"role": "user", "content": translation_prompt}
+            ]
         )
-        try:
-            response = openai.chat.completions.create(
-                model="gpt-4o-mini",
-                temperature=0.1,
-                messages=[
-                    {"role": "system", "content": "You are a translator. Provide accurate and natural translations, preserving proper names and addresses."},
-                    {"role": "user", "content": translation_prompt}
-                ]
-            )
-            translated = response.choices[0].message.content.strip()
-            logger.info(f"GPT translated text to '{lang}': {translated}")
-        except Exception as e:
-            logger.error(f"GPT translation error: {e}")
-            translated = original_text  # Fallback на исходный текст
+        translated = response.choices[0].message.content.strip()
+        logger.info(f"GPT translated text to '{lang}': {translated}")
+    except Exception as e:
+        logger.error(f"GPT translation error: {e}")
+        return original_text  # Fallback на исходный текст (не кэшируем)
     
-    context.chat_data[cache_key] = translated
-    logger.info(f"Cached translation: {cache_key} -> {translated}")
+    await translation_cache.set(cache_key, translated)
+    await translation_cache.delete_prefix(field_prefix, keep_key=cache_key)
+    logger.info(f"Cached translation: {cache_key}")
     return translated
 
-def save_message_to_db(chat_id: str, user_id: str, role: str, message_text: str):
+async def save_message_to_db(chat_id: str, user_id: str, role: str, message_text: str):
     try:
-        with sqlite3.connect(DB_HISTORY) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO chat_history (chat_id, user_id, role, message_text) VALUES (?, ?, ?, ?)",
-                (chat_id, user_id, role, message_text)
-            )
-            conn.commit()
+        await history_writer.put(
+            "INSERT INTO chat_history (chat_id, user_id, role, message_text) VALUES (?, ?, ?, ?)",
+            (chat_id, user_id, role, message_text)
+        )
     except Exception as e:
         logger.error(f"Error saving message to DB: {e}")
 
-def get_summary_from_db(chat_id: str) -> str:
+async def get_summary_from_db(chat_id: str) -> str:
     try:
-        with sqlite3.connect(DB_HISTORY) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT summary FROM conversation_summary WHERE chat_id = ?", (chat_id,))
-            result = cursor.fetchone()
+        result = await history_db.fetch_one("SELECT summary FROM conversation_summary WHERE chat_id = ?", (chat_id,))
         return result[0] if result else ""
     except Exception as e:
         logger.error(f"Error retrieving summary from DB: {e}")
         return ""
 
-def update_conversation_summary(chat_id: str, new_messages: list, lang: str = "en") -> str:
-    prev_summary = get_summary_from_db(chat_id)
+async def update_conversation_summary(chat_id: str, new_messages: list, lang: str = "en") -> str:
+    prev_summary = await get_summary_from_db(chat_id)
     new_text = "\n".join(new_messages)
     if prev_summary:
         prompt = (f"Update the following conversation summary using the previous summary and new messages.\n\n"
@@ -969,54 +1277,53 @@ def update_conversation_summary(chat_id: str, new_messages: list, lang: str = "e
     else:
         prompt = f"Summarize the following conversation concisely, preserving key details:\n\n{new_text}"
     
-    new_summary = generate_answer(prompt, language="English")
+    new_summary = await generate_answer(prompt, language="English")
     if lang.lower() not in ["en", "english"]:
-        new_summary = translate_if_needed(new_summary, lang)
+        new_summary = await translate_if_needed(new_summary, lang)
     
     try:
-        with sqlite3.connect(DB_HISTORY) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO conversation_summary (chat_id, summary, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
-                "ON CONFLICT(chat_id) DO UPDATE SET summary = ?, updated_at = CURRENT_TIMESTAMP",
-                (chat_id, new_summary, new_summary)
-            )
-            conn.commit()
+        await history_db.execute(
+            "INSERT INTO conversation_summary (chat_id, summary, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) "
+            "ON CONFLICT(chat_id) DO UPDATE SET summary = ?, updated_at = CURRENT_TIMESTAMP",
+            (chat_id, new_summary, new_summary)
+        )
+        prompt_builder.set_summary(chat_id, new_summary)
     except Exception as e:
         logger.error(f"Error updating conversation summary in DB: {e}")
     return new_summary
 
-def build_prompt_with_history(new_query: str, update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
-    chat_id = str(update.effective_chat.id)
-    summary = get_summary_from_db(chat_id)
-    recent_messages = context.chat_data.get("recent_messages", [])
-    history_text = ""
-    if summary:
-        history_text += f"Conversation summary: {summary}\n"
-    if recent_messages:
-        history_text += "Recent messages:\n" + "\n".join([f"- {msg}" for msg in recent_messages]) + "\n"
-    prompt = f"{history_text}Now answer the following query: {html.escape(new_query)}"
-    return prompt
+# Фоновая суммаризация: задания одного чата объединяются и никогда не выполняются параллельно
+summary_queue = DebouncedJobQueue("summaries", update_conversation_summary, debounce=SUMMARY_DEBOUNCE_SECONDS,
+                                  max_delay=SUMMARY_MAX_DELAY, concurrency=SUMMARY_CONCURRENCY)
 
-# ==================== Меню и inline клавиатуры ====================
-def persistent_menu_en() -> ReplyKeyboardMarkup:
-    menu_buttons = [
-        ["Tours", "Accommodation", "Attractions"],
-        ["Restaurants", "Advices"],
-        ["FAQ", "Events", "🔴 Reset"]
-    ]
-    return ReplyKeyboardMarkup(menu_buttons, resize_keyboard=True, one_time_keyboard=False)
+# Сводки чатов хранятся в памяти PromptBuilder; из базы сводка читается только при первом обращении
+token_counter = TokenCounter()
+prompt_builder = PromptBuilder(get_summary_from_db, token_counter, budget=PROMPT_TOKEN_BUDGET)
+
+async def build_prompt_with_history(new_query: str, update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    # Сводка и последние сообщения обрезаются так, чтобы промпт уложился в PROMPT_TOKEN_BUDGET токенов
+    return await prompt_builder.build(str(update.effective_chat.id), new_query,
+                                      context.chat_data.get("recent_messages", []))
+
+def build_standalone_prompt(query: str) -> str:
+    # Без сводки и последних сообщений: такой ответ годится для любого чата и может храниться в answer_cache
+    return prompt_builder.assemble("", [], query)
 
-def persistent_menu_es() -> ReplyKeyboardMarkup:
+# ==================== Меню и inline клавиатуры ====================
+def get_persistent_menu(lang: str) -> ReplyKeyboardMarkup:
+    # Подписи кнопок берутся из каталога без обращения к переводчику; при отсутствии — английские
     menu_buttons = [
-        ["Tours", "Alojamiento", "Atracciones"],
-        ["Restaurantes", "Consejos"],
-        ["FAQ", "Eventos", "🔴 Reset"]
+        [ui_catalogue.lookup(MENU_LABELS[key], lang) or MENU_LABELS[key] if key else RESET_BUTTON for key in row]
+        for row in MENU_LAYOUT
     ]
     return ReplyKeyboardMarkup(menu_buttons, resize_keyboard=True, one_time_keyboard=False)
 
-def get_persistent_menu(lang: str) -> ReplyKeyboardMarkup:
-    return persistent_menu_es() if lang.lower() in ["es", "spanish"] else persistent_menu_en()
+def menu_section_for(text: str) -> Optional[str]:
+    """Возвращает раздел меню (ключ MENU_LABELS) по подписи кнопки на любом языке каталога."""
+    label = ui_catalogue.source_for(text, MENU_LABELS.values())
+    if label is None:
+        return None
+    return next(key for key, value in MENU_LABELS.items() if value == label)
 
 def get_list_inline_keyboard(items: list, prefix: str, lang: str) -> InlineKeyboardMarkup:
     keyboard = []
@@ -1028,32 +1335,9 @@ def get_list_inline_keyboard(items: list, prefix: str, lang: str) -> InlineKeybo
     return InlineKeyboardMarkup(keyboard)
 
 def language_inline_keyboard() -> InlineKeyboardMarkup:
-    languages = [
-        ("English", "en"),       # Английский
-        ("Español", "es"),      # Испанский
-        ("Français", "fr"),     # Французский
-        ("Português", "pt"),    # Португальский
-        ("Deutsch", "de"),      # Немецкий
-        ("Italiano", "it"),     # Итальянский
-        ("Nederlands", "nl"),   # Голландский
-        ("日本語", "ja"),       # Японский
-        ("中文 (简体)", "zh-cn"),# Китайский (упрощенный)
-        ("한국어", "ko"),       # Корейский
-        ("Русский", "ru"),      # Русский
-        ("Українська", "uk"),   # Украинский
-        ("العربية", "ar"),     # Арабский
-        ("עברית", "he"),       # Иврит
-        ("Svenska", "sv"),     # Шведский
-        ("Norsk", "no"),       # Норвежский
-        ("Dansk", "da"),       # Датский
-        ("Türkçe", "tr"),      # Турецкий
-        ("Ελληνικά", "el"),    # Греческий
-        ("Polski", "pl"),      # Польский
-        ("Čeština", "cs")      # Чешский
-    ]
     buttons = [
-        [InlineKeyboardButton(name, callback_data=f"lang:{code}") for name, code in languages[i:i+3]]
-        for i in range(0, len(languages), 3)
+        [InlineKeyboardButton(name, callback_data=f"lang:{code}") for name, code in LANGUAGES[i:i+3]]
+        for i in range(0, len(LANGUAGES), 3)
     ]
     return InlineKeyboardMarkup(buttons)
 
@@ -1071,7 +1355,7 @@ async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
             logger.error(f"Error deleting language selection message: {e}")
         chat_id = query.message.chat_id
         user = query.from_user
-        message = build_welcome_message(lang, user.first_name)
+        message = await build_welcome_message(lang, user.first_name)
         logger.info(f"Sending welcome message in '{lang}': {message}")
         await context.bot.send_message(chat_id=chat_id,
                                        text=message,
@@ -1093,10 +1377,10 @@ async def forecast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     if len(parts) > 1:
         city = parts[1]
     else:
-        city = "San Cristóbal de las Casas, Chiapas, Mexico"
+        city = DEFAULT_FORECAST_CITY
     
     lang = context.user_data.get("lang", "en")
-    forecast_info = get_24h_forecast(city, lang=lang)
+    forecast_info = await get_24h_forecast(city, lang=lang)
     await update.message.reply_text(forecast_info, parse_mode=ParseMode.HTML)
 
 async def handle_language_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -1133,9 +1417,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     chat_id = str(update.effective_chat.id)
     logger.info(f"Start command invoked for chat_id: {chat_id}")
     
-    if is_new_chat(chat_id):
+    if await is_new_chat(chat_id):
         logger.info(f"Chat {chat_id} is new. Registering and sending notification.")
-        register_chat(chat_id)
+        await register_chat(chat_id)
         admin_chat_id = os.getenv("ADMIN_CHAT_ID")
         if admin_chat_id:
             await context.bot.send_message(
@@ -1157,108 +1441,86 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         init_chat_history(update, context)
     lang = context.user_data.get("lang")
     user = update.effective_user
-    message = build_welcome_message(lang, user.first_name)
+    message = await build_welcome_message(lang, user.first_name)
     await update.message.reply_text(message, parse_mode=ParseMode.HTML, reply_markup=get_persistent_menu(lang))
 
 # ==================== Обработчики для разделов ====================
 async def tours_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     lang = context.user_data.get("lang", "en")
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT id, name{suffix} FROM tours"
-    tours = get_info_from_db(query)
+    tours = content_store.snapshot.select("tours", "id", f"name{suffix}")
     if not tours:
-        await update.message.reply_text(translate_if_needed("No tour data found in the database.", lang),
+        await update.message.reply_text(await translate_ui("No tour data found in the database.", lang),
                                         reply_markup=get_persistent_menu(lang), parse_mode=ParseMode.HTML)
         return
-    banner_url = get_banner("tours")
-    caption = translate_if_needed("Select a tour to get more details.", lang)
+    banner_url = await get_banner("tours")
+    caption = await translate_ui("Select a tour to get more details.", lang)
     inline_keyboard = get_list_inline_keyboard(tours, "tour", lang)
     if banner_url:
         await safe_reply_photo(update.message, banner_url, caption, ParseMode.HTML, context, inline_keyboard)
     else:
         await update.message.reply_text(caption, parse_mode=ParseMode.HTML, reply_markup=inline_keyboard)
     
-async def handle_tour_callback(tour_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    lang = context.user_data.get("lang", "en")
+async def render_tour_card(snapshot, tour, lang: str) -> Card:
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT name{suffix}, description{suffix}, price, extra_info{suffix}, mainimage FROM tours WHERE id = ?"
-    tour_details = get_info_from_db(query, (tour_id,))
-    if not tour_details:
-        await update.callback_query.edit_message_text(translate_if_needed("Tour details not found.", lang), parse_mode=ParseMode.HTML)
-        return
-    
-    tour = tour_details[0]
-    name = safe_field(tour[0])
-    description = safe_field(tour[1])
-    price = safe_field(str(tour[2]))
-    extra_info = safe_field(tour[3])
+    name = safe_field(getattr(tour, f"name{suffix}"))
+    description = safe_field(getattr(tour, f"description{suffix}"))
+    price = safe_field(str(tour.price))
+    extra_info = safe_field(getattr(tour, f"extra_info{suffix}"))
     
     # Перевод с кэшированием, если язык не en или es
     if lang not in ["en", "es"]:
-        name = get_cached_translation(context, "tours", tour_id, "name", lang, name)
-        description = get_cached_translation(context, "tours", tour_id, "description", lang, description)
-        extra_info = get_cached_translation(context, "tours", tour_id, "extra_info", lang, extra_info)
+        name = await get_cached_translation("tours", tour.id, "name", lang, name)
+        description = await get_cached_translation("tours", tour.id, "description", lang, description)
+        extra_info = await get_cached_translation("tours", tour.id, "extra_info", lang, extra_info)
     
     formatted = (f"<b>{name}</b>\n\n"
                  f"<b>Description:</b> <i>{description}</i>\n\n"
                  f"<b>Price:</b> <i>{price} pesos</i>\n\n"
                  f"<b>Details:</b>\n<i>{extra_info}</i>\n\n"
                  f"\nBook now! Send a message on WhatsApp:\n ☎️{WHATSAPP_LINK}")
-    image_to_use = tour[4] if tour[4] and tour[4].strip() != "" else get_banner("tours")
-    if not image_to_use:
-        await update.callback_query.message.reply_text(formatted, parse_mode=ParseMode.HTML)
-    else:
-        await safe_reply_photo(update.callback_query.message, image_to_use, formatted, ParseMode.HTML, context)
+    image_to_use = tour.mainimage if tour.mainimage and tour.mainimage.strip() != "" else await get_banner("tours")
+    return make_card(formatted, image_to_use)
+
+async def handle_tour_callback(tour_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    lang = context.user_data.get("lang", "en")
+    card = await item_cards.get("tours", tour_id, lang)
+    if card is None:
+        await update.callback_query.edit_message_text(await translate_ui("Tour details not found.", lang), parse_mode=ParseMode.HTML)
+        return
+    await send_card(update.callback_query.message, card, context)
 
 async def accommodation_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     lang = context.user_data.get("lang", "en")
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = "SELECT id, name_es FROM accommodation"
-    accom = get_info_from_db(query)
+    accom = content_store.snapshot.select("accommodation", "id", "name_es")
     if not accom:
-        await update.message.reply_text(translate_if_needed("No accommodation data found in the database.", lang),
+        await update.message.reply_text(await translate_ui("No accommodation data found in the database.", lang),
                                         reply_markup=get_persistent_menu(lang), parse_mode=ParseMode.HTML)
         return
-    banner_url = get_banner("accommodation")
-    caption = translate_if_needed("Select an accommodation option to get more details.", lang)
+    banner_url = await get_banner("accommodation")
+    caption = await translate_ui("Select an accommodation option to get more details.", lang)
     inline_keyboard = get_list_inline_keyboard(accom, "accom", lang)
     if banner_url:
         await safe_reply_photo(update.message, banner_url, caption, ParseMode.HTML, context, inline_keyboard)
     else:
         await update.message.reply_text(caption, parse_mode=ParseMode.HTML, reply_markup=inline_keyboard)
 
-async def handle_accom_callback(accom_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    lang = context.user_data.get("lang", "en")
+async def render_accom_card(snapshot, item, lang: str) -> Card:
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT name{suffix}, description{suffix}, address{suffix}, phone, website{suffix}, features{suffix}, image_url{suffix} FROM accommodation WHERE id = ?"
-    details = get_info_from_db(query, (accom_id,))
-    if not details:
-        msg = update.callback_query.message
-        text_to_send = translate_if_needed("Accommodation details not found.", lang)
-        if msg.text:
-            try:
-                await update.callback_query.edit_message_text(text_to_send, parse_mode=ParseMode.HTML)
-            except Exception as e:
-                logger.error(f"Error editing message: {e}")
-                await msg.reply_text(text_to_send, parse_mode=ParseMode.HTML)
-        else:
-            await msg.reply_text(text_to_send, parse_mode=ParseMode.HTML)
-        return
-    
-    item = details[0]
-    name = safe_field(item[0])
-    description = safe_field(item[1])
-    address = safe_field(item[2])
-    phone = safe_field(item[3])
-    website = safe_field(item[4])
-    features = safe_field(item[5])
+    name = safe_field(getattr(item, f"name{suffix}"))
+    description = safe_field(getattr(item, f"description{suffix}"))
+    address = safe_field(getattr(item, f"address{suffix}"))
+    phone = safe_field(item.phone)
+    website = safe_field(getattr(item, f"website{suffix}"))
+    features = safe_field(getattr(item, f"features{suffix}"))
     
     # Перевод с кэшированием, если язык не en или es
     if lang not in ["en", "es"]:
-        name = get_cached_translation(context, "accommodation", accom_id, "name", lang, name)
-        description = get_cached_translation(context, "accommodation", accom_id, "description", lang, description)
-        address = get_cached_translation(context, "accommodation", accom_id, "address", lang, address)
-        features = get_cached_translation(context, "accommodation", accom_id, "features", lang, features)
+        name = await get_cached_translation("accommodation", item.id, "name", lang, name)
+        description = await get_cached_translation("accommodation", item.id, "description", lang, description)
+        address = await get_cached_translation("accommodation", item.id, "address", lang, address)
+        features = await get_cached_translation("accommodation", item.id, "features", lang, features)
     
     formatted_address = format_address(address)
     phone_link = format_phone_number(phone)
@@ -1269,48 +1531,53 @@ async def handle_accom_callback(accom_id: int, update: Update, context: ContextT
                  f"<b>Phone/WhatsApp:</b> <i>{phone_link}</i>\n\n"
                  f"<b>Website/Social:</b> <i>{website}</i>\n\n"
                  f"<b>Details:</b>\n<i>{features}</i>\n\n")
-    photo = item[6]
-    if not photo or photo.strip() == "":
-        await update.callback_query.message.reply_text(formatted, parse_mode=ParseMode.HTML)
-    else:
-        await safe_reply_photo(update.callback_query.message, photo, formatted, ParseMode.HTML, context)
+    photo = getattr(item, f"image_url{suffix}")
+    return make_card(formatted, photo if photo and photo.strip() != "" else None)
+
+async def handle_accom_callback(accom_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    lang = context.user_data.get("lang", "en")
+    card = await item_cards.get("accommodation", accom_id, lang)
+    if card is None:
+        msg = update.callback_query.message
+        text_to_send = await translate_ui("Accommodation details not found.", lang)
+        if msg.text:
+            try:
+                await update.callback_query.edit_message_text(text_to_send, parse_mode=ParseMode.HTML)
+            except Exception as e:
+                logger.error(f"Error editing message: {e}")
+                await msg.reply_text(text_to_send, parse_mode=ParseMode.HTML)
+        else:
+            await msg.reply_text(text_to_send, parse_mode=ParseMode.HTML)
+        return
+    await send_card(update.callback_query.message, card, context)
 
 async def attractions_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     lang = context.user_data.get("lang", "en")
-    query = "SELECT id, name_es FROM attractions"
-    attractions = get_info_from_db(query)
+    attractions = content_store.snapshot.select("attractions", "id", "name_es")
     if not attractions:
-        await update.message.reply_text(translate_if_needed("No attractions data found in the database.", lang),
+        await update.message.reply_text(await translate_ui("No attractions data found in the database.", lang),
                                         reply_markup=get_persistent_menu(lang), parse_mode=ParseMode.HTML)
         return
-    banner_url = get_banner("attractions")
-    caption = translate_if_needed("Select an attraction to get more details.", lang)
+    banner_url = await get_banner("attractions")
+    caption = await translate_ui("Select an attraction to get more details.", lang)
     inline_keyboard = get_list_inline_keyboard(attractions, "attr", lang)
     if banner_url:
         await safe_reply_photo(update.message, banner_url, caption, ParseMode.HTML, context, inline_keyboard)
     else:
         await update.message.reply_text(caption, parse_mode=ParseMode.HTML, reply_markup=inline_keyboard)
 
-async def handle_attr_callback(attr_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    lang = context.user_data.get("lang", "en")
+async def render_attr_card(snapshot, attr, lang: str) -> Card:
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT name{suffix}, address{suffix}, shortinfo{suffix}, mainimage, date_time, fullinfo{suffix} FROM attractions WHERE id = ?"
-    details = get_info_from_db(query, (attr_id,))
-    if not details:
-        await update.callback_query.edit_message_text(translate_if_needed("Attraction details not found.", lang), parse_mode=ParseMode.HTML)
-        return
-    
-    attr = details[0]
-    name = safe_field(attr[0])       # Не переводим название
-    address = safe_field(attr[1])    # Не переводим адрес
-    shortinfo = safe_field(attr[2])
-    date_time = safe_field(attr[4])
-    fullinfo = safe_field(attr[5])
+    name = safe_field(getattr(attr, f"name{suffix}"))       # Не переводим название
+    address = safe_field(getattr(attr, f"address{suffix}"))    # Не переводим адрес
+    shortinfo = safe_field(getattr(attr, f"shortinfo{suffix}"))
+    date_time = safe_field(attr.date_time)
+    fullinfo = safe_field(getattr(attr, f"fullinfo{suffix}"))
     
     # Перевод только описательных полей, если язык не en или es
     if lang not in ["en", "es"]:
-        shortinfo = get_cached_translation (context, "attractions", attr_id, "shortinfo", lang, shortinfo)
-        fullinfo = get_cached_translation(context, "attractions", attr_id, "fullinfo", lang, fullinfo)
+        shortinfo = await get_cached_translation("attractions", attr.id, "shortinfo", lang, shortinfo)
+        fullinfo = await get_cached_translation("attractions", attr.id, "fullinfo", lang, fullinfo)
     
     formatted_address = format_address(address)
     
@@ -1319,33 +1586,30 @@ async def handle_attr_callback(attr_id: int, update: Update, context: ContextTyp
                  f"<b>Info:</b> <i>{shortinfo}</i>\n\n"
                  f"<b>Schedule:</b> <i>{date_time}</i>\n\n"
                  f"{fullinfo}\n\n")
-    image_to_use = attr[3] if attr[3] and attr[3].strip() != "" else get_banner("attractions")
-    if not image_to_use:
-        await update.callback_query.message.reply_text(formatted, parse_mode=ParseMode.HTML)
-    else:
-        await safe_reply_photo(update.callback_query.message, image_to_use, formatted, ParseMode.HTML, context)
+    image_to_use = attr.mainimage if attr.mainimage and attr.mainimage.strip() != "" else await get_banner("attractions")
+    return make_card(formatted, image_to_use)
 
-async def handle_rest_callback(rest_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_attr_callback(attr_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     lang = context.user_data.get("lang", "en")
-    suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT name{suffix}, description{suffix}, address{suffix}, phone, website{suffix}, extra_info{suffix}, mainimage{suffix} FROM restaurants WHERE id = ?"
-    details = get_info_from_db(query, (rest_id,))
-    if not details:
-        await update.callback_query.edit_message_text(translate_if_needed("Restaurant details not found.", lang), parse_mode=ParseMode.HTML)
+    card = await item_cards.get("attractions", attr_id, lang)
+    if card is None:
+        await update.callback_query.edit_message_text(await translate_ui("Attraction details not found.", lang), parse_mode=ParseMode.HTML)
         return
-    
-    rest = details[0]
-    name = safe_field(rest[0])       # Не переводим название
-    description = safe_field(rest[1])
-    address = safe_field(rest[2])    # Не переводим адрес
-    phone = safe_field(rest[3])
-    website = safe_field(rest[4])
-    extra_info = safe_field(rest[5])
+    await send_card(update.callback_query.message, card, context)
+
+async def render_rest_card(snapshot, rest, lang: str) -> Card:
+    suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
+    name = safe_field(getattr(rest, f"name{suffix}"))       # Не переводим название
+    description = safe_field(getattr(rest, f"description{suffix}"))
+    address = safe_field(getattr(rest, f"address{suffix}"))    # Не переводим адрес
+    phone = safe_field(rest.phone)
+    website = safe_field(getattr(rest, f"website{suffix}"))
+    extra_info = safe_field(getattr(rest, f"extra_info{suffix}"))
     
     # Перевод только описательных полей, если язык не en или es
     if lang not in ["en", "es"]:
-        description = get_cached_translation(context, "restaurants", rest_id, "description", lang, description)
-        extra_info = get_cached_translation(context, "restaurants", rest_id, "extra_info", lang, extra_info)
+        description = await get_cached_translation("restaurants", rest.id, "description", lang, description)
+        extra_info = await get_cached_translation("restaurants", rest.id, "extra_info", lang, extra_info)
     
     formatted_address = format_address(address)
     phone_link = format_phone_number(phone)
@@ -1356,16 +1620,29 @@ async def handle_rest_callback(rest_id: int, update: Update, context: ContextTyp
                  f"<b>Phone/WhatsApp:</b> <i>{phone_link}</i>\n\n"
                  f"<b>Website/Social:</b> <i>{website}</i>\n\n"
                  f"<b>Details:</b> <i>{extra_info}</i>\n\n")
-    image_url = safe_field(rest[6])
-    if not image_url:
-        await update.callback_query.message.reply_text(formatted, parse_mode=ParseMode.HTML)
-    else:
-        await safe_reply_photo(update.callback_query.message, image_url, formatted, ParseMode.HTML, context)
+    image_url = safe_field(getattr(rest, f"mainimage{suffix}"))
+    return make_card(formatted, image_url or None)
+
+async def handle_rest_callback(rest_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    lang = context.user_data.get("lang", "en")
+    card = await item_cards.get("restaurants", rest_id, lang)
+    if card is None:
+        await update.callback_query.edit_message_text(await translate_ui("Restaurant details not found.", lang), parse_mode=ParseMode.HTML)
+        return
+    await send_card(update.callback_query.message, card, context)
+
+# Готовые карточки по (раздел, id, язык); устаревают вместе с исходной строкой снимка
+item_cards = CardCache(
+    {"tours": render_tour_card, "accommodation": render_accom_card,
+     "attractions": render_attr_card, "restaurants": render_rest_card},
+    lambda: content_store.snapshot,
+)
 
 # ==================== Функция поиска ресторанов через Nominatim (используется только при текстовом промте) ====================
-def search_restaurants_osm(query, city="San Cristóbal de las Casas, Chiapas, Mexico", limit=5):
+async def search_restaurants_osm(query, city=DEFAULT_CITY, limit=5):
+    # Центр города и результаты поиска берутся из кэша геокодера; запросы к Nominatim идут не чаще 1 в секунду
     try:
-        location = osm_geolocator.geocode(city)
+        location = await geocoder.locate(city)
         if not location:
             logger.error("Could not geocode the city")
             return None
@@ -1373,10 +1650,9 @@ def search_restaurants_osm(query, city="San Cristóbal de las Casas, Chiapas, Me
         lon = location.longitude
         lat_offset = 0.05
         lon_offset = 0.05
-        # Формируем viewbox как строку в правильном порядке: (left, top, right, bottom)
-        viewbox_str = f"{lon - lon_offset},{lat + lat_offset},{lon + lon_offset},{lat - lat_offset}"
-        results = osm_geolocator.geocode(query, exactly_one=False, limit=limit, viewbox=viewbox_str, bounded=True)
-        return results
+        # Область поиска задаётся двумя противоположными углами
+        viewbox = ((lat - lat_offset, lon - lon_offset), (lat + lat_offset, lon + lon_offset))
+        return await geocoder.search(query, limit=limit, viewbox=viewbox)
     except Exception as e:
         logger.error(f"OSM search error: {e}")
         return None
@@ -1389,17 +1665,16 @@ async def restaurants_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     lang = context.user_data.get("lang", "en")
     # Выбираем суффикс для запроса в зависимости от языка
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT id, name{suffix} FROM restaurants"
-    restaurants = get_info_from_db(query)
+    restaurants = content_store.snapshot.select("restaurants", "id", f"name{suffix}")
     if not restaurants:
         await update.message.reply_text(
-            translate_if_needed("No restaurant data found in the database.", lang),
+            await translate_ui("No restaurant data found in the database.", lang),
             reply_markup=get_persistent_menu(lang),
             parse_mode=ParseMode.HTML
         )
         return
-    banner_url = get_banner("restaurants")
-    caption = translate_if_needed("Select a restaurant to get more details.", lang)
+    banner_url = await get_banner("restaurants")
+    caption = await translate_ui("Select a restaurant to get more details.", lang)
     inline_keyboard = get_list_inline_keyboard(restaurants, "rest", lang)
     if banner_url:
         await safe_reply_photo(update.message, banner_url, caption, ParseMode.HTML, context, inline_keyboard)
@@ -1413,11 +1688,10 @@ async def advices_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """
     lang = context.user_data.get("lang", "en")
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT category{suffix}, advice_text{suffix} FROM advices"
-    advices = get_info_from_db(query)
+    advices = content_store.snapshot.select("advices", f"category{suffix}", f"advice_text{suffix}")
     if not advices:
         await update.message.reply_text(
-            translate_if_needed("No advices data found in the database.", lang),
+            await translate_ui("No advices data found in the database.", lang),
             reply_markup=get_persistent_menu(lang),
             parse_mode=ParseMode.HTML
         )
@@ -1427,7 +1701,7 @@ async def advices_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         category = safe_field(advice[0])
         advice_text = safe_field(advice[1])
         response += f"<b>{i}. {category}</b>\n\n<i>{advice_text}</i>\n\n"
-    await update.message.reply_text(response, parse_mode=ParseMode.HTML, reply_markup=get_persistent_menu(lang))
+    await send_long_message(update.message, response, ParseMode.HTML, get_persistent_menu(lang))
 
 
 async def faq_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1437,11 +1711,10 @@ async def faq_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     """
     lang = context.user_data.get("lang", "en")
     suffix = "_en" if lang.lower() in ["en", "english"] else "_es"
-    query = f"SELECT question{suffix}, answer{suffix} FROM faq"
-    faqs = get_info_from_db(query)
+    faqs = content_store.snapshot.select("faq", f"question{suffix}", f"answer{suffix}")
     if not faqs:
         await update.message.reply_text(
-            translate_if_needed("No FAQ data found in the database.", lang),
+            await translate_ui("No FAQ data found in the database.", lang),
             reply_markup=get_persistent_menu(lang),
             parse_mode=ParseMode.HTML
         )
@@ -1451,7 +1724,7 @@ async def faq_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         question = safe_field(faq[0])
         answer = safe_field(faq[1])
         response += f"<b>{i}. Q: {question}</b>\n\n<i>A:</i> <i>{answer}</i>\n\n"
-    await update.message.reply_text(response, parse_mode=ParseMode.HTML, reply_markup=get_persistent_menu(lang))
+    await send_long_message(update.message, response, ParseMode.HTML, get_persistent_menu(lang))
 
 
 async def events_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1493,7 +1766,7 @@ async def translate_last_answer(update: Update, context: ContextTypes.DEFAULT_TY
 
         # Защищаем специальные теги, переводим и восстанавливаем их
         protected_text, placeholders = protect_names(last_answer)
-        translated_text = translate_if_needed(protected_text, target_lang)
+        translated_text = await translate_if_needed(protected_text, target_lang)
         final_answer = restore_names(translated_text, placeholders)
         
         try:
@@ -1512,6 +1785,7 @@ async def translate_last_answer(update: Update, context: ContextTypes.DEFAULT_TY
 # ==================== Изменённый обработчик текстовых сообщений ====================
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await mark_chat_activity(str(update.effective_chat.id), context)
     text = update.message.text.strip()
     text_lower = text.lower()
 
@@ -1526,9 +1800,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         "events": events_command
     }
 
-    if text_lower in commands:
-        lang = context.user_data.get("lang", "en")
-        await commands[text_lower](update, context)
+    # Кнопки меню на языке пользователя сопоставляем с разделом по каталогу переводов
+    section = text_lower if text_lower in commands else menu_section_for(text)
+    if section in commands:
+        await commands[section](update, context)
         return
     
     weather_keywords = {"weather", "погода", "forecast", "прогноз", "tiempo", "météo", "wetter"}
@@ -1542,15 +1817,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if text_lower.startswith("osm:"):
         osm_query = text[4:].strip()
-        results = search_restaurants_osm(osm_query, city="San Cristóbal de las Casas, Chiapas, Mexico", limit=5)
+        results = await search_restaurants_osm(osm_query, limit=5)
         lang = context.user_data.get("lang", "en")
         if results:
             response = "Aquí hay algunos restaurantes encontrados via OSM:\n\n" if lang.lower() in ["es", "spanish"] else "Here are some restaurants found via OSM:\n\n"
             for idx, place in enumerate(results, start=1):
                 response += f"{idx}. {place.address}\nCoordinates: ({float(place.latitude):.5f}, {float(place.longitude):.5f})\n\n"
         else:
-            response = translate_if_needed("No restaurant data found via OSM.", lang)
-        await update.message.reply_text(response, parse_mode=ParseMode.HTML, reply_markup=get_persistent_menu(lang))
+            response = await translate_ui("No restaurant data found via OSM.", lang)
+        await send_long_message(update.message, response, ParseMode.HTML, get_persistent_menu(lang))
         return
 
     if "переведи" in text_lower or "translate" in text_lower:
@@ -1559,7 +1834,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     chat_id = str(update.effective_chat.id)
     user_id = str(update.effective_user.id)
-    save_message_to_db(chat_id, user_id, "user", text)
+    await save_message_to_db(chat_id, user_id, "user", text)
 
     if "recent_messages" not in context.chat_data:
         context.chat_data["recent_messages"] = []
@@ -1571,42 +1846,41 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     context.chat_data["messages_since_summary"].append(text)
 
     if len(context.chat_data["messages_since_summary"]) >= HISTORY_UPDATE_THRESHOLD:
-        new_summary = update_conversation_summary(chat_id, context.chat_data["messages_since_summary"], context.user_data.get("lang", "en"))
-        context.chat_data["summary"] = new_summary
+        # Сводка обновляется в фоне; промпт читает последнюю записанную в базу сводку
+        await summary_queue.submit(chat_id, context.chat_data["messages_since_summary"], context.user_data.get("lang", "en"))
         context.chat_data["messages_since_summary"] = []
 
     lang = context.user_data.get("lang", "en")
-    detected_lang = language_code_to_target(detect(text)) if detect(text) else lang
+    detected_lang = language_detector.detect(text, default=lang)
 
     # Проверяем, является ли запрос продолжением предыдущего поиска мест
     if detect_more_intent(text) and "places_results" in context.chat_data and "last_places_query" in context.chat_data:
-        results = context.chat_data["places_results"]
+        query = context.chat_data["last_places_query"]
         start_idx = context.chat_data["places_shown"]
-        end_idx = min(start_idx + 5, len(results))
-        if start_idx >= len(results):
+        # Обычно порция уже подготовлена в фоне (prefetch_next_places_batch); иначе готовим её сейчас
+        batch = await places_prefetch.take(chat_id, (query, start_idx, language_code_to_target(detected_lang)))
+        if batch is None or batch["answer"] == ANSWER_ERROR_TEXT:
+            batch = await prepare_places_batch(query, context.chat_data["places_results"],
+                                               context.chat_data.get("places_next_page_token"), start_idx, detected_lang)
+        context.chat_data["places_results"] = batch["results"]
+        context.chat_data["places_next_page_token"] = batch["next_page_token"]
+        if batch["answer"] is None:
             await update.message.reply_text(
-                translate_if_needed("No more places to show.", lang),
+                await translate_ui("No more places to show.", lang),
                 parse_mode=ParseMode.HTML,
                 reply_markup=get_persistent_menu(lang)
             )
             return
 
-        current_results = results[start_idx:end_idx]
-        prompt = build_places_prompt(context.chat_data["last_places_query"], {"results": current_results}, lang)
-        prompt += "\n\nDisclaimer: The above information is sourced from Google Places API and may not be verified."
-        answer_raw = generate_answer(prompt, language=detected_lang)
-        answer = validate_html(answer_raw)
+        answer = validate_html(batch["answer"])
         
         logger.debug(f"Sending answer: {answer}")
         try:
-            bot_message = await update.message.reply_text(
-                answer,
-                parse_mode=ParseMode.HTML,
-                reply_markup=get_persistent_menu(lang)
-            )
-            context.chat_data["places_shown"] = end_idx
+            bot_message = await send_long_message(update.message, answer, ParseMode.HTML, get_persistent_menu(lang))
+            context.chat_data["places_shown"] = batch["end"]
             context.chat_data["last_bot_answer"] = answer
             context.chat_data["last_bot_message_id"] = bot_message.message_id
+            prefetch_next_places_batch(chat_id, context, detected_lang)
         except BadRequest as e:  # Используем импортированный BadRequest
             logger.error(f"Failed to send message: {e}, Original text: {answer}")
             fallback_text = "Произошла ошибка при обработке ответа. Попробуйте снова."
@@ -1614,22 +1888,42 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     # Обычная обработка запроса о местах
-    if detect_places_intent(text):
+    is_places, speculative_answer = await detect_places_intent(text, update, context, detected_lang)
+    if is_places:
         await handle_places_query(update, context)
         return
 
-    # Стандартная генерация ответа через OpenAI
-    prompt = build_prompt_with_history(text, update, context)
-    answer_raw = generate_answer(prompt, language=detected_lang)
+    # Стандартная генерация ответа через OpenAI (если ответ ещё не получен спекулятивно)
+    if speculative_answer is not None:
+        answer_raw = speculative_answer
+    elif STREAM_ANSWERS:
+        # Ответ из кэша отправляется сразу целиком, без потоковой генерации
+        target_lang = language_code_to_target(detected_lang)
+        cacheable = answer_cache_allowed(text, context, target_lang)
+        answer_raw = await answer_cache.lookup(text, target_lang) if cacheable else None
+        if answer_raw is None:
+            if cacheable:
+                prompt = build_standalone_prompt(text)
+            else:
+                prompt = await build_prompt_with_history(text, update, context)
+            try:
+                answer, bot_message = await stream_answer(update, prompt, detected_lang, reply_markup=get_persistent_menu(lang))
+                context.chat_data["last_bot_answer"] = answer
+                context.chat_data["last_bot_message_id"] = bot_message.message_id
+                if cacheable and answer != ANSWER_ERROR_TEXT:
+                    await answer_cache.store(text, target_lang, answer)
+            except BadRequest as e:
+                logger.error(f"Failed to send streamed message: {e}")
+                fallback_text = "Произошла ошибка при обработке ответа. Попробуйте снова."
+                await update.message.reply_text(fallback_text, parse_mode=ParseMode.HTML)
+            return
+    else:
+        answer_raw = await generate_general_answer(text, update, context, detected_lang)
     answer = validate_html(answer_raw)
     
     logger.debug(f"Sending answer: {answer}")
     try:
-        bot_message = await update.message.reply_text(
-            answer,
-            parse_mode=ParseMode.HTML,
-            reply_markup=get_persistent_menu(lang)
-        )
+        bot_message = await send_long_message(update.message, answer, ParseMode.HTML, get_persistent_menu(lang))
         context.chat_data["last_bot_answer"] = answer
         context.chat_data["last_bot_message_id"] = bot_message.message_id
     except BadRequest as e:  # Используем импортированный BadRequest
@@ -1637,20 +1931,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         fallback_text = "Произошла ошибка при обработке ответа. Попробуйте снова."
         await update.message.reply_text(fallback_text, parse_mode=ParseMode.HTML)
 
-def build_prompt_with_history(new_query: str, update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
-    chat_id = str(update.effective_chat.id)
-    summary = get_summary_from_db(chat_id)
-    recent_messages = context.chat_data.get("recent_messages", [])
-    history_text = ""
-    if summary:
-        history_text += f"Summary: {summary}\n"
-    if recent_messages:
-        history_text += "\n".join(recent_messages)
-    prompt = f"Conversation history:\n{history_text}\nNow answer the following query: {html.escape(new_query)}"
-    return prompt
-
 # ==================== Обработчик inline callback запросов ====================
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await mark_chat_activity(str(update.effective_chat.id), context)
     query = update.callback_query
     try:
         await query.answer()
@@ -1668,7 +1951,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             if photo_url:
                 bot_message = await safe_reply_photo(query.message, photo_url, description, ParseMode.HTML, context)
             else:
-                bot_message = await send_long_message(update, description, ParseMode.HTML)
+                bot_message = await send_long_message(query.message, description, ParseMode.HTML)
             
             if bot_message:
                 context.chat_data["last_bot_message"] = {"id": bot_message.message_id, "text": description}
@@ -1676,13 +1959,13 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             else:
                 logger.error(f"Failed to send message for place_id {place_id}: bot_message is None")
                 await query.message.reply_text(
-                    translate_if_needed("Sorry, something went wrong while sending the details.", lang),
+                    await translate_ui("Sorry, something went wrong while sending the details.", lang),
                     parse_mode=ParseMode.HTML
                 )
         except Exception as e:
             logger.error(f"Error sending place details for place_id {place_id}: {e}")
             await query.message.reply_text(
-                translate_if_needed("Sorry, an error occurred while fetching the details.", lang),
+                await translate_ui("Sorry, an error occurred while fetching the details.", lang),
                 parse_mode=ParseMode.HTML
             )
     
@@ -1695,7 +1978,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         last_message = context.chat_data.get("last_bot_message", {})
         if last_message.get("id") == int(message_id):
             message_text = last_message.get("text", "Unknown message")  # Полный текст ответа
-            save_feedback_to_db(chat_id, user_id, message_text, rating)
+            await save_feedback_to_db(chat_id, user_id, message_text, rating)
             
             current_markup = query.message.reply_markup
             if current_markup and current_markup.inline_keyboard:
@@ -1704,14 +1987,13 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 await query.edit_message_reply_markup(reply_markup=new_markup)
             
             await query.message.reply_text(
-                translate_if_needed(f"Thank you for your feedback ({rating})!", lang),
+                await translate_ui("Thank you for your feedback (good)!" if rating == "good" else "Thank you for your feedback (bad)!", lang),
                 parse_mode=ParseMode.HTML
             )
         else:
             logger.warning(f"Feedback for message {message_id} not found in context.chat_data")
 
     elif data.startswith("lang:"):
-        # ... (оставляем как есть)
         lang_choice = data.split(":")[1]
         context.user_data["lang"] = lang_choice
         try:
@@ -1720,27 +2002,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             logger.error(f"Error deleting language selection message: {e}")
         chat_id = query.message.chat_id
         user = query.from_user
-        greeting = get_dynamic_greeting(html.escape(user.first_name))
-        if lang_choice.lower() in ["es", "spanish"]:
-            message = (f"{greeting}\n\n"
-                       "Soy tu conserje impulsado por AI para San Cristóbal de las Casas.\n\n"
-                       "Este bot te ayudará a encontrar información detallada sobre tours, alojamiento, atracciones, restaurantes, consejos y eventos en la ciudad. "
-                       "Puedes interactuar mediante los comandos del menú o escribiendo directamente tu consulta. \nPor ejemplo:\n"
-                       "• 'Estoy de viaje con mi pareja y busco un hotel tranquilo fuera del centro.'\n"
-                       "• 'Viajamos en familia; ¿qué actividades recomiendas para niños?'\n\n"
-                       "Para ver ejemplos de uso y aprender a aprovechar todas las funciones, visita: "
-                       "<a href='https://example.com/usage-guide'>Usage Guide</a>\n\n"
-                       "I look forward to helping you explore the city!")
-        else:
-            message = (f"{greeting}\n\n"
-                       "I'm your AI-powered concierge for San Cristóbal de las Casas.\n\n"
-                       "This bot is designed to provide you with detailed information on tours, accommodation, attractions, restaurants, advices, and events in the city. "
-                       "You can interact with the bot using the menu commands or simply type your query.\nFor example:\n"
-                       "• 'I'm traveling with my partner and looking for a quiet hotel away from the center.'\n"
-                       "• 'We're on a family trip; what activities do you recommend for children?'\n\n"
-                       "For usage examples and to learn how to make the most of all the features, visit: "
-                       "<a href='https://example.com/usage-guide'>Usage Guide</a>\n\n"
-                       "I look forward to helping you explore the city!")
+        message = await build_welcome_message(lang_choice, user.first_name)
         await context.bot.send_message(chat_id=chat_id,
                                        text=message,
                                        parse_mode=ParseMode.HTML,
@@ -1755,42 +2017,109 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             tour_id = int(data.split("tour:")[1])
             await handle_tour_callback(tour_id, update, context)
         except ValueError:
-            await query.edit_message_text(translate_if_needed("Invalid tour identifier.", lang), parse_mode=ParseMode.HTML)
+            await query.edit_message_text(await translate_ui("Invalid tour identifier.", lang), parse_mode=ParseMode.HTML)
     elif data.startswith("accom:"):
         try:
             accom_id = int(data.split("accom:")[1])
             await handle_accom_callback(accom_id, update, context)
         except ValueError:
-            await query.edit_message_text(translate_if_needed("Invalid accommodation identifier.", lang), parse_mode=ParseMode.HTML)
+            await query.edit_message_text(await translate_ui("Invalid accommodation identifier.", lang), parse_mode=ParseMode.HTML)
     elif data.startswith("attr:"):
         try:
             attr_id = int(data.split("attr:")[1])
             await handle_attr_callback(attr_id, update, context)
         except ValueError:
-            await query.edit_message_text(translate_if_needed("Invalid attraction identifier.", lang), parse_mode=ParseMode.HTML)
+            await query.edit_message_text(await translate_ui("Invalid attraction identifier.", lang), parse_mode=ParseMode.HTML)
     elif data.startswith("rest:"):
         try:
             rest_id = int(data.split("rest:")[1])
             await handle_rest_callback(rest_id, update, context)
         except ValueError:
-            await query.edit_message_text(translate_if_needed("Invalid restaurant identifier.", lang), parse_mode=ParseMode.HTML)
+            await query.edit_message_text(await translate_ui("Invalid restaurant identifier.", lang), parse_mode=ParseMode.HTML)
     else:
-        await query.edit_message_text(translate_if_needed("Invalid callback data received.", lang), parse_mode=ParseMode.HTML)
+        await query.edit_message_text(await translate_ui("Invalid callback data received.", lang), parse_mode=ParseMode.HTML)
 
 # ==================== Обработчик ошибок ====================
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     lang = get_user_lang(context)
     error_message = "An unexpected error occurred. Please try again later."
-    error_message_translated = translate_if_needed(error_message, lang)
+    error_message_translated = await translate_ui(error_message, lang)
     
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
     if update and update.effective_message:
         await update.effective_message.reply_text(error_message_translated, parse_mode=ParseMode.HTML)
 
+# ==================== Служебные команды администратора ====================
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Метрики доступны только из чата администратора
+    if not admin_chat_id or str(update.effective_chat.id) != str(admin_chat_id):
+        return
+    # Метрик много: снимок делится по строкам на сообщения в пределах лимита Telegram, каждое в своём <pre>
+    text = html.escape(metrics.format_snapshot())
+    for chunk in chunk_html(text, TELEGRAM_MAX_MESSAGE_LENGTH - len("<pre></pre>")) or [text]:
+        await update.message.reply_text(f"<pre>{chunk}</pre>", parse_mode=ParseMode.HTML)
+
+# ==================== Жизненный цикл приложения ====================
+def run_in_background(coro, name: str) -> asyncio.Task:
+    # Храним ссылки на фоновые задачи, чтобы сборщик мусора не удалил их до завершения
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def on_content_reload(snapshot) -> None:
+    # Карточки изменённых строк удаляем сразу, недостающие строим в фоне
+    item_cards.invalidate(snapshot)
+    run_in_background(item_cards.prerender(CARD_PRERENDER_LANGUAGES), "prerender-cards")
+
+async def on_startup(app) -> None:
+    # Фоновые задачи запускаются внутри работающего event loop приложения
+    history_writer.start()
+    summary_queue.start()
+    places_intent.load()
+    await run_blocking(token_counter.load)
+    await answer_cache.load()
+    content_store.add_listener(on_content_reload)
+    await content_store.reload()
+    run_in_background(content_store.watch(), "content-watch")
+    await places_cache.purge_expired()
+    await place_details_cache.purge_expired()
+    await translation_cache.purge_expired()
+    await translation_cache.trim(TRANSLATION_CACHE_MAX_ENTRIES)
+    await forecast_cache.purge_expired()
+    await geocode_cache.purge_expired()
+    run_in_background(warm_places_cache(), "warm-places-cache")
+    run_in_background(forecast_prefetch_loop(), "forecast-prefetch")
+
+async def on_shutdown(app) -> None:
+    # Сначала останавливаем фоновые задачи и дописываем отложенные записи, затем закрываем клиентов и соединения
+    for task in list(background_tasks):
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await summary_queue.stop()
+    await places_prefetch.stop()
+    await geocoder.stop()
+    await history_writer.stop()
+    ui_catalogue.flush()
+    await close_clients()
+    content_store.close()
+    main_db.close()
+    history_db.close()
+    cache_db.close()
+
 # ==================== Основная функция запуска бота ====================
 async def main():
     set_wal_mode()
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    run_migrations()
+    load_catalogue(ui_catalogue)
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start_command))
     app.add_handler(CommandHandler("reset", reset_command))
     app.add_handler(CommandHandler("place", handle_place_command, filters=filters.Regex(r'^/place_')))  # Новый обработчик
@@ -1809,6 +2138,7 @@ async def main():
     app.add_handler(CommandHandler("advices", advices_command))
     app.add_handler(CommandHandler("faq", faq_command))
     app.add_handler(CommandHandler("events", events_command))
+    app.add_handler(CommandHandler("stats", stats_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(CallbackQueryHandler(button_handler))
     app.add_error_handler(error_handler)
@@ -0,0 +1,175 @@
+"""
+Двухуровневый кэш: LRU в памяти процесса перед постоянным хранилищем в SQLite (cache.db).
+
+Значения сериализуются в JSON и хранятся с временем записи и временем истечения. Каждый кэш
+работает в своём пространстве имён таблицы cache_entries и ведёт счётчики попаданий/промахов
+в metrics (<name>.hits_memory, <name>.hits_disk, <name>.misses).
+
+Версия кэша входит в ключ: при изменении формата значений достаточно увеличить version, и старые
+записи перестанут читаться (purge_expired удалит их из SQLite). Если задан
+max_stale, истёкшие записи ещё столько секунд доступны через get_entry(allow_stale=True) для схемы
+stale-while-revalidate.
+"""
+import json
+import time
+import logging
+from collections import OrderedDict, namedtuple
+from typing import Any, Optional
+
+import metrics
+from db import Database
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CacheEntry = namedtuple("CacheEntry", "value stored_at expires_at")
+
+
+class LRUCache:
+    """Ограниченный по размеру словарь с вытеснением давно не использованных ключей."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            self._data.move_to_end(key)
+            return self._data[key]
+        except KeyError:
+            return default
+
+    def set(self, key, value) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TieredCache:
+    """LRU в памяти + таблица cache_entries в SQLite с TTL."""
+
+    def __init__(self, name: str, database: Database, ttl: float, maxsize: int = 1024,
+                 version: int = 1, max_stale: float = 0):
+        self.name = name
+        self.database = database
+        self.ttl = ttl
+        self.version = version
+        self.max_stale = max_stale
+        self.memory = LRUCache(maxsize)
+        metrics.register_gauge(f"{name}.memory_entries", lambda: len(self.memory))
+
+    def _full_key(self, key: str) -> str:
+        return f"v{self.version}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Возвращает значение, если оно есть и не истекло, иначе None."""
+        entry = await self.get_entry(key)
+        return entry.value if entry is not None else None
+
+    async def get_entry(self, key: str, allow_stale: bool = False) -> Optional[CacheEntry]:
+        """
+        Возвращает запись кэша. С allow_stale=True возвращает и истёкшую запись, если она
+        просрочена не более чем на max_stale секунд (проверяйте entry.expires_at).
+        """
+        now = time.time()
+        horizon = self.max_stale if allow_stale else 0
+        full_key = self._full_key(key)
+        entry = self.memory.get(full_key)
+        if entry is not None and entry.expires_at + horizon > now:
+            metrics.inc(f"{self.name}.hits_memory")
+            return entry
+        entry = await self._load(full_key)
+        if entry is not None and entry.expires_at + horizon > now:
+            self.memory.set(full_key, entry)
+            metrics.inc(f"{self.name}.hits_disk")
+            return entry
+        metrics.inc(f"{self.name}.misses")
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        key = self._full_key(key)
+        entry = CacheEntry(value, now, now + (self.ttl if ttl is None else ttl))
+        self.memory.set(key, entry)
+        try:
+            await self.database.execute(
+                "INSERT INTO cache_entries (namespace, key, value, stored_at, expires_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, "
+                "stored_at = excluded.stored_at, expires_at = excluded.expires_at",
+                (self.name, key, json.dumps(value, ensure_ascii=False), entry.stored_at, entry.expires_at)
+            )
+        except Exception as e:
+            logger.error(f"Cache '{self.name}' write error: {e}")
+
+    async def contains(self, key: str) -> bool:
+        """Проверяет наличие актуального значения, не влияя на счётчики попаданий."""
+        now = time.time()
+        key = self._full_key(key)
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = await self._load(key)
+        return entry is not None and entry.expires_at > now
+
+    async def delete_prefix(self, prefix: str, keep_key: Optional[str] = None) -> int:
+        """Удаляет записи, ключ которых начинается с prefix (кроме keep_key)."""
+        full_prefix = self._full_key(prefix)
+        keep = self._full_key(keep_key) if keep_key is not None else None
+        for key in [k for k in self.memory._data if k.startswith(full_prefix) and k != keep]:
+            self.memory.pop(key)
+        try:
+            return await self.database.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND substr(key, 1, ?) = ? AND key != ?",
+                (self.name, len(full_prefix), full_prefix, keep or "")
+            )
+        except Exception as e:
+            logger.error(f"Cache '{self.name}' delete error: {e}")
+            return 0
+
+    async def trim(self, max_entries: int) -> int:
+        """Оставляет в SQLite не больше max_entries самых свежих записей пространства имён."""
+        try:
+            return await self.database.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.name, self.name, max_entries)
+            )
+        except Exception as e:
+            logger.error(f"Cache '{self.name}' trim error: {e}")
+            return 0
+
+    async def _load(self, key: str) -> Optional[CacheEntry]:
+        try:
+            row = await self.database.fetch_one(
+                "SELECT value, stored_at, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.name, key)
+            )
+        except Exception as e:
+            logger.error(f"Cache '{self.name}' read error: {e}")
+            return None
+        if row is None:
+            return None
+        return CacheEntry(json.loads(row[0]), row[1], row[2])
+
+    async def purge_expired(self) -> int:
+        """Удаляет из SQLite истёкшие записи (с учётом max_stale) и записи прежних версий."""
+        try:
+            return await self.database.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND (expires_at <= ? OR key NOT LIKE ?)",
+                (self.name, time.time() - self.max_stale, f"v{self.version}:%")
+            )
+        except Exception as e:
+            logger.error(f"Cache '{self.name}' purge error: {e}")
+            return 0
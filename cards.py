@@ -0,0 +1,97 @@
+"""
+Готовые карточки элементов каталога (тур, жильё, достопримечательность, ресторан) по (раздел, id, язык).
+
+Карточка — окончательный результат рендеринга: подпись к фото (не длиннее лимита подписи
+Telegram), сообщения-продолжения и выбранное изображение. Обработчик нажатия только берёт карточку
+из словаря и отправляет её.
+
+Вместе с карточкой хранится её источник — строка снимка main.db и баннер раздела. После
+подмены снимка (ContentStore) invalidate() удаляет карточки, источник которых изменился или
+исчез, а prerender() заново строит карточки для всех строк и заданных языков.
+"""
+import logging
+from collections import namedtuple
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+import metrics
+from content import ContentSnapshot
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# caption — подпись к фото (или первое сообщение, если фото нет), overflow — кортеж сообщений-продолжений
+Card = namedtuple("Card", "caption overflow photo")
+
+CardRenderer = Callable[[ContentSnapshot, tuple, str], Awaitable[Card]]
+
+
+class CardCache:
+    """Словарь готовых карточек с инвалидацией по изменению исходной строки."""
+
+    def __init__(self, renderers: Dict[str, CardRenderer], snapshot_getter: Callable[[], ContentSnapshot]):
+        self.renderers = renderers
+        self.snapshot_getter = snapshot_getter
+        self._cards: Dict[Tuple[str, int, str], Tuple[tuple, Card]] = {}
+        metrics.register_gauge("cards.entries", lambda: len(self._cards))
+
+    @staticmethod
+    def _source(snapshot: ContentSnapshot, entity: str, item_id: int) -> Optional[tuple]:
+        row = snapshot.get(entity, item_id)
+        if row is None:
+            return None
+        return (row, snapshot.banner(entity))
+
+    async def get(self, entity: str, item_id: int, lang: str) -> Optional[Card]:
+        """Карточка из словаря; при промахе или устаревшем источнике — рендер и сохранение."""
+        snapshot = self.snapshot_getter()
+        source = self._source(snapshot, entity, item_id)
+        if source is None:
+            return None
+        key = (entity, item_id, lang)
+        cached = self._cards.get(key)
+        if cached is not None and cached[0] == source:
+            metrics.inc("cards.hits")
+            return cached[1]
+        return await self._render(snapshot, key, source)
+
+    async def _render(self, snapshot: ContentSnapshot, key: Tuple[str, int, str], source: tuple) -> Card:
+        entity, _, lang = key
+        with metrics.timer("cards.render_seconds"):
+            card = await self.renderers[entity](snapshot, source[0], lang)
+        metrics.inc("cards.renders")
+        self._cards[key] = (source, card)
+        return card
+
+    def invalidate(self, snapshot: ContentSnapshot) -> int:
+        """Удаляет карточки, исходная строка или баннер которых в новом снимке другие."""
+        stale = [
+            key for key, (source, _) in self._cards.items()
+            if self._source(snapshot, key[0], key[1]) != source
+        ]
+        for key in stale:
+            del self._cards[key]
+        if stale:
+            metrics.inc("cards.invalidated", len(stale))
+            logger.info(f"Invalidated {len(stale)} item cards after content change.")
+        return len(stale)
+
+    async def prerender(self, languages: Iterable[str]) -> int:
+        """Строит недостающие карточки для всех строк каталога и указанных языков."""
+        snapshot = self.snapshot_getter()
+        rendered = 0
+        for lang in languages:
+            for entity in self.renderers:
+                for row in snapshot.rows(entity):
+                    key = (entity, row.id, lang)
+                    source = self._source(snapshot, entity, row.id)
+                    cached = self._cards.get(key)
+                    if cached is not None and cached[0] == source:
+                        continue
+                    try:
+                        await self._render(snapshot, key, source)
+                        rendered += 1
+                    except Exception as e:
+                        logger.error(f"Error pre-rendering card {key}: {e}")
+        if rendered:
+            logger.info(f"Pre-rendered {rendered} item cards.")
+        return rendered
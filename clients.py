@@ -0,0 +1,102 @@
+"""
+Асинхронный клиентский слой для внешних API.
+
+Все сетевые вызовы бота (OpenAI, Google Places, OpenWeather, переводчик) идут через этот модуль,
+чтобы ни один обработчик не блокировал event loop: OpenAI вызывается через AsyncOpenAI,
+HTTP-запросы — через общий пул соединений httpx.AsyncClient, а синхронные сторонние
+библиотеки (deep_translator, geopy) выполняются в пуле потоков.
+"""
+import os
+import asyncio
+import logging
+from typing import AsyncIterator, Tuple
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Таймауты и размер пула HTTP-соединений
+HTTP_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+OPENAI_TIMEOUT = 60.0
+OPENAI_MAX_RETRIES = 2
+
+_openai_client = None
+_http_client = None
+
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    """Возвращает общий асинхронный клиент OpenAI (создаётся при первом обращении)."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+        )
+    return _openai_client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент с пулом keep-alive соединений."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return _http_client
+
+
+async def chat_completion(messages: list, model: str = "gpt-4o-mini", temperature: float = 0.1, **kwargs):
+    """Асинхронный вызов chat.completions.create; исключения пробрасываются вызывающему коду."""
+    return await get_openai_client().chat.completions.create(
+        model=model,
+        temperature=temperature,
+        messages=messages,
+        **kwargs
+    )
+
+
+async def chat_completion_stream(messages: list, model: str = "gpt-4o-mini", temperature: float = 0.1,
+                                 **kwargs) -> AsyncIterator[str]:
+    """Потоковый вызов chat.completions.create: отдаёт фрагменты текста ответа по мере генерации."""
+    stream = await get_openai_client().chat.completions.create(
+        model=model,
+        temperature=temperature,
+        messages=messages,
+        stream=True,
+        **kwargs
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def http_get_json(url: str, params: dict) -> Tuple[int, dict, str]:
+    """
+    Выполняет GET-запрос через общий пул соединений.
+    Возвращает кортеж (status_code, json, text); json пустой, если тело не удалось разобрать.
+    """
+    response = await get_http_client().get(url, params=params)
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    return response.status_code, data, response.text
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполняет блокирующую функцию стороннего пакета в пуле потоков, не блокируя event loop."""
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def close_clients() -> None:
+    """Закрывает общие клиенты при остановке бота."""
+    global _openai_client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+    logger.info("Async clients closed.")
@@ -0,0 +1,174 @@
+"""
+Снимок контента main.db в памяти процесса.
+
+Таблицы разделов (туры, жильё, достопримечательности, рестораны, советы, FAQ, события) и баннеры
+маленькие и почти не меняются, поэтому при старте они целиком читаются в неизменяемый снимок:
+строки — namedtuple, индексы по id — обычные словари, которые после построения не изменяются.
+Обработчики меню читают только снимок и не обращаются к SQLite.
+
+ContentStore раз в poll_interval секунд проверяет PRAGMA data_version (меняется после коммита
+любого другого соединения, в том числе внешнего редактора базы) и mtime/inode файла (замена
+файла целиком). При изменении новый снимок строится в потоке и подменяет старый одним
+присваиванием; обработчики, уже получившие старый снимок, дочитывают его без изменений.
+"""
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CONTENT_TABLES = ("tours", "accommodation", "attractions", "restaurants", "advices", "faq", "events")
+DEFAULT_POLL_INTERVAL = 5.0
+
+
+class ContentSnapshot:
+    """Неизменяемый снимок таблиц контента и баннеров."""
+
+    __slots__ = ("version", "loaded_at", "_rows", "_by_id", "_banners")
+
+    def __init__(self, tables: Dict[str, Tuple[tuple, ...]], banners: Dict[str, str], version: Any = None):
+        self.version = version
+        self.loaded_at = time.time()
+        self._rows = MappingProxyType(dict(tables))
+        self._by_id = MappingProxyType({
+            name: MappingProxyType({row.id: row for row in rows if hasattr(row, "id")})
+            for name, rows in tables.items()
+        })
+        self._banners = MappingProxyType(dict(banners))
+
+    def rows(self, table: str) -> Tuple[tuple, ...]:
+        return self._rows.get(table, ())
+
+    def get(self, table: str, row_id: int) -> Optional[tuple]:
+        return self._by_id.get(table, {}).get(row_id)
+
+    def select(self, table: str, *columns: str, row_id: Optional[int] = None) -> List[tuple]:
+        """Аналог SELECT columns FROM table [WHERE id = row_id] по снимку."""
+        if row_id is not None:
+            row = self.get(table, row_id)
+            rows: Iterable[tuple] = (row,) if row is not None else ()
+        else:
+            rows = self.rows(table)
+        return [tuple(getattr(row, column) for column in columns) for row in rows]
+
+    def banner(self, section: str) -> Optional[str]:
+        return self._banners.get(section)
+
+
+class ContentStore:
+    """Держит актуальный ContentSnapshot и подменяет его при изменении базы."""
+
+    def __init__(self, path: str, tables: Tuple[str, ...] = CONTENT_TABLES,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.path = path
+        self.tables = tables
+        self.poll_interval = poll_interval
+        self.snapshot = ContentSnapshot({}, {})
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_lock = threading.Lock()
+        self._file_id: Optional[tuple] = None
+        self._data_version: Optional[int] = None
+        self._listeners: List[Callable[[ContentSnapshot], None]] = []
+        metrics.register_gauge("content.snapshot_age_seconds", lambda: round(time.time() - self.snapshot.loaded_at))
+
+    # ---------- Работа с базой (выполняется в потоке) ----------
+    def _file_stat(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA query_only=ON;")
+        return self._conn
+
+    def _changed_sync(self) -> bool:
+        with self._conn_lock:
+            file_id = self._file_stat()
+            if file_id is not None and self._file_id is not None and file_id[0] != self._file_id[0]:
+                # Файл заменён целиком — переоткрываем соединение
+                self._close_sync()
+            data_version = self._connection().execute("PRAGMA data_version;").fetchone()[0]
+            return file_id != self._file_id or data_version != self._data_version
+
+    def _load_sync(self) -> ContentSnapshot:
+        with self._conn_lock:
+            file_id = self._file_stat()
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version;").fetchone()[0]
+            tables = {}
+            # Все таблицы читаются одной транзакцией, чтобы снимок был согласованным
+            conn.execute("BEGIN;")
+            try:
+                for table in self.tables:
+                    tables[table] = self._read_table(conn, table)
+                banners = {}
+                for section, url in conn.execute("SELECT section, banner_url FROM banners ORDER BY id"):
+                    banners.setdefault(section, url)
+            except sqlite3.Error as e:
+                logger.error(f"Error reading banners from {self.path}: {e}")
+                banners = {}
+            finally:
+                conn.execute("COMMIT;")
+            self._file_id = file_id
+            self._data_version = data_version
+        return ContentSnapshot(tables, banners, version=(file_id, data_version))
+
+    def _read_table(self, conn: sqlite3.Connection, table: str) -> Tuple[tuple, ...]:
+        try:
+            cursor = conn.execute(f"SELECT * FROM {table} ORDER BY id")
+        except sqlite3.Error as e:
+            logger.error(f"Error reading table {table} from {self.path}: {e}")
+            return ()
+        row_type = namedtuple(f"{table.title()}Row", [column[0] for column in cursor.description])
+        return tuple(row_type(*row) for row in cursor.fetchall())
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- Асинхронный API ----------
+    def add_listener(self, callback: Callable[[ContentSnapshot], None]) -> None:
+        """Регистрирует функцию, вызываемую с новым снимком сразу после подмены."""
+        self._listeners.append(callback)
+
+    async def reload(self) -> ContentSnapshot:
+        with metrics.timer("content.load_seconds"):
+            snapshot = await asyncio.to_thread(self._load_sync)
+        self.snapshot = snapshot
+        metrics.inc("content.reloads")
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Content listener error: {e}")
+        logger.info(f"Content snapshot loaded from {self.path}: "
+                    + ", ".join(f"{name}={len(snapshot.rows(name))}" for name in self.tables))
+        return snapshot
+
+    async def watch(self) -> None:
+        """Фоновая проверка изменений базы; при изменении строит и подменяет снимок."""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if await asyncio.to_thread(self._changed_sync):
+                    await self.reload()
+            except Exception as e:
+                logger.error(f"Content watch error: {e}")
+
+    def close(self) -> None:
+        with self._conn_lock:
+            self._close_sync()
@@ -0,0 +1,270 @@
+"""
+Доступ к SQLite через долгоживущие соединения.
+
+Для каждой базы держится одно соединение-писатель и небольшой пул соединений-читателей (WAL
+позволяет читать параллельно с записью). Соединения не пересоздаются на каждый запрос, поэтому
+скомпилированные выражения переиспользуются из кэша sqlite3 (cached_statements). Все запросы
+выполняются в отдельном пуле потоков базы, чтобы не блокировать event loop.
+"""
+import queue
+import sqlite3
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_READERS = 4
+# Размер кэша подготовленных выражений на соединение
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_SECONDS = 10
+
+
+class Database:
+    """Один писатель и пул читателей для файла SQLite; синхронные методы + async-обёртки."""
+
+    def __init__(self, path: str, readers: int = DEFAULT_READERS):
+        self.path = path
+        self.readers = readers
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.Lock()
+        self._reader_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_count_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=readers + 1, thread_name_prefix=f"sqlite-{path}")
+        self._closed = False
+
+    # ---------- Соединения ----------
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False,  # соединение используется потоками пула, но только одним одновременно
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        if readonly:
+            conn.execute("PRAGMA query_only=ON;")
+        else:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            self._writer = self._connect()
+            logger.info(f"SQLite writer connection opened for {self.path} (WAL).")
+        return self._writer
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._reader_pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._reader_count_lock:
+            if self._reader_count < self.readers:
+                self._reader_count += 1
+                return self._connect(readonly=True)
+        return self._reader_pool.get()
+
+    def _release_reader(self, conn: sqlite3.Connection) -> None:
+        self._reader_pool.put(conn)
+
+    def set_wal_mode(self) -> None:
+        """Открывает соединение-писатель, переключая базу в режим WAL."""
+        with self._writer_lock:
+            self._get_writer()
+
+    # ---------- Синхронный API (выполняется в потоках пула) ----------
+    def fetch_all_sync(self, query: str, params: Iterable[Any] = ()) -> List[tuple]:
+        conn = self._acquire_reader()
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            self._release_reader(conn)
+
+    def fetch_one_sync(self, query: str, params: Iterable[Any] = ()) -> Optional[tuple]:
+        conn = self._acquire_reader()
+        try:
+            return conn.execute(query, params).fetchone()
+        finally:
+            self._release_reader(conn)
+
+    def execute_sync(self, query: str, params: Iterable[Any] = ()) -> int:
+        """Выполняет запись в отдельной транзакции; возвращает rowcount."""
+        with self._writer_lock:
+            conn = self._get_writer()
+            with conn:
+                return conn.execute(query, params).rowcount
+
+    def execute_many_sync(self, query: str, seq_of_params: Iterable[Iterable[Any]]) -> int:
+        with self._writer_lock:
+            conn = self._get_writer()
+            with conn:
+                return conn.executemany(query, seq_of_params).rowcount
+
+    def execute_batch_sync(self, statements: List[Tuple[str, Iterable[Any]]]) -> int:
+        """Выполняет набор записей одной транзакцией; подряд идущие одинаковые запросы — через executemany."""
+        with self._writer_lock:
+            conn = self._get_writer()
+            with conn:
+                group_query, group_params = None, []
+                for query, params in statements + [(None, None)]:
+                    if query != group_query and group_params:
+                        conn.executemany(group_query, group_params)
+                        group_params = []
+                    group_query = query
+                    if query is not None:
+                        group_params.append(params)
+        return len(statements)
+
+    # ---------- Миграции схемы ----------
+    def migrate(self, migrations: List[Tuple[int, str, str]]) -> int:
+        """
+        Применяет миграции (version, description, sql) с версией выше PRAGMA user_version.
+        Каждая миграция выполняется в своей транзакции вместе с обновлением user_version.
+        Возвращает итоговую версию схемы.
+        """
+        with self._writer_lock:
+            conn = self._get_writer()
+            current = conn.execute("PRAGMA user_version;").fetchone()[0]
+            for version, description, sql in sorted(migrations):
+                if version <= current:
+                    continue
+                logger.info(f"Applying migration {version} to {self.path}: {description}")
+                try:
+                    conn.executescript(f"BEGIN;\n{sql}\nPRAGMA user_version = {int(version)};\nCOMMIT;")
+                except Exception:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+                current = version
+            return current
+
+    # ---------- Асинхронные обёртки ----------
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def fetch_all(self, query: str, params: Iterable[Any] = ()) -> List[tuple]:
+        return await self._run(self.fetch_all_sync, query, params)
+
+    async def fetch_one(self, query: str, params: Iterable[Any] = ()) -> Optional[tuple]:
+        return await self._run(self.fetch_one_sync, query, params)
+
+    async def execute(self, query: str, params: Iterable[Any] = ()) -> int:
+        return await self._run(self.execute_sync, query, params)
+
+    async def execute_many(self, query: str, seq_of_params: Iterable[Iterable[Any]]) -> int:
+        return await self._run(self.execute_many_sync, query, list(seq_of_params))
+
+    async def execute_batch(self, statements: List[Tuple[str, Iterable[Any]]]) -> int:
+        return await self._run(self.execute_batch_sync, list(statements))
+
+    def close(self) -> None:
+        """Закрывает все соединения и пул потоков базы."""
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._reader_pool.get_nowait().close()
+            except queue.Empty:
+                break
+        logger.info(f"SQLite connections closed for {self.path}.")
+
+
+class WriteBehindQueue:
+    """
+    Отложенная пакетная запись в базу.
+
+    put() лишь кладёт запись в очередь в памяти, а фоновая задача группирует накопленные записи
+    в одну транзакцию: пакет сбрасывается, когда набралось max_batch записей или прошло
+    flush_interval секунд с момента первой записи пакета. stop() дожидается записи всего,
+    что осталось в очереди. Глубина очереди доступна как метрика <name>.queue_depth.
+    """
+
+    def __init__(self, database: Database, name: str, max_batch: int = 100, flush_interval: float = 0.5,
+                 max_queue: int = 10000):
+        self.database = database
+        self.name = name
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue: "asyncio.Queue" = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        metrics.register_gauge(f"{name}.queue_depth", self.depth)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def put(self, query: str, params: Iterable[Any] = ()) -> None:
+        """Ставит запись в очередь; ожидание возможно только при переполнении очереди."""
+        if self._task is None or self._task.done():
+            # Фоновая задача не запущена (например, при вызове вне приложения) — пишем сразу
+            await self.database.execute(query, params)
+            return
+        await self._queue.put((query, tuple(params)))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker(), name=f"write-behind-{self.name}")
+            logger.info(f"Write-behind queue '{self.name}' started (batch={self.max_batch}, interval={self.flush_interval}s).")
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу, предварительно записав всё содержимое очереди."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info(f"Write-behind queue '{self.name}' flushed and stopped.")
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # Дописываем то, что успело попасть в очередь после сигнала остановки
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        if rest:
+            await self._flush(rest)
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            with metrics.timer(f"{self.name}.flush_seconds"):
+                await self.database.execute_batch(batch)
+            metrics.inc(f"{self.name}.rows_written", len(batch))
+            metrics.inc(f"{self.name}.batches")
+        except Exception as e:
+            metrics.inc(f"{self.name}.write_errors", len(batch))
+            logger.error(f"Write-behind flush error in '{self.name}' ({len(batch)} rows dropped): {e}")
@@ -0,0 +1,80 @@
+"""
+Конкурентная обработка апдейтов с сохранением порядка внутри одного чата.
+
+python-telegram-bot по умолчанию обрабатывает апдейты строго по одному для всех пользователей.
+ChatOrderedUpdateProcessor позволяет обрабатывать апдейты разных чатов параллельно (с глобальным
+лимитом), но апдейты одного чата выполняются последовательно и в порядке поступления, поэтому два
+обработчика никогда не работают одновременно с одним и тем же context.chat_data.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Сколько апдейтов может одновременно находиться в обработке или в ожидании своей очереди в чате
+DEFAULT_MAX_PENDING_UPDATES = 1024
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обрабатывает апдейты конкурентно, не более max_concurrent_updates обработчиков одновременно.
+    Апдейты одного чата сериализуются через asyncio.Lock (очередь ожидающих FIFO), поэтому
+    порядок сообщений в чате сохраняется.
+
+    Семафор базового класса ограничивает общее число апдейтов «в полёте» (max_pending_updates),
+    а собственный семафор — число реально выполняющихся обработчиков. Глобальный слот занимается
+    только после получения блокировки чата, чтобы ожидающие апдейты одного активного чата
+    не отнимали слоты у остальных.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int = DEFAULT_MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates must be a positive integer")
+        self.handler_limit = max_concurrent_updates
+        self._handler_semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks: Dict[Any, asyncio.Lock] = {}
+        self._chat_waiters: Dict[Any, int] = {}
+
+    @staticmethod
+    def _chat_key(update: object):
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_key = self._chat_key(update)
+        if chat_key is None:
+            # Апдейты без чата (inline-запросы и т.п.) ограничиваем только глобальным лимитом
+            async with self._handler_semaphore:
+                await coroutine
+            return
+
+        lock = self._chat_locks.get(chat_key)
+        if lock is None:
+            lock = self._chat_locks[chat_key] = asyncio.Lock()
+        self._chat_waiters[chat_key] = self._chat_waiters.get(chat_key, 0) + 1
+        try:
+            async with lock:
+                async with self._handler_semaphore:
+                    await coroutine
+        finally:
+            # Удаляем блокировку, когда у чата не осталось апдейтов, чтобы словарь не рос бесконечно
+            self._chat_waiters[chat_key] -= 1
+            if self._chat_waiters[chat_key] == 0:
+                del self._chat_waiters[chat_key]
+                del self._chat_locks[chat_key]
+
+    @property
+    def active_chats(self) -> int:
+        """Количество чатов, у которых есть апдейты в обработке или в очереди."""
+        return len(self._chat_locks)
+
+    async def initialize(self) -> None:
+        logger.info(f"Concurrent update processing enabled: max {self.handler_limit} handlers at once.")
+
+    async def shutdown(self) -> None:
+        pass
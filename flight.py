@@ -0,0 +1,66 @@
+"""
+Объединение одновременных одинаковых вызовов (single-flight).
+
+SingleFlight.run(key, call) выполняет call() только если вызов с тем же ключом ещё не идёт;
+иначе ждёт результата уже идущего вызова. Ключ — нормализованные аргументы вызова (например,
+ключ кэша). Результат (или исключение) получают все ожидающие; после завершения ключ
+освобождается, так что повторный вызов снова идёт к источнику (обычно к этому времени результат
+уже лежит в кэше).
+
+Вызов выполняется отдельной задачей: отмена одного из ожидающих (например, проигравшей ветки
+спекулятивного выполнения) не прерывает вызов для остальных. Вызов отменяется, только если
+его перестали ждать все.
+
+Метрики: <name>.calls (выполненные вызовы), <name>.saved (вызовы, которые не пришлось выполнять,
+по всем обёрткам — single_flight.saved) и датчик <name>.in_flight.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+import metrics
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Одновременные вызовы с одинаковым ключом разделяют один выполняемый вызов."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        metrics.register_gauge(f"{name}.in_flight", lambda: len(self._calls))
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = self._calls[key] = _Call(asyncio.create_task(call(), name=f"{self.name}-flight"))
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+            metrics.inc(f"{self.name}.calls")
+        else:
+            metrics.inc(f"{self.name}.saved")
+            metrics.inc("single_flight.saved")
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Последний ожидающий ушёл — результат больше никому не нужен
+            if flight.waiters == 1 and not flight.task.done():
+                # Ключ освобождается сразу: новый вызывающий не должен присоединиться к отменяемой задаче
+                self._finish(key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key: Hashable, flight: _Call) -> None:
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,123 @@
+"""
+Геокодирование через Nominatim (geopy) с кэшем и соблюдением лимита запросов.
+
+Политика Nominatim — не больше одного запроса в секунду, поэтому все обращения идут через
+одну фоновую очередь, которая выполняет запросы по token bucket (rate запросов в секунду).
+Результаты кэшируются в TieredCache по (запрос, viewbox, limit): центр города определяется
+один раз и хранится в cache.db между перезапусками. Одновременные одинаковые запросы не
+ставятся в очередь повторно — все ждут один результат; запросы не отбрасываются, а ждут
+своей очереди.
+"""
+import time
+import asyncio
+import logging
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from cache import TieredCache
+from clients import run_blocking
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+GeoResult = namedtuple("GeoResult", "address latitude longitude")
+# Область поиска: два противоположных угла ((lat1, lon1), (lat2, lon2))
+ViewBox = Tuple[Tuple[float, float], Tuple[float, float]]
+
+# Лимит Nominatim: 1 запрос в секунду
+DEFAULT_RATE = 1.0
+# Пустой ответ кэшируется короче, чем найденный адрес
+EMPTY_RESULT_TTL = 24 * 3600
+
+
+class GeocodingService:
+    """Кэширующая обёртка над geopy-геокодером с очередью, ограниченной по скорости."""
+
+    def __init__(self, geolocator, cache: TieredCache, rate: float = DEFAULT_RATE, name: str = "geocode"):
+        self.geolocator = geolocator
+        self.cache = cache
+        self.rate = rate
+        self.name = name
+        self._queue: "asyncio.Queue" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._next_slot = 0.0
+        metrics.register_gauge(f"{name}.queue_depth", self._queue.qsize)
+
+    @staticmethod
+    def _cache_key(query: str, limit: int, viewbox: Optional[ViewBox]) -> str:
+        box = ";".join(f"{lat:.4f},{lon:.4f}" for lat, lon in viewbox) if viewbox else ""
+        return f"{' '.join(query.lower().split())}|{box}|{limit}"
+
+    async def locate(self, query: str) -> Optional[GeoResult]:
+        """Первый результат геокодирования query (например, центр города) или None."""
+        results = await self.search(query, limit=1)
+        return results[0] if results else None
+
+    async def search(self, query: str, limit: int = 1, viewbox: Optional[ViewBox] = None) -> List[GeoResult]:
+        """Результаты поиска query; с viewbox поиск ограничен этой областью."""
+        key = self._cache_key(query, limit, viewbox)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return [GeoResult(*item) for item in cached]
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            metrics.inc(f"{self.name}.coalesced")
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            self.start()
+            await self._queue.put((query, limit, viewbox, future))
+            with metrics.timer(f"{self.name}.wait_seconds"):
+                results = await asyncio.shield(future)
+            await self.cache.set(key, [list(item) for item in results],
+                                 ttl=None if results else EMPTY_RESULT_TTL)
+            return results
+        finally:
+            del self._in_flight[key]
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker(), name=f"{self.name}-worker")
+            logger.info(f"Geocoding worker '{self.name}' started ({self.rate} req/s).")
+
+    async def stop(self) -> None:
+        """Останавливает фоновую задачу; ожидающие запросы получают исключение CancelledError."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        while not self._queue.empty():
+            *_, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
+    async def _worker(self) -> None:
+        while True:
+            query, limit, viewbox, future = await self._queue.get()
+            # Token bucket ёмкостью 1: следующий запрос не раньше чем через 1/rate секунд
+            delay = self._next_slot - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_slot = time.monotonic() + 1.0 / self.rate
+            metrics.inc(f"{self.name}.requests")
+            try:
+                locations = await run_blocking(self._geocode, query, limit, viewbox)
+            except Exception as e:
+                metrics.inc(f"{self.name}.errors")
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(locations)
+
+    def _geocode(self, query: str, limit: int, viewbox: Optional[ViewBox]) -> List[GeoResult]:
+        kwargs = {"exactly_one": False, "limit": limit}
+        if viewbox:
+            kwargs.update(viewbox=viewbox, bounded=True)
+        locations = self.geolocator.geocode(query, **kwargs) or []
+        return [GeoResult(loc.address, loc.latitude, loc.longitude) for loc in locations]
@@ -0,0 +1,374 @@
+"""
+Локализация статических строк интерфейса (приветствие, меню, подписи, сообщения об ошибках).
+
+Каталог locales/ui_catalogue.json собирается заранее для всех языков из language_inline_keyboard:
+
+    python i18n.py build [--force]
+
+Сборка находит все строки, передаваемые в translate_ui() в bot.py, добавляет к ним тексты
+приветствия и подписи меню и переводит их через Google Translate. Уже переведённые (в том числе
+отредактированные вручную) строки не перезаписываются без --force.
+
+Каталог собирается и проверяется при развёртывании; проверка полноты — шаг развёртывания,
+который его останавливает (код выхода 1, если для какого-либо языка не хватает строк):
+
+    python i18n.py check
+
+Бот при старте только загружает каталог и предупреждает в логе о недостающих строках (см.
+load_catalogue). Строки берутся из ограниченного memo в памяти и из каталога; переводчик
+вызывается только для строки, которой нет в каталоге, и результат сразу дописывается в каталог.
+"""
+import os
+import re
+import ast
+import sys
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+UI_CATALOGUE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales", "ui_catalogue.json")
+# Каталог сохраняется на диск после каждых N новых переводов (и при остановке бота)
+AUTOSAVE_EVERY = 20
+
+# Языки, предлагаемые пользователю (название, код)
+LANGUAGES = [
+    ("English", "en"),       # Английский
+    ("Español", "es"),      # Испанский
+    ("Français", "fr"),     # Французский
+    ("Português", "pt"),    # Португальский
+    ("Deutsch", "de"),      # Немецкий
+    ("Italiano", "it"),     # Итальянский
+    ("Nederlands", "nl"),   # Голландский
+    ("日本語", "ja"),       # Японский
+    ("中文 (简体)", "zh-cn"),# Китайский (упрощенный)
+    ("한국어", "ko"),       # Корейский
+    ("Русский", "ru"),      # Русский
+    ("Українська", "uk"),   # Украинский
+    ("العربية", "ar"),     # Арабский
+    ("עברית", "he"),       # Иврит
+    ("Svenska", "sv"),     # Шведский
+    ("Norsk", "no"),       # Норвежский
+    ("Dansk", "da"),       # Датский
+    ("Türkçe", "tr"),      # Турецкий
+    ("Ελληνικά", "el"),    # Греческий
+    ("Polski", "pl"),      # Польский
+    ("Čeština", "cs")      # Чешский
+]
+
+# Коды, которые Google Translate ожидает в другом виде
+GOOGLE_LANGUAGE_CODES = {"zh-cn": "zh-CN", "zh": "zh-CN", "he": "iw"}
+
+# Приветствия ({name} — имя пользователя) и основной текст приветственного сообщения
+WELCOME_GREETINGS = [
+    "Hey {name}, welcome to your personal concierge!",
+    "Hello {name}! Great to see you here at San Cristóbal!",
+    "Hi {name}, ready to explore the best of San Cristóbal?",
+    "Greetings {name}, let's discover the city together!"
+]
+WELCOME_BODY = (
+    "I'm your AI-powered concierge for San Cristóbal de las Casas.\n\n"
+    "This bot is designed to provide you with detailed information on tours, accommodation, attractions, restaurants, advices, and events in the city.\n"
+    "You can interact with the bot using the menu commands or simply type your query. For example:\n"
+    "• I'm traveling with my partner and looking for a quiet hotel away from the center.\n"
+    "• We're on a family trip; what activities do you recommend for children?\n\n"
+    "For usage examples and to learn how to make the most of all the features, visit: "
+    "<a href='https://example.com/usage-guide'>Usage Guide</a>\n\n"
+    "I look forward to helping you explore the city!"
+)
+
+# Подписи кнопок постоянного меню (ключ — раздел) и их расположение; None — кнопка сброса
+MENU_LABELS = {
+    "tours": "Tours",
+    "accommodation": "Accommodation",
+    "attractions": "Attractions",
+    "restaurants": "Restaurants",
+    "advices": "Advices",
+    "faq": "FAQ",
+    "events": "Events",
+}
+MENU_LAYOUT = [
+    ["tours", "accommodation", "attractions"],
+    ["restaurants", "advices"],
+    ["faq", "events", None],
+]
+RESET_BUTTON = "🔴 Reset"
+
+# Описания погоды OpenWeather (прогноз запрашивается на английском и переводится при выводе)
+WEATHER_DESCRIPTIONS = [
+    "clear sky", "few clouds", "scattered clouds", "broken clouds", "overcast clouds",
+    "light rain", "moderate rain", "heavy intensity rain", "very heavy rain", "extreme rain", "freezing rain",
+    "light intensity shower rain", "shower rain", "heavy intensity shower rain", "ragged shower rain",
+    "light intensity drizzle", "drizzle", "heavy intensity drizzle", "shower drizzle",
+    "thunderstorm", "thunderstorm with light rain", "thunderstorm with rain", "thunderstorm with heavy rain",
+    "light thunderstorm", "heavy thunderstorm",
+    "light snow", "snow", "heavy snow", "sleet",
+    "mist", "smoke", "haze", "fog", "sand", "dust",
+]
+
+# Плейсхолдеры ({name}) и HTML-теги не должны попадать в переводчик
+_PROTECTED_RE = re.compile(r"\{\w+\}|<[^>]+>")
+
+
+def google_language_code(lang: str) -> str:
+    lang = lang.lower()
+    if lang in GOOGLE_LANGUAGE_CODES:
+        return GOOGLE_LANGUAGE_CODES[lang]
+    return lang[:2] if len(lang) > 2 else lang
+
+
+def protect_markup(text: str):
+    """Заменяет плейсхолдеры и HTML-теги на __UI_i__, чтобы переводчик их не искажал."""
+    placeholders = {}
+
+    def _sub(match):
+        token = f"__UI_{len(placeholders)}__"
+        placeholders[token] = match.group(0)
+        return token
+
+    return _PROTECTED_RE.sub(_sub, text), placeholders
+
+
+def restore_markup(text: str, placeholders: dict) -> str:
+    for token, original in placeholders.items():
+        text = text.replace(token, original)
+    return text
+
+
+class UICatalogue:
+    """Каталог переводов UI-строк: {lang: {английский текст: перевод}} + memo в памяти."""
+
+    def __init__(self, path: str, translator: Callable[[str, str], Awaitable[str]], memo_size: int = 2048):
+        self.path = path
+        self.translator = translator
+        self.memo = LRUCache(memo_size)
+        self.entries: Dict[str, Dict[str, str]] = {}
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        self._unsaved = 0
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            logger.info(f"UI catalogue {self.path} not found, starting empty.")
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+            self.memo.clear()
+            logger.info(f"UI catalogue loaded: {sum(len(v) for v in self.entries.values())} strings, "
+                        f"{len(self.entries)} languages.")
+        except Exception as e:
+            logger.error(f"Error loading UI catalogue {self.path}: {e}")
+
+    def save(self) -> None:
+        if self._write(self._snapshot()):
+            self._unsaved = 0
+
+    def _snapshot(self) -> Dict[str, Dict[str, str]]:
+        # Копия делается в потоке event loop: add() не изменит её во время записи в другом потоке
+        return {lang: dict(strings) for lang, strings in self.entries.items()}
+
+    def _write(self, entries: Dict[str, Dict[str, str]]) -> bool:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving UI catalogue {self.path}: {e}")
+            return False
+
+    def lookup(self, text: str, lang: str) -> Optional[str]:
+        key = (lang, text)
+        translated = self.memo.get(key)
+        if translated is None:
+            translated = self.entries.get(lang, {}).get(text)
+            if translated is not None:
+                self.memo.set(key, translated)
+        return translated
+
+    def add(self, text: str, lang: str, translated: str) -> None:
+        self.memo.set((lang, text), translated)
+        self.entries.setdefault(lang, {})[text] = translated
+        self._unsaved += 1
+
+    def missing(self, sources: List[str]) -> Dict[str, int]:
+        """Число непереведённых строк из sources по языкам из LANGUAGES (без английского)."""
+        missing = {}
+        for _, lang in LANGUAGES:
+            if lang == "en":
+                continue
+            strings = self.entries.get(lang, {})
+            count = sum(1 for text in sources if text not in strings)
+            if count:
+                missing[lang] = count
+        return missing
+
+    def source_for(self, translated: str, sources) -> Optional[str]:
+        """Ищет среди sources строку, переводом которой (на любой язык) является translated; без учёта регистра."""
+        needle = translated.strip().lower()
+        for source in sources:
+            if source.lower() == needle:
+                return source
+            for strings in self.entries.values():
+                value = strings.get(source)
+                if value and value.strip().lower() == needle:
+                    return source
+        return None
+
+    async def translate(self, text: str, lang: str) -> str:
+        """Возвращает перевод UI-строки; переводчик вызывается только для строк, которых нет в каталоге."""
+        if not lang or lang.lower().startswith("en"):
+            return text
+        translated = self.lookup(text, lang)
+        if translated is not None:
+            return translated
+
+        # Одновременные запросы одной и той же строки ждут один перевод
+        key = (lang, text)
+        future = self._in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            logger.warning(f"UI string missing from catalogue for '{lang}', translating at runtime: {text[:60]}")
+            protected, placeholders = protect_markup(text)
+            translated = restore_markup(await self.translator(protected, lang), placeholders)
+            future.set_result(translated)
+            # Если переводчик вернул исходный текст (ошибка сети и т.п.), не запоминаем его
+            if translated and translated != text:
+                self.add(text, lang, translated)
+                if self._unsaved >= AUTOSAVE_EVERY:
+                    # Переводы, добавленные во время записи, останутся несохранёнными до следующей
+                    saved = self._unsaved
+                    if await asyncio.to_thread(self._write, self._snapshot()):
+                        self._unsaved -= saved
+            return translated
+        except Exception as e:
+            logger.error(f"UI string translation error ('{lang}'): {e}")
+            return text
+        finally:
+            # Ожидающие не должны зависнуть, даже если первый вызывающий отменён: они получают исходный текст
+            if not future.done():
+                future.set_result(text)
+            del self._in_flight[key]
+
+    def flush(self) -> None:
+        """Сохраняет несохранённые переводы."""
+        if self._unsaved:
+            self.save()
+
+
+# ==================== Сборка каталога ====================
+BOT_SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+
+def load_catalogue(catalogue: "UICatalogue", source_path: str = BOT_SOURCE_FILE) -> Dict[str, int]:
+    """Загружает каталог и возвращает число недостающих статических строк по языкам (с предупреждением в логе)."""
+    catalogue.load()
+    missing = catalogue.missing(catalogue_sources(source_path))
+    if missing:
+        details = ", ".join(f"{lang}: {count}" for lang, count in sorted(missing.items()))
+        logger.warning(f"UI catalogue {catalogue.path} is incomplete (missing strings — {details}); "
+                       f"they will be translated at runtime. Run `python i18n.py build`.")
+    return missing
+
+
+def collect_ui_strings(source_path: str) -> List[str]:
+    """
+    Находит в исходном коде все строки, передаваемые в translate_ui(): литералы (в том числе
+    в ветках условных выражений) и локальные переменные, которым присвоен строковый литерал.
+    """
+    with open(source_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    found: Set[str] = set()
+    for func in ast.walk(tree):
+        if not isinstance(func, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        assigned = {}
+        for node in ast.walk(func):
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        assigned[target.id] = node.value.value
+        for node in ast.walk(func):
+            if not (isinstance(node, ast.Call) and getattr(node.func, "id", None) == "translate_ui" and node.args):
+                continue
+            found.update(_string_values(node.args[0], assigned))
+    return sorted(found)
+
+
+def _string_values(node: ast.AST, assigned: Dict[str, str]) -> List[str]:
+    """Строковые значения выражения: литерал, переменная с литералом или обе ветки условного выражения."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.Name) and node.id in assigned:
+        return [assigned[node.id]]
+    if isinstance(node, ast.IfExp):
+        return _string_values(node.body, assigned) + _string_values(node.orelse, assigned)
+    return []
+
+
+def catalogue_sources(source_path: str) -> List[str]:
+    """Все статические строки каталога: строки translate_ui, приветствие, подписи меню и описания погоды."""
+    sources = set(collect_ui_strings(source_path))
+    sources.update(WELCOME_GREETINGS)
+    sources.add(WELCOME_BODY)
+    sources.update(MENU_LABELS.values())
+    sources.update(WEATHER_DESCRIPTIONS)
+    return sorted(sources)
+
+
+def build_catalogue(path: str = UI_CATALOGUE_FILE, force: bool = False) -> None:
+    from deep_translator import GoogleTranslator
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    sources = catalogue_sources(BOT_SOURCE_FILE)
+    catalogue = UICatalogue(path, translator=None)
+    catalogue.load()
+    failures = 0
+    for _, lang in LANGUAGES:
+        if lang == "en":
+            continue
+        translator = GoogleTranslator(source="en", target=google_language_code(lang))
+        existing = catalogue.entries.get(lang, {})
+        for text in sources:
+            if not force and text in existing:
+                continue
+            protected, placeholders = protect_markup(text)
+            try:
+                translated = restore_markup(translator.translate(protected), placeholders)
+            except Exception as e:
+                failures += 1
+                logger.error(f"[{lang}] translation failed for {text[:60]!r}: {e}")
+                continue
+            catalogue.add(text, lang, translated)
+        logger.info(f"[{lang}] {len(catalogue.entries.get(lang, {}))}/{len(sources)} strings")
+    catalogue.save()
+    logger.info(f"Catalogue written to {path} ({failures} failures).")
+    if failures:
+        # Неполный каталог не должен попасть в развёртывание
+        sys.exit(1)
+
+
+def check_catalogue(path: str = UI_CATALOGUE_FILE) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    if load_catalogue(UICatalogue(path, translator=None)):
+        sys.exit(1)
+    logger.info(f"Catalogue {path} is complete.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        build_catalogue(force="--force" in sys.argv[2:])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "check":
+        check_catalogue()
+    else:
+        print("Usage: python i18n.py build [--force] | check")
@@ -0,0 +1,293 @@
+"""
+Локальное определение намерения «поиск мест» (ресторанов, кафе, отелей и т.д.) без запроса к GPT.
+
+Классификация идёт по уровням, от дешёвого к дорогому:
+1. Лексический уровень: регулярные выражения с названиями типов мест и явно «не-местными»
+   фразами (приветствия, вопросы о боте, перевод, как добраться). Если срабатывает только одна
+   группа, ответ принимается сразу.
+2. Модель: логистическая регрессия по хэшированным символьным n-граммам (не зависит от языка),
+   обученная на запросах из chat_history. Уверенный прогноз принимается.
+3. GPT (llm_places_intent) — только если модель не уверена или не загружена.
+
+Обучение и разметка:
+
+    python intent.py train [--label-with-gpt]
+
+Размеченные запросы хранятся в models/places_intent_labels.jsonl ({"text": ..., "places": bool}).
+С --label-with-gpt новые пользовательские запросы из chat_history.db, которых ещё нет в разметке,
+размечаются текущим GPT-классификатором и дописываются в файл. Модель сохраняется
+в models/places_intent.json. Оценка точности и задержки: benchmarks/eval_intent.py.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import asyncio
+import logging
+import sqlite3
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from clients import chat_completion
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+INTENT_MODEL_FILE = os.path.join(MODELS_DIR, "places_intent.json")
+INTENT_LABELS_FILE = os.path.join(MODELS_DIR, "places_intent_labels.jsonl")
+
+# Прогноз модели принимается, если вероятность вне интервала (LOW, HIGH); иначе спрашиваем GPT
+MODEL_CONFIDENT_LOW = 0.25
+MODEL_CONFIDENT_HIGH = 0.75
+# Уверенность, с которой принимается ответ лексического уровня
+LEXICAL_CONFIDENCE = 0.95
+
+HASH_BUCKETS = 2 ** 18
+NGRAM_RANGE = (2, 4)
+
+# Типы мест на языках пользователей бота (основы слов, регистр не важен)
+_PLACE_RE = re.compile(
+    r"restaura|ресторан|кафе|\bcaf[eé]|coffee|кофе|\bbars?\b|\bбар(ы|ов|ах)?\b|\bpubs?\b|паб"
+    r"|hotel|hôtel|отел|гостиниц|хостел|hostel|auberge|hospedaje|alojamiento|מלון|מסעד|אכסני"
+    r"|\bgyms?\b|спортзал|gimnasio|yoga|йог"
+    r"|museum|museo|musée|музе|cultural cent|культурн\w* центр"
+    r"|\bparks?\b|\bпарк(и|ов|ах)?\b|market|mercado|рын(о|к)"
+    r"|souvenir|сувенир|\bshops?\b|магазин|tienda|club|клуб|вечеринк|nightlife"
+    r"|steak|стейк|vegan|веган|vegetarian|вегетариан|pizz|пицц"
+    r"|attraction|достопримечательн|tour agenc|тур\w* агентств",
+    re.IGNORECASE,
+)
+# Фразы, которые не являются поиском мест: разговор о боте, язык и перевод, маршруты, приветствия
+_NOT_PLACE_RE = re.compile(
+    r"о себе|про себя|что ты умеешь|кто ты|чем ты можешь|about yourself|who are you|what can you do"
+    r"|how can you help"
+    r"|переведи|перевод|translat|תרגם|לתרגם|speak \w+|говорить по"
+    r"|добраться|доехать|how to (get|reach)|get to "
+    r"|^\W*(hi|hello|hey|hola|привет|здравствуй\w*|שלום|bonjour|hallo)\W*$"
+    r"|^\W*(more|еще|ещё|что|ok|ок|yes|да|нет|no)\W*$",
+    re.IGNORECASE,
+)
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def lexical_intent(text: str) -> Optional[bool]:
+    """Ответ лексического уровня или None, если правила молчат или противоречат друг другу."""
+    if not _TOKEN_RE.search(text):
+        return False
+    place = _PLACE_RE.search(text) is not None
+    not_place = _NOT_PLACE_RE.search(text) is not None
+    if place != not_place:
+        return place
+    return None
+
+
+def _features(text: str) -> Dict[int, float]:
+    """Хэшированные символьные n-граммы слов и сами слова, нормированные по L2."""
+    counts: Dict[int, float] = {}
+    for token in _TOKEN_RE.findall(text.lower()):
+        grams = [f"w:{token}"]
+        padded = f" {token} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        for gram in grams:
+            idx = zlib.crc32(gram.encode("utf-8")) % HASH_BUCKETS
+            counts[idx] = counts.get(idx, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {idx: v / norm for idx, v in counts.items()}
+
+
+def _sigmoid(x: float) -> float:
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1.0 + z)
+
+
+class IntentModel:
+    """Логистическая регрессия на хэшированных признаках; веса хранятся разреженно."""
+
+    def __init__(self, weights: Optional[Dict[int, float]] = None, bias: float = 0.0):
+        self.weights = weights or {}
+        self.bias = bias
+
+    def predict_proba(self, text: str) -> float:
+        return self._raw_proba(_features(text))
+
+    @classmethod
+    def fit(cls, texts: List[str], labels: List[bool], epochs: int = 30, learning_rate: float = 0.5,
+            l2: float = 1e-4, seed: int = 1) -> "IntentModel":
+        """Обучение стохастическим градиентным спуском (детерминировано при одинаковом seed)."""
+        model = cls()
+        samples = [(_features(text), 1.0 if label else 0.0) for text, label in zip(texts, labels)]
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(samples)
+            for features, target in samples:
+                error = model._raw_proba(features) - target
+                for idx, value in features.items():
+                    weight = model.weights.get(idx, 0.0)
+                    model.weights[idx] = weight - learning_rate * (error * value + l2 * weight)
+                model.bias -= learning_rate * error
+        model.weights = {idx: w for idx, w in model.weights.items() if abs(w) > 1e-6}
+        return model
+
+    def _raw_proba(self, features: Dict[int, float]) -> float:
+        weights = self.weights
+        return _sigmoid(self.bias + sum(weights.get(idx, 0.0) * value for idx, value in features.items()))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "buckets": HASH_BUCKETS,
+            "ngram_range": list(NGRAM_RANGE),
+            "bias": self.bias,
+            "weights": {str(idx): round(w, 6) for idx, w in sorted(self.weights.items())},
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentModel":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("buckets") != HASH_BUCKETS or tuple(data.get("ngram_range", ())) != NGRAM_RANGE:
+            raise ValueError("model was trained with different feature settings")
+        return cls({int(idx): w for idx, w in data["weights"].items()}, data["bias"])
+
+
+async def llm_places_intent(query: str) -> bool:
+    """Прежний классификатор: один запрос к GPT на сообщение."""
+    prompt = (
+        f"Определи, относится ли следующий запрос к поиску мест (например, ресторанов, кафе, отелей и т.д.):\n\n"
+        f"Запрос: {query}\n\n"
+        "Ответь 'True', если да, и 'False', если нет."
+    )
+    try:
+        response = await chat_completion(
+            messages=[{"role": "system", "content": prompt}],
+            temperature=0.1,
+        )
+        answer = response.choices[0].message.content.strip().lower()
+        return "true" in answer
+    except Exception as e:
+        logger.error(f"Error in intent detection: {e}")
+        return False
+
+
+class PlacesIntentClassifier:
+    """Лексический уровень → локальная модель → GPT только при низкой уверенности."""
+
+    def __init__(self, model_path: str = INTENT_MODEL_FILE,
+                 fallback: Optional[Callable[[str], Awaitable[bool]]] = llm_places_intent):
+        self.model_path = model_path
+        self.fallback = fallback
+        self.model: Optional[IntentModel] = None
+
+    def load(self) -> None:
+        if not os.path.exists(self.model_path):
+            logger.info(f"Intent model {self.model_path} not found, low-confidence messages go to GPT.")
+            return
+        try:
+            self.model = IntentModel.load(self.model_path)
+            logger.info(f"Intent model loaded: {len(self.model.weights)} weights.")
+        except Exception as e:
+            logger.error(f"Error loading intent model {self.model_path}: {e}")
+
+    def classify_local(self, text: str) -> Tuple[Optional[bool], float, str]:
+        """Возвращает (ответ или None, уверенность, уровень: lexical/model/none)."""
+        label = lexical_intent(text)
+        if label is not None:
+            return label, LEXICAL_CONFIDENCE, "lexical"
+        if self.model is None:
+            return None, 0.0, "none"
+        proba = self.model.predict_proba(text)
+        if proba >= MODEL_CONFIDENT_HIGH:
+            return True, proba, "model"
+        if proba <= MODEL_CONFIDENT_LOW:
+            return False, 1.0 - proba, "model"
+        return None, max(proba, 1.0 - proba), "model"
+
+    def resolve_local(self, text: str) -> Optional[bool]:
+        """Ответ лексического уровня или уверенной модели; None — нужен GPT (classify_fallback)."""
+        with metrics.timer("intent.local_seconds"):
+            label, _, tier = self.classify_local(text)
+        if label is not None:
+            metrics.inc(f"intent.{tier}")
+        return label
+
+    async def classify_fallback(self, text: str) -> bool:
+        metrics.inc("intent.llm_fallback")
+        if self.fallback is None:
+            return False
+        return await self.fallback(text)
+
+    async def classify(self, text: str) -> bool:
+        label = self.resolve_local(text)
+        if label is not None:
+            return label
+        return await self.classify_fallback(text)
+
+
+# ==================== Разметка и обучение ====================
+def load_labels(path: str = INTENT_LABELS_FILE) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def logged_queries(history_db: str) -> List[str]:
+    """Уникальные пользовательские сообщения из chat_history, кроме нажатий кнопок меню."""
+    from i18n import MENU_LABELS
+
+    with sqlite3.connect(history_db) as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT message_text FROM chat_history WHERE role = 'user' AND message_text IS NOT NULL"
+        ).fetchall()
+    skip = {label.lower() for label in MENU_LABELS.values()}
+    return sorted(row[0] for row in rows if row[0].strip().lower() not in skip)
+
+
+async def gpt_labels(texts: List[str]) -> List[dict]:
+    results = await asyncio.gather(*(llm_places_intent(text) for text in texts))
+    return [{"text": text, "places": label} for text, label in zip(texts, results)]
+
+
+def train(label_with_gpt: bool = False, history_db: str = "chat_history.db") -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    labels = load_labels()
+    if label_with_gpt:
+        known = {item["text"] for item in labels}
+        new_texts = [text for text in logged_queries(history_db) if text not in known]
+        if new_texts:
+            new_labels = asyncio.run(gpt_labels(new_texts))
+            with open(INTENT_LABELS_FILE, "a", encoding="utf-8") as f:
+                for item in new_labels:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            labels.extend(new_labels)
+            logger.info(f"Labelled {len(new_labels)} new queries with GPT.")
+    if not labels:
+        logger.error(f"No labelled queries in {INTENT_LABELS_FILE}.")
+        return
+    texts = [item["text"] for item in labels]
+    targets = [bool(item["places"]) for item in labels]
+    started = time.perf_counter()
+    model = IntentModel.fit(texts, targets)
+    model.save(INTENT_MODEL_FILE)
+    correct = sum((model.predict_proba(t) >= 0.5) == y for t, y in zip(texts, targets))
+    logger.info(f"Trained on {len(texts)} queries in {time.perf_counter() - started:.2f}s, "
+                f"training accuracy {correct / len(texts):.3f}; saved to {INTENT_MODEL_FILE}.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "train":
+        train(label_with_gpt="--label-with-gpt" in sys.argv[2:])
+    else:
+        print("Usage: python intent.py train [--label-with-gpt]")
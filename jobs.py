@@ -0,0 +1,139 @@
+"""
+Фоновая очередь заданий с дебаунсом по ключу (например, по чату).
+
+submit() не выполняет задание, а откладывает его на debounce секунд; повторные вызовы с тем же
+ключом за это время объединяются в одно задание (элементы складываются, контекст берётся
+последний) и сдвигают запуск, но не дальше max_delay от первого вызова. Задания одного ключа
+никогда не выполняются одновременно: то, что пришло во время выполнения, запускается после
+него одним заданием. Одновременно выполняется не больше concurrency заданий.
+
+Метрики: <name>.lag_seconds (от первого вызова submit до запуска), <name>.run_seconds,
+<name>.jobs, <name>.coalesced, <name>.errors и датчики <name>.pending, <name>.running.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_STOP_TIMEOUT = 30.0
+
+Job = Callable[[Hashable, List[Any], Any], Awaitable[Any]]
+
+
+class _Pending:
+    __slots__ = ("items", "context", "first_at", "due_at", "timer")
+
+    def __init__(self, first_at: float):
+        self.items: List[Any] = []
+        self.context: Any = None
+        self.first_at = first_at
+        self.due_at = first_at
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class DebouncedJobQueue:
+    """Отложенный запуск job(key, items, context) с объединением вызовов по ключу."""
+
+    def __init__(self, name: str, job: Job, debounce: float = 10.0, max_delay: float = 60.0, concurrency: int = 2):
+        self.name = name
+        self.job = job
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self._pending: Dict[Hashable, _Pending] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._started = False
+        metrics.register_gauge(f"{name}.pending", lambda: len(self._pending))
+        metrics.register_gauge(f"{name}.running", lambda: len(self._running))
+
+    def start(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._started = True
+        logger.info(f"Job queue '{self.name}' started (debounce={self.debounce}s, max_delay={self.max_delay}s, "
+                    f"concurrency={self.concurrency}).")
+
+    async def submit(self, key: Hashable, items: List[Any], context: Any = None) -> None:
+        """Добавляет элементы к заданию ключа и (пере)назначает его запуск."""
+        if not self._started:
+            # Очередь не запущена (например, при вызове вне приложения) — выполняем сразу
+            await self._run(key, list(items), context)
+            return
+        now = asyncio.get_running_loop().time()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _Pending(now)
+        else:
+            metrics.inc(f"{self.name}.coalesced")
+        pending.items.extend(items)
+        pending.context = context
+        pending.due_at = min(now + self.debounce, pending.first_at + self.max_delay)
+        if key not in self._running:
+            self._schedule(key, pending)
+
+    def _schedule(self, key: Hashable, pending: _Pending) -> None:
+        if pending.timer is not None:
+            pending.timer.cancel()
+        pending.timer = asyncio.get_running_loop().call_at(pending.due_at, self._launch, key)
+
+    def _launch(self, key: Hashable) -> None:
+        if key in self._running:
+            # Запустится по завершении текущего задания этого ключа
+            return
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        self._running[key] = asyncio.create_task(self._execute(key, pending), name=f"{self.name}-{key}")
+
+    async def _execute(self, key: Hashable, pending: _Pending) -> None:
+        try:
+            async with self._semaphore:
+                metrics.observe(f"{self.name}.lag_seconds", asyncio.get_running_loop().time() - pending.first_at)
+                await self._run(key, pending.items, pending.context)
+        finally:
+            del self._running[key]
+            queued = self._pending.get(key)
+            if queued is not None and self._started:
+                self._schedule(key, queued)
+
+    async def _run(self, key: Hashable, items: List[Any], context: Any) -> None:
+        try:
+            with metrics.timer(f"{self.name}.run_seconds"):
+                await self.job(key, items, context)
+            metrics.inc(f"{self.name}.jobs")
+        except Exception as e:
+            metrics.inc(f"{self.name}.errors")
+            logger.error(f"Job queue '{self.name}' job for {key} failed: {e}")
+
+    async def stop(self, timeout: float = DEFAULT_STOP_TIMEOUT) -> None:
+        """Запускает отложенные задания без ожидания дебаунса и ждёт их не дольше timeout секунд."""
+        if not self._started:
+            return
+        self._started = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._pending or self._running:
+            for key in list(self._pending):
+                self._launch(key)
+            remaining = deadline - loop.time()
+            if remaining <= 0 or not self._running:
+                break
+            await asyncio.wait(list(self._running.values()), timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        unfinished = len(self._pending) + len(self._running)
+        for pending in self._pending.values():
+            if pending.timer is not None:
+                pending.timer.cancel()
+        self._pending.clear()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if unfinished:
+            logger.warning(f"Job queue '{self.name}' stopped with {unfinished} unfinished jobs.")
+        logger.info(f"Job queue '{self.name}' stopped.")
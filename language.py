@@ -0,0 +1,101 @@
+"""
+Определение языка текста (сообщений пользователя и ответов LLM) поверх langdetect.
+
+langdetect медленный (построение n-грамм и несколько случайных прогонов на каждый вызов) и
+недетерминированный: без фиксированного зерна один и тот же текст может получить разный язык.
+LanguageDetector:
+- фиксирует зерно DetectorFactory, поэтому результат для текста всегда один и тот же;
+- перед определением убирает HTML-теги, ссылки и сущности и обрезает текст до max_chars;
+- не запускает langdetect для коротких текстов (меньше min_letters букв — «ok», «more», «👍»),
+  где он в основном ошибается, и возвращает подсказку или язык по умолчанию;
+- хранит вероятности языков в LRU по хэшу нормализованного текста, так что повторный вызов
+  для того же текста (или вызов из другого места обработчика) ничего не пересчитывает;
+- принимает подсказку (hint) — язык, который ожидается заранее (например, язык, на котором
+  модель просили ответить): если langdetect считает его достаточно вероятным, возвращается
+  подсказка, а не близкий язык-соперник (es/pt, no/da и т.п.).
+
+Коды языков возвращаются в том же виде, что и language_code_to_target: две строчные буквы.
+Сравнение с прежним способом: benchmarks/bench_language.py.
+"""
+import re
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+from langdetect import DetectorFactory, detect_langs
+from langdetect.lang_detect_exception import LangDetectException
+
+import metrics
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Короче этого (в буквах) langdetect не запускается
+DEFAULT_MIN_LETTERS = 12
+# Для определения языка хватает начала текста; длинные ответы LLM обрезаются
+DEFAULT_MAX_CHARS = 600
+DEFAULT_CACHE_SIZE = 4096
+# Подсказка принимается, если её вероятность по langdetect не ниже этого значения
+HINT_MIN_PROBABILITY = 0.3
+
+_MARKUP_RE = re.compile(r"<[^>]*>|&#?\w+;|https?://\S+|www\.\S+")
+_SPACES_RE = re.compile(r"\s+")
+
+DetectorFactory.seed = 0
+
+
+def _short_code(code: str) -> str:
+    return code[:2].lower()
+
+
+class LanguageDetector:
+    """Однократное, кэшируемое и детерминированное определение языка."""
+
+    def __init__(self, min_letters: int = DEFAULT_MIN_LETTERS, max_chars: int = DEFAULT_MAX_CHARS,
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        self.min_letters = min_letters
+        self.max_chars = max_chars
+        self._cache = LRUCache(cache_size)
+        metrics.register_gauge("language.cache_entries", lambda: len(self._cache))
+
+    def normalize(self, text: str) -> str:
+        """Текст без разметки и ссылок, с одиночными пробелами, не длиннее max_chars."""
+        text = _MARKUP_RE.sub(" ", text[:self.max_chars * 2])
+        return _SPACES_RE.sub(" ", text).strip()[:self.max_chars]
+
+    def probabilities(self, text: str) -> Tuple[Tuple[str, float], ...]:
+        """Вероятности языков ((код, p), ...) по убыванию; пусто для коротких и нераспознаваемых текстов."""
+        normalized = self.normalize(text)
+        if sum(ch.isalpha() for ch in normalized) < self.min_letters:
+            metrics.inc("language.skipped")
+            return ()
+        key = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            metrics.inc("language.cache_hits")
+            return cached
+        metrics.inc("language.detections")
+        with metrics.timer("language.detect_seconds"):
+            try:
+                result = tuple((_short_code(item.lang), item.prob) for item in detect_langs(normalized))
+            except LangDetectException as e:
+                logger.debug(f"Language detection failed: {e}")
+                result = ()
+        self._cache.set(key, result)
+        return result
+
+    def detect(self, text: str, default: str = "en", hint: Optional[str] = None) -> str:
+        """
+        Язык текста. hint — ожидаемый язык: возвращается, если он достаточно вероятен или текст
+        слишком короткий; default — если язык не определён и подсказки нет.
+        """
+        hint = _short_code(hint) if hint else None
+        probabilities = self.probabilities(text)
+        if not probabilities:
+            return hint or _short_code(default)
+        if hint is not None and hint != probabilities[0][0]:
+            if any(code == hint and prob >= HINT_MIN_PROBABILITY for code, prob in probabilities):
+                metrics.inc("language.hint_accepted")
+                return hint
+        return probabilities[0][0]
@@ -0,0 +1,525 @@
+"""
+Приведение HTML из ответов LLM к подмножеству Telegram: <b>, <i> и <a href>.
+
+validate_html() даёт тот же результат, что прежняя реализация на BeautifulSoup
+(html.parser → <br> заменяется на \\n → неразрешённые теги и <a> без href разворачиваются →
+str(soup)), но без построения дерева: события токенизатора сразу пишутся в выходной текст.
+Стек открытых тегов хранит счётчики по имени, поэтому закрывающий тег без пары отбрасывается
+за O(1), а каждый тег снимается со стека один раз — весь проход линейный.
+
+Повторены особенности BeautifulSoup, от которых зависит результат:
+- текст между тегами из одних пробельных символов сжимается до «\\n» или « » (кроме <pre>/<textarea>);
+- закрывающий тег закрывает и все вложенные открытые теги, незакрытые теги закрываются в конце;
+- пустые элементы (<br>, <img>, ...) не имеют содержимого, повторный </br> после <br> пропускается;
+- атрибуты сортируются, class/rel и подобные нормализуются по пробелам, значения экранируются.
+
+Токенизация повторяет html.parser (Python 3.11). Быстрый путь разбирает текст, теги, ссылки
+на символы и одиночные < и &. Если встречается то, что html.parser обрабатывает особо
+(комментарии, <!DOCTYPE>, <?...>, <script>/<style>, незавершённые конструкции в конце строки),
+остаток текста с этого места дочитывает сам html.parser с тем же сериализатором.
+
+chunk_html() делит очищенный HTML на сообщения в пределах лимитов Telegram (4096 символов на
+текст, 1024 на подпись к фото) за один проход: теги, открытые на границе, закрываются в конце
+части и открываются заново в начале следующей, так что каждая часть — валидный HTML.
+"""
+import re
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+TELEGRAM_MAX_CAPTION_LENGTH = 1024
+
+ALLOWED_TAGS = frozenset(("b", "i", "a"))
+# Пустые элементы BeautifulSoup (HTMLTreeBuilder.empty_element_tags)
+VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+    "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer",
+))
+PRESERVE_WHITESPACE_TAGS = frozenset(("pre", "textarea"))
+# Атрибуты-списки разрешённых тегов: значение пересобирается через один пробел
+LIST_ATTRIBUTES = frozenset(("class", "accesskey", "dropzone"))
+LINK_LIST_ATTRIBUTES = LIST_ATTRIBUTES | {"rel", "rev"}
+
+_ASCII_SPACES = " \n\t\x0c\r"
+_ENTITIES = {name[:-1]: value for name, value in html5.items() if name.endswith(";")}
+# Ссылки &#128;–&#159; в кодировке Windows-1252, как их понимают браузеры и BeautifulSoup
+_WINDOWS_1252 = {}
+for _code in range(0x80, 0xA0):
+    try:
+        _WINDOWS_1252[_code] = bytes((_code,)).decode("cp1252")
+    except UnicodeDecodeError:
+        pass
+_CDATA_CONTENT_TAGS = ("script", "style")
+
+# Регулярные выражения html.parser (Python 3.11)
+_INTERESTING = re.compile("[&<]")
+_INCOMPLETE = re.compile("&[a-zA-Z#]")
+_ENTITYREF = re.compile("&([a-zA-Z][-.a-zA-Z0-9]*)[^a-zA-Z0-9]")
+_CHARREF = re.compile("&#(?:[0-9]+|[xX][0-9a-fA-F]+)[^0-9a-fA-F]")
+_STARTTAGOPEN = re.compile("<[a-zA-Z]")
+_TAGFIND = re.compile(r"([a-zA-Z][^\t\n\r\f />\x00]*)(?:\s|/(?!>))*")
+_ATTRFIND = re.compile(
+    r"((?<=[\'\"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*"
+    r"(\'[^\']*\'|\"[^\"]*\"|(?![\'\"])[^>\s]*))?(?:\s|/(?!>))*")
+_LOCATESTARTTAGEND = re.compile(r"""
+  <[a-zA-Z][^\t\n\r\f />\x00]*
+  (?:[\s/]*
+    (?:(?<=['"\s/])[^\s/>][^\s/=>]*
+      (?:\s*=+\s*
+        (?:'[^']*'
+          |"[^"]*"
+          |(?!['"])[^>\s]*
+         )
+        \s*
+       )?(?:\s|/(?!>))*
+     )*
+   )?
+  \s*
+""", re.VERBOSE)
+_ENDTAGFIND = re.compile(r"</\s*([a-zA-Z][-.a-zA-Z0-9:_]*)\s*>")
+# <b>, </i>, <br> и т.п. без атрибутов — самый частый случай, разбирается одним совпадением
+_SIMPLE_TAG = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)>")
+_UNFINISHED_ATTR_CHARS = "abcdefghijklmnopqrstuvwxyz=/ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def escape_text(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def numeric_reference(name: str) -> str:
+    """Символ для &#name; (десятичная или x-шестнадцатеричная запись)."""
+    code = int(name[1:], 16) if name[:1] in ("x", "X") else int(name)
+    if code == 0 or code > 0x10FFFF or 0xD800 <= code <= 0xDFFF:
+        return "\ufffd"
+    return _WINDOWS_1252.get(code) or chr(code)
+
+
+class _Serializer:
+    """Превращает события токенизатора в очищенный HTML так, как это сделал бы str(soup)."""
+
+    __slots__ = ("out", "data", "stack", "open_counts", "preserve_depth", "closed_void")
+
+    def __init__(self):
+        self.out: List[str] = []
+        self.data: List[str] = []  # текущий текстовый узел
+        self.stack: List[Tuple[str, Optional[str]]] = []  # (тег, закрывающий тег или None, если развёрнут)
+        self.open_counts: Dict[str, int] = {}
+        self.preserve_depth = 0
+        self.closed_void: Dict[str, int] = {}  # <br> и т.п. без / — следующий </br> пропускается
+
+    def flush(self) -> None:
+        if not self.data:
+            return
+        text = "".join(self.data)
+        self.data.clear()
+        if not self.preserve_depth and not text.strip(_ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        self.out.append(escape_text(text))
+
+    def special(self, prefix: str, text: str, suffix: str) -> None:
+        """Комментарий, DOCTYPE, CDATA и т.п. — выводятся как есть."""
+        self.flush()
+        if not self.preserve_depth and not text.strip(_ASCII_SPACES):
+            text = "\n" if "\n" in text else " "
+        self.out.append(prefix + text + suffix)
+
+    def start_tag(self, name: str, attrs: List[Tuple[str, Optional[str]]], self_closing: bool = False) -> None:
+        """Открывающий тег; self_closing — запись вида <tag/>, которая сразу и закрывает его."""
+        self.flush()
+        if name in VOID_TAGS:
+            # Пустой элемент открывается и сразу закрывается; <br> становится переводом строки
+            if name == "br":
+                self.out.append("\n")
+            if not self_closing:
+                self.closed_void[name] = self.closed_void.get(name, 0) + 1
+            return
+        closing = None
+        if name in ALLOWED_TAGS:
+            opening = self._opening_tag(name, attrs)
+            if opening is not None:
+                self.out.append(opening)
+                closing = f"</{name}>"
+        if self_closing:
+            if closing:
+                self.out.append(closing)
+            return
+        self.stack.append((name, closing))
+        self.open_counts[name] = self.open_counts.get(name, 0) + 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+
+    @staticmethod
+    def _opening_tag(name: str, attrs: List[Tuple[str, Optional[str]]]) -> Optional[str]:
+        values: Dict[str, str] = {}
+        for key, value in attrs:
+            values[key] = "" if value is None else value
+        if name == "a" and "href" not in values:
+            return None
+        if not values:
+            return f"<{name}>"
+        list_attributes = LINK_LIST_ATTRIBUTES if name == "a" else LIST_ATTRIBUTES
+        parts = [f"<{name}"]
+        for key in sorted(values):
+            value = values[key]
+            if key in list_attributes:
+                value = " ".join(value.split())
+            value = escape_text(value)
+            if '"' not in value:
+                parts.append(f' {key}="{value}"')
+            elif "'" not in value:
+                parts.append(f" {key}='{value}'")
+            else:
+                parts.append(f' {key}="{value.replace(chr(34), "&quot;")}"')
+        parts.append(">")
+        return "".join(parts)
+
+    def end_tag(self, name: str) -> None:
+        if self.closed_void.get(name):
+            self.closed_void[name] -= 1
+            return
+        self.flush()
+        if not self.open_counts.get(name):
+            return
+        while True:
+            tag, closing = self.stack.pop()
+            self.open_counts[tag] -= 1
+            if tag in PRESERVE_WHITESPACE_TAGS:
+                self.preserve_depth -= 1
+            if closing:
+                self.out.append(closing)
+            if tag == name:
+                return
+
+    def finish(self) -> str:
+        self.flush()
+        while self.stack:
+            closing = self.stack.pop()[1]
+            if closing:
+                self.out.append(closing)
+        return "".join(self.out)
+
+
+def _start_tag(text: str, i: int, out: _Serializer) -> int:
+    """Разбор <tag ...> как в HTMLParser.parse_starttag; -1 — нужен полный html.parser."""
+    j = _LOCATESTARTTAGEND.match(text, i).end()
+    following = text[j:j + 1]
+    if following == ">":
+        endpos = j + 1
+    elif following == "/":
+        if not text.startswith("/>", j):
+            return -1
+        endpos = j + 2
+    elif not following or following in _UNFINISHED_ATTR_CHARS:
+        return -1
+    else:
+        endpos = j if j > i else i + 1
+
+    match = _TAGFIND.match(text, i + 1)
+    k = match.end()
+    tag = match.group(1).lower()
+    attrs = []
+    while k < endpos:
+        m = _ATTRFIND.match(text, k)
+        if not m:
+            break
+        attrname, rest, attrvalue = m.group(1, 2, 3)
+        if not rest:
+            attrvalue = None
+        elif attrvalue[:1] == "'" == attrvalue[-1:] or attrvalue[:1] == '"' == attrvalue[-1:]:
+            attrvalue = attrvalue[1:-1]
+        if attrvalue:
+            attrvalue = unescape(attrvalue)
+        attrs.append((attrname.lower(), attrvalue))
+        k = m.end()
+
+    end = text[k:endpos].strip()
+    if end not in (">", "/>"):
+        out.data.append(text[i:endpos])
+    elif end.endswith("/>"):
+        out.start_tag(tag, attrs, self_closing=True)
+    else:
+        if tag in _CDATA_CONTENT_TAGS:
+            return -1
+        out.start_tag(tag, attrs)
+    return endpos
+
+
+def _end_tag(text: str, i: int, out: _Serializer) -> int:
+    """Разбор </tag> как в HTMLParser.parse_endtag; -1 — нужен полный html.parser."""
+    gtpos = text.find(">", i + 1)
+    if gtpos < 0:
+        return -1
+    match = _ENDTAGFIND.match(text, i)
+    if match:
+        out.end_tag(match.group(1).lower())
+        return gtpos + 1
+    namematch = _TAGFIND.match(text, i + 2)
+    if not namematch:
+        # </> пропускается, остальное — «битый» комментарий
+        return i + 3 if text.startswith("</>", i) else -1
+    out.end_tag(namematch.group(1).lower())
+    return text.find(">", namematch.end()) + 1
+
+
+def _scan(text: str, out: _Serializer) -> int:
+    """
+    Быстрый путь. Возвращает позицию, с которой текст должен дочитать html.parser
+    (len(text), если разобран целиком). До этой позиции события те же, что выдал бы html.parser.
+    """
+    n = len(text)
+    i = 0
+    data = out.data
+    search = _INTERESTING.search
+    simple_tag = _SIMPLE_TAG.match
+    while i < n:
+        match = search(text, i)
+        j = match.start() if match else n
+        if i < j:
+            data.append(text[i:j])
+            i = j
+            if i == n:
+                break
+        if text[i] == "<":
+            match = simple_tag(text, i)
+            if match:
+                closing, name = match.groups()
+                if closing:
+                    out.end_tag(name.lower())
+                else:
+                    name = name.lower()
+                    if name in _CDATA_CONTENT_TAGS:
+                        return i
+                    out.start_tag(name, [])
+                i = match.end()
+                continue
+            if _STARTTAGOPEN.match(text, i):
+                k = _start_tag(text, i, out)
+            elif text.startswith("</", i):
+                k = _end_tag(text, i, out)
+            elif text.startswith(("<!", "<?"), i) or i + 1 == n:
+                return i
+            else:
+                data.append("<")
+                k = i + 1
+            if k < 0:
+                return i
+            i = k
+        elif text.startswith("&#", i):
+            match = _CHARREF.match(text, i)
+            if not match:
+                return i
+            data.append(numeric_reference(match.group()[2:-1]))
+            i = match.end() if text[match.end() - 1] == ";" else match.end() - 1
+        else:
+            match = _ENTITYREF.match(text, i)
+            if match:
+                name = match.group(1)
+                data.append(_ENTITIES.get(name) or "&" + name)
+                i = match.end() if text[match.end() - 1] == ";" else match.end() - 1
+            elif _INCOMPLETE.match(text, i) or i + 1 == n:
+                return i
+            else:
+                data.append("&")
+                i += 1
+    return n
+
+
+class _EventParser(HTMLParser):
+    """Полный html.parser для редких конструкций; события идут в тот же _Serializer."""
+
+    def __init__(self, out: _Serializer):
+        super().__init__(convert_charrefs=False)
+        self.out = out
+
+    def handle_starttag(self, tag, attrs):
+        self.out.start_tag(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self.out.start_tag(tag, attrs, self_closing=True)
+
+    def handle_endtag(self, tag):
+        self.out.end_tag(tag)
+
+    def handle_data(self, data):
+        self.out.data.append(data)
+
+    def handle_charref(self, name):
+        self.out.data.append(numeric_reference(name))
+
+    def handle_entityref(self, name):
+        self.out.data.append(_ENTITIES.get(name) or "&" + name)
+
+    def handle_comment(self, data):
+        self.out.special("<!--", data, "-->")
+
+    def handle_decl(self, decl):
+        self.out.special("<!DOCTYPE ", decl[len("DOCTYPE "):], ">\n")
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self.out.special("<![CDATA[", data[len("CDATA["):], "]]>")
+        else:
+            self.out.special("<?", data, "?>")
+
+    def handle_pi(self, data):
+        self.out.special("<?", data, ">")
+
+
+def validate_html(text: str) -> str:
+    """Оставляет только теги Telegram (<b>, <i>, <a href>), заменяет <br> на \\n и закрывает открытые теги."""
+    out = _Serializer()
+    stop = _scan(text, out)
+    if stop < len(text):
+        # Состояние html.parser в точке остановки — пустой буфер вне <script>/<style>,
+        # поэтому остаток можно отдать новому парсеру
+        parser = _EventParser(out)
+        parser.feed(text[stop:])
+        parser.close()
+    return out.finish()
+
+
+# ---------- Разбиение на сообщения ----------
+_CHUNK_TOKEN_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)[^>]*>|&#?[a-zA-Z0-9]+;")
+_MARKUP_TAG_RE = re.compile(r"<[^>]*>")
+# Места разреза по убыванию предпочтения: пустая строка, перенос строки, пробел
+_BREAKS = ("\n\n", "\n", " ")
+
+
+class _Chunker:
+    """Состояние chunk_html: стек открытых тегов и лучшие места разреза в текущей части."""
+
+    def __init__(self, text: str, max_length: int, first_length: Optional[int]):
+        self.text = text
+        self.max_length = max_length
+        self.limit = first_length or max_length
+        self.chunks: List[str] = []
+        self.stack: List[Tuple[str, str]] = []  # (имя, открывающий тег как в тексте)
+        self.closing_length = 0
+        self.prefix = ""  # теги, заново открытые в начале текущей части
+        self.start = 0
+        # Кандидат разреза: (конец части, начало следующей, стек, длина закрывающих и открывающих тегов стека)
+        self.candidates: Dict[str, tuple] = {}
+        self.hard: Optional[tuple] = None  # последняя позиция между токенами
+
+    def run(self) -> List[str]:
+        pos = 0
+        for match in _CHUNK_TOKEN_RE.finditer(self.text):
+            self._text_run(pos, match.start())
+            self._token(match)
+            pos = match.end()
+        self._text_run(pos, len(self.text))
+        self._append(self.prefix + self.text[self.start:] + self._closing(self.stack))
+        return self.chunks
+
+    def _end(self) -> int:
+        return self.start + self.limit - len(self.prefix) - self.closing_length
+
+    def _snapshot(self, cut: int, resume: int) -> tuple:
+        opening_length = sum(len(tag) for _, tag in self.stack)
+        return (cut, resume, tuple(self.stack), self.closing_length, opening_length)
+
+    def _remember(self, a: int, b: int) -> None:
+        for br in _BREAKS:
+            p = self.text.rfind(br, a, b)
+            if p >= a:
+                self.candidates[br] = self._snapshot(p, p + len(br))
+        self.hard = self._snapshot(b, b)
+
+    def _text_run(self, a: int, b: int) -> None:
+        while True:
+            end = self._end()
+            if b <= end:
+                if a < b:
+                    self._remember(a, b)
+                return
+            if end > a:
+                self._remember(a, end)
+            if not self._cut(a + 1, self.closing_length):
+                # Разрезать негде (часть занята одним длинным токеном) — часть выйдет длиннее лимита
+                self._remember(a, b)
+                return
+            a = max(a, self.start)
+
+    def _token(self, match) -> None:
+        closing, name = match.group(1, 2)
+        stack, closing_length = self.stack, self.closing_length
+        if match.group(0)[0] == "<":
+            name = name.lower()
+            if not closing:
+                stack = stack + [(name, match.group(0))]
+                closing_length += len(name) + 3
+            else:
+                for i in range(len(stack) - 1, -1, -1):
+                    if stack[i][0] == name:
+                        closing_length -= sum(len(tag) + 3 for tag, _ in stack[i:])
+                        stack = stack[:i]
+                        break
+        while match.end() > self.start + self.limit - len(self.prefix) - closing_length:
+            if not self._cut(match.end(), closing_length):
+                break
+        self.stack, self.closing_length = stack, closing_length
+        if closing or match.group(0)[0] == "&":
+            self.hard = self._snapshot(match.end(), match.end())
+
+    def _usable(self, candidate: tuple, required_end: int, closing_length: int) -> bool:
+        """Часть до разреза укладывается в лимит, а следующая вмещает уже разобранный текст до required_end."""
+        cut, resume, _, cut_closing_length, opening_length = candidate
+        return (cut > self.start
+                and len(self.prefix) + (cut - self.start) + cut_closing_length <= self.limit
+                and resume + self.max_length - opening_length - closing_length >= required_end)
+
+    def _cut(self, required_end: int, closing_length: int) -> bool:
+        chosen = None
+        # Сначала ищем разрез во второй половине части, затем где угодно
+        for floor in (self.start + self.limit // 2, self.start + 1):
+            for br in _BREAKS:
+                candidate = self.candidates.get(br)
+                if candidate and candidate[0] >= floor and self._usable(candidate, required_end, closing_length):
+                    chosen = candidate
+                    break
+            if chosen:
+                break
+        if chosen is None and self.hard and self._usable(self.hard, required_end, closing_length):
+            chosen = self.hard
+        if chosen is None:
+            return False
+        cut, resume, stack = chosen[:3]
+        self._append(self.prefix + self.text[self.start:cut] + self._closing(stack))
+        self.prefix = "".join(tag for _, tag in stack)
+        self.start = resume
+        self.limit = self.max_length
+        self.candidates = {br: c for br, c in self.candidates.items() if c[0] > resume}
+        if self.hard and self.hard[0] <= resume:
+            self.hard = None
+        return True
+
+    @staticmethod
+    def _closing(stack) -> str:
+        return "".join(f"</{name}>" for name, _ in reversed(stack))
+
+    def _append(self, chunk: str) -> None:
+        # Части без видимого текста Telegram не примет
+        if _MARKUP_TAG_RE.sub("", chunk).strip():
+            self.chunks.append(chunk)
+
+
+def chunk_html(text: str, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH,
+               first_length: Optional[int] = None) -> List[str]:
+    """
+    Делит HTML (выход validate_html) на части не длиннее max_length, первую — не длиннее
+    first_length. Разрез ставится вне тегов и сущностей: по пустой строке, переносу строки или
+    пробелу во второй половине части, иначе ближе к её началу, в крайнем случае — между токенами.
+    """
+    if len(text) <= (first_length or max_length):
+        return [text] if _MARKUP_TAG_RE.sub("", text).strip() else []
+    return _Chunker(text, max_length, first_length).run()
+
+
+def split_caption(text: str, caption_length: int = TELEGRAM_MAX_CAPTION_LENGTH,
+                  max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> Tuple[str, List[str]]:
+    """Подпись к фото (до caption_length) и продолжение отдельными сообщениями (до max_length)."""
+    chunks = chunk_html(text, max_length, first_length=caption_length)
+    return (chunks[0], chunks[1:]) if chunks else ("", [])
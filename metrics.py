@@ -0,0 +1,89 @@
+"""
+Простые метрики процесса: счётчики, датчики (gauges) и выборки длительностей.
+
+Метрики хранятся в памяти процесса и выводятся администратору командой /stats.
+"""
+import time
+import threading
+from collections import defaultdict, deque
+from typing import Callable, Dict
+
+# Сколько последних наблюдений хранить для расчёта перцентилей
+TIMING_WINDOW = 1000
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, Callable[[], float]] = {}
+_timings: Dict[str, deque] = {}
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Увеличивает счётчик."""
+    with _lock:
+        _counters[name] += value
+
+
+def register_gauge(name: str, func: Callable[[], float]) -> None:
+    """Регистрирует датчик — функцию, значение которой читается в момент снятия метрик."""
+    _gauges[name] = func
+
+
+def observe(name: str, value: float) -> None:
+    """Добавляет наблюдение (например, длительность в секундах)."""
+    with _lock:
+        window = _timings.get(name)
+        if window is None:
+            window = _timings[name] = deque(maxlen=TIMING_WINDOW)
+        window.append(value)
+
+
+class timer:
+    """Контекстный менеджер, записывающий длительность блока в observe(name)."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self._started)
+        return False
+
+
+def _percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def snapshot() -> dict:
+    """Возвращает текущие значения всех метрик."""
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: list(values) for name, values in _timings.items() if values}
+    gauges = {}
+    for name, func in _gauges.items():
+        try:
+            gauges[name] = func()
+        except Exception:
+            gauges[name] = None
+    timing_stats = {
+        name: {"count": len(values), "p50": _percentile(values, 50), "p99": _percentile(values, 99)}
+        for name, values in timings.items()
+    }
+    return {"counters": counters, "gauges": gauges, "timings": timing_stats}
+
+
+def format_snapshot() -> str:
+    """Текстовое представление метрик для отправки в Telegram."""
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["gauges"].items()):
+        lines.append(f"{name} = {value}")
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"{name} = {value:g}")
+    for name, stats in sorted(data["timings"].items()):
+        lines.append(f"{name}: n={stats['count']} p50={stats['p50']:.3f}s p99={stats['p99']:.3f}s")
+    return "\n".join(lines) if lines else "No metrics collected yet."
@@ -0,0 +1,60 @@
+"""
+Версионированные миграции схемы баз данных.
+
+Каждая миграция — кортеж (version, description, sql). Версия схемы хранится в PRAGMA user_version,
+поэтому при старте применяются только новые миграции. Новые миграции добавляются в конец списка
+с очередным номером; уже выпущенные миграции не редактируются.
+"""
+
+HISTORY_MIGRATIONS = [
+    (
+        1,
+        "chats registry and chat_id indexes",
+        """
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id TEXT PRIMARY KEY,
+            registered_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID;
+        INSERT OR IGNORE INTO chats (chat_id, registered_at)
+            SELECT chat_id, MIN(timestamp) FROM chat_history GROUP BY chat_id;
+        CREATE INDEX IF NOT EXISTS idx_chat_history_chat_id_timestamp ON chat_history (chat_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_feedback_chat_id ON feedback (chat_id);
+        """,
+    ),
+]
+
+MAIN_MIGRATIONS = []
+
+CACHE_MIGRATIONS = [
+    (
+        1,
+        "cache entries",
+        """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (namespace, expires_at);
+        """,
+    ),
+    (
+        2,
+        "semantic answer cache",
+        """
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            lang TEXT NOT NULL,
+            query TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_hit_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (lang, query)
+        ) WITHOUT ROWID;
+        """,
+    ),
+]
@@ -0,0 +1,112 @@
+"""
+Фоновая подготовка ответа, который пользователь, скорее всего, попросит следующим.
+
+Prefetcher хранит для каждого ключа (например, чата) одну подготовку: задачу и метку того, что
+именно готовится (например, запрос и номер первой записи следующей порции). take(key, tag)
+отдаёт результат, если метка совпала и срок не истёк; если подготовка ещё идёт, её дожидаются —
+это всё равно быстрее, чем начинать заново. Новая подготовка для ключа отменяет прежнюю.
+Подготовка хранится не дольше ttl секунд, ключей — не больше max_keys (старые отменяются).
+
+Если пользователь не попросит продолжения, подготовка тратит вызовы API впустую, поэтому запуски
+ограничивает тот же SpeculationGuard, что и спекулятивные ответы: при исчерпанном лимите
+подготовка не запускается и ответ строится по запросу, как раньше.
+
+Метрики: <name>.scheduled, .skipped, .hits, .misses, .expired, .errors, <name>.run_seconds
+и датчик <name>.pending.
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import metrics
+from speculation import SpeculationGuard
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_TTL = 600.0
+DEFAULT_MAX_KEYS = 1024
+
+
+class _Prefetch:
+    __slots__ = ("tag", "task", "expires_at")
+
+    def __init__(self, tag: Hashable, task: asyncio.Task, expires_at: float):
+        self.tag = tag
+        self.task = task
+        self.expires_at = expires_at
+
+
+class Prefetcher:
+    """Одна фоновая подготовка на ключ с меткой, сроком жизни и ограничением затрат."""
+
+    def __init__(self, name: str, ttl: float = DEFAULT_TTL, guard: Optional[SpeculationGuard] = None,
+                 max_keys: int = DEFAULT_MAX_KEYS):
+        self.name = name
+        self.ttl = ttl
+        self.guard = guard
+        self.max_keys = max_keys
+        self._entries: Dict[Hashable, _Prefetch] = {}
+        metrics.register_gauge(f"{name}.pending", lambda: sum(1 for e in self._entries.values() if not e.task.done()))
+
+    def schedule(self, key: Hashable, tag: Hashable, prepare: Callable[[], Awaitable[Any]]) -> bool:
+        """Запускает prepare() в фоне вместо прежней подготовки ключа; False, если лимит исчерпан."""
+        self.discard(key)
+        self._trim()
+        if self.guard is not None and not self.guard.try_acquire():
+            metrics.inc(f"{self.name}.skipped")
+            return False
+        task = asyncio.create_task(self._run(key, prepare), name=f"{self.name}-{key}")
+        if self.guard is not None:
+            # Через колбэк, а не finally: задача, отменённая до первого шага, не выполняет своё тело
+            task.add_done_callback(lambda _: self.guard.release())
+        self._entries[key] = _Prefetch(tag, task, time.monotonic() + self.ttl)
+        metrics.inc(f"{self.name}.scheduled")
+        return True
+
+    async def _run(self, key: Hashable, prepare: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            with metrics.timer(f"{self.name}.run_seconds"):
+                return await prepare()
+        except Exception as e:
+            metrics.inc(f"{self.name}.errors")
+            logger.error(f"Prefetch '{self.name}' for {key} failed: {e}")
+            return None
+
+    async def take(self, key: Hashable, tag: Hashable) -> Optional[Any]:
+        """Результат подготовки с меткой tag (дожидаясь её, если она ещё идёт) или None."""
+        entry = self._entries.pop(key, None)
+        if entry is None or entry.tag != tag:
+            if entry is not None:
+                entry.task.cancel()
+            metrics.inc(f"{self.name}.misses")
+            return None
+        if entry.expires_at <= time.monotonic():
+            entry.task.cancel()
+            metrics.inc(f"{self.name}.expired")
+            return None
+        result = await entry.task
+        metrics.inc(f"{self.name}.hits" if result is not None else f"{self.name}.misses")
+        return result
+
+    def discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.task.cancel()
+
+    def _trim(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self.discard(key)
+            metrics.inc(f"{self.name}.expired")
+        while len(self._entries) >= self.max_keys:
+            self.discard(next(iter(self._entries)))
+
+    async def stop(self) -> None:
+        """Отменяет все подготовки."""
+        tasks = [entry.task for entry in self._entries.values()]
+        self._entries.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
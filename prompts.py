@@ -0,0 +1,167 @@
+"""
+Сборка промпта с историей чата в пределах бюджета токенов.
+
+PromptBuilder держит в памяти сводку разговора каждого чата (LRU по chat_id): сводка читается
+из базы только при первом обращении, а после записи новой сводки фоновым заданием
+передаётся в set_summary. Последние сообщения чата лежат в context.chat_data и передаются в build().
+
+Токены считает TokenCounter — локальный токенизатор tiktoken с кодировкой модели. Файл кодировки
+tiktoken скачивает при первой загрузке (дальше берёт из своего кэша на диске), поэтому load()
+вызывается при старте в потоке; если tiktoken не установлен или кодировка недоступна, число
+токенов оценивается по словам и знакам препинания с запасом. Результаты подсчёта кэшируются.
+
+Если промпт не укладывается в бюджет, части убираются от наименее ценной к самой ценной:
+1) старые сообщения, кроме последнего предыдущего;
+2) конец сводки (сводка обрезается по границе слова);
+3) последнее предыдущее сообщение;
+4) сам запрос обрезается, только если он один больше бюджета.
+"""
+import re
+import html
+import math
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+import metrics
+from cache import LRUCache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Кодировка gpt-4o / gpt-4o-mini
+DEFAULT_ENCODING = "o200k_base"
+DEFAULT_PROMPT_BUDGET = 1500
+DEFAULT_CACHE_SIZE = 4096
+
+_ESTIMATE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка сверху: слово латиницей — токен на 4 символа, другими алфавитами — на 2, знак — токен."""
+    tokens = 0
+    for match in _ESTIMATE_RE.finditer(text):
+        word = match.group(0)
+        tokens += math.ceil(len(word) / (4 if word.isascii() else 2))
+    return tokens
+
+
+class TokenCounter:
+    """Подсчёт токенов локальным токенизатором с кэшем по тексту."""
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._cache = LRUCache(cache_size)
+
+    def load(self) -> bool:
+        """Загружает кодировку tiktoken (может скачать файл); без неё используется оценка."""
+        if tiktoken is None:
+            logger.warning("tiktoken is not installed; prompt tokens are estimated.")
+            return False
+        try:
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.warning(f"Cannot load tiktoken encoding {self.encoding_name}: {e}; prompt tokens are estimated.")
+            return False
+        self._cache.clear()
+        logger.info(f"Token counter uses tiktoken encoding {self.encoding_name}.")
+        return True
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokens = self._cache.get(text)
+        if tokens is None:
+            if self._encoding is not None:
+                tokens = len(self._encoding.encode(text, disallowed_special=()))
+            else:
+                tokens = estimate_tokens(text)
+            self._cache.set(text, tokens)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Начало текста не длиннее max_tokens, обрезанное по границе слова."""
+        if max_tokens <= 0:
+            return ""
+        while text and self.count(text) > max_tokens:
+            cut = int(len(text) * max_tokens / self.count(text)) - 1
+            space = text.rfind(" ", 0, cut)
+            text = text[:space if space > cut // 2 else max(cut, 0)].rstrip()
+        return text
+
+
+class PromptBuilder:
+    """Промпт «сводка + последние сообщения + запрос» в пределах budget токенов."""
+
+    def __init__(self, load_summary: Callable[[str], Awaitable[str]], counter: TokenCounter,
+                 budget: int = DEFAULT_PROMPT_BUDGET, max_chats: int = DEFAULT_CACHE_SIZE):
+        self.load_summary = load_summary
+        self.counter = counter
+        self.budget = budget
+        self._summaries = LRUCache(max_chats)
+        metrics.register_gauge("prompts.cached_chats", lambda: len(self._summaries))
+
+    async def summary(self, chat_id: str) -> str:
+        summary = self._summaries.get(chat_id)
+        if summary is None:
+            metrics.inc("prompts.summary_loads")
+            summary = await self.load_summary(chat_id) or ""
+            self._summaries.set(chat_id, summary)
+        return summary
+
+    def set_summary(self, chat_id: str, summary: str) -> None:
+        """Вызывается после записи новой сводки в базу."""
+        self._summaries.set(chat_id, summary)
+
+    async def build(self, chat_id: str, query: str, recent_messages: Optional[List[str]] = None) -> str:
+        prompt = self.assemble(await self.summary(chat_id), recent_messages or [], query)
+        # Средний размер промпта — prompts.tokens / prompts.built
+        metrics.inc("prompts.built")
+        metrics.inc("prompts.tokens", self.counter.count(prompt))
+        return prompt
+
+    def assemble(self, summary: str, recent_messages: List[str], query: str) -> str:
+        # Текущий запрос уже добавлен в recent_messages обработчиком — второй раз он не нужен
+        recent = list(recent_messages)
+        if recent and recent[-1] == query:
+            recent.pop()
+        count = self.counter.count
+        query_line = f"Now answer the following query: {html.escape(query)}"
+        summary_prefix, recent_header = "Conversation summary: ", "Recent messages:"
+
+        def total() -> int:
+            tokens = count(query_line)
+            if summary:
+                tokens += count(summary_prefix) + count(summary)
+            if recent:
+                tokens += count(recent_header) + sum(count(f"- {msg}") + 1 for msg in recent)
+            return tokens
+
+        trimmed = False
+        while len(recent) > 1 and total() > self.budget:
+            recent.pop(0)
+            trimmed = True
+        if summary and total() > self.budget:
+            summary = self.counter.truncate(summary, self.budget - (total() - count(summary)))
+            trimmed = True
+        if recent and total() > self.budget:
+            recent.clear()
+            trimmed = True
+        if total() > self.budget:
+            query_line = self.counter.truncate(query_line, self.budget)
+            trimmed = True
+        if trimmed:
+            metrics.inc("prompts.trimmed")
+
+        parts = []
+        if summary:
+            parts.append(f"{summary_prefix}{summary}")
+        if recent:
+            parts.append(recent_header + "".join(f"\n- {msg}" for msg in recent))
+        parts.append(query_line)
+        return "\n".join(parts)
@@ -0,0 +1,86 @@
+"""
+Спекулятивное выполнение: ветки, между которыми выбирает медленный классификатор, стартуют
+одновременно с ним.
+
+run_speculative() запускает решающую корутину и все ветки параллельно, дожидается решения,
+отменяет невыбранные ветки и возвращает результат выбранной. Так задержка ответа равна
+max(классификатор, ветка), а не их сумме.
+
+Спекуляция тратит лишние вызовы API, поэтому её ограничивает SpeculationGuard: не больше
+max_per_minute спекулятивных запусков в минуту (token bucket) и одновременно не больше
+max_in_flight. Если лимит исчерпан, вызывающий код выполняет шаги последовательно.
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class SpeculationGuard:
+    """Ограничитель затрат на спекуляцию: скорость запусков и число одновременных."""
+
+    def __init__(self, max_per_minute: float, max_in_flight: int):
+        self.rate = max_per_minute / 60.0
+        self.capacity = max(1.0, float(max_per_minute))
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        metrics.register_gauge("speculation.in_flight", lambda: self.in_flight)
+
+    def try_acquire(self) -> bool:
+        if self.rate <= 0 or self.in_flight >= self.max_in_flight:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+
+def _discard_result(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        metrics.inc("speculation.discarded_errors")
+
+
+async def run_speculative(decide: Awaitable[Hashable],
+                          branches: Dict[Hashable, Callable[[], Awaitable[Any]]]) -> Tuple[Hashable, Any]:
+    """
+    Запускает decide и все ветки одновременно; возвращает (решение, результат выбранной ветки).
+    Невыбранные ветки отменяются. Если для решения нет ветки, результат — None.
+    """
+    tasks = {key: asyncio.ensure_future(factory()) for key, factory in branches.items()}
+    metrics.inc("speculation.started")
+    try:
+        choice = await decide
+    except BaseException:
+        for task in tasks.values():
+            task.add_done_callback(_discard_result)
+            task.cancel()
+        raise
+    for key, task in tasks.items():
+        if key == choice:
+            continue
+        # Исключение ненужной ветки забираем, иначе asyncio пишет «Task exception was never retrieved»
+        if not task.done():
+            task.add_done_callback(_discard_result)
+            task.cancel()
+            metrics.inc("speculation.cancelled")
+        else:
+            _discard_result(task)
+    metrics.inc(f"speculation.chose_{choice}")
+    chosen = tasks.get(choice)
+    if chosen is None:
+        return choice, None
+    return choice, await chosen
@@ -0,0 +1,143 @@
+"""
+Потоковая отправка ответа LLM в Telegram через редактирование сообщения.
+
+StreamingReply сразу отправляет сообщение-заглушку, а затем по мере поступления текста
+редактирует его не чаще одного раза в edit_interval секунд (лимиты Telegram на редактирование
+сообщений в одном чате). Каждая промежуточная версия — валидный HTML: незаконченный тег или
+HTML-сущность в конце отбрасываются, незакрытые теги закрываются. Когда текст превышает
+max_length (4096 символов — лимит Telegram), он продолжается в новом сообщении; деление на
+сообщения выполняет markup.chunk_html, открытые на границе теги переносятся в продолжение.
+"""
+import re
+import time
+import asyncio
+import datetime
+import logging
+from typing import Callable, List, Optional
+
+from telegram import Message
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+from markup import TELEGRAM_MAX_MESSAGE_LENGTH, chunk_html
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Не чаще одного редактирования в секунду на сообщение
+DEFAULT_EDIT_INTERVAL = 1.0
+STREAM_PLACEHOLDER = "…"
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z]+)[^>]*>")
+_PARTIAL_TAIL_RE = re.compile(r"<[^>]*$|&#?\w*$")
+
+
+def open_tags(text: str) -> List[str]:
+    """Теги (в исходном виде), открытые и не закрытые к концу text."""
+    stack = []
+    for match in _TAG_RE.finditer(text):
+        closing, name = match.group(1), match.group(2).lower()
+        if not closing:
+            stack.append((name, match.group(0)))
+        else:
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    del stack[i:]
+                    break
+    return [tag for _, tag in stack]
+
+
+def close_tags(tags: List[str]) -> str:
+    return "".join(f"</{_TAG_RE.match(tag).group(2).lower()}>" for tag in reversed(tags))
+
+
+def complete_partial_html(text: str) -> str:
+    """Превращает префикс генерируемого HTML в валидный: отбрасывает обрывок тега/сущности и закрывает теги."""
+    text = _PARTIAL_TAIL_RE.sub("", text)
+    return text + close_tags(open_tags(text))
+
+
+class StreamingReply:
+    """Ответ, который пишется в чат по частям через edit_text, с переходом в новое сообщение после max_length."""
+
+    def __init__(self, message: Message, render: Callable[[str], str] = complete_partial_html,
+                 reply_markup=None, edit_interval: float = DEFAULT_EDIT_INTERVAL,
+                 max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH):
+        self.message = message
+        self.render = render
+        self.reply_markup = reply_markup
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.text = ""
+        self.messages: List[Message] = []
+        self._sent: List[str] = []
+        self._last_edit = 0.0
+        self._blocked_until = 0.0
+
+    async def start(self, placeholder: str = STREAM_PLACEHOLDER) -> Message:
+        bot_message = await self.message.reply_text(placeholder, reply_markup=self.reply_markup)
+        self.messages.append(bot_message)
+        self._sent.append(placeholder)
+        self._last_edit = time.monotonic()
+        return bot_message
+
+    async def feed(self, delta: str) -> None:
+        """Добавляет фрагмент; сообщение обновляется, если с прошлого редактирования прошло edit_interval."""
+        self.text += delta
+        now = time.monotonic()
+        if now - self._last_edit >= self.edit_interval and now >= self._blocked_until:
+            await self._sync(complete_partial_html(self.text))
+
+    async def finish(self, final_text: Optional[str] = None) -> Optional[Message]:
+        """Записывает окончательный текст (по умолчанию — накопленный) и возвращает последнее сообщение."""
+        if final_text is not None:
+            self.text = final_text
+        if self._blocked_until > time.monotonic():
+            await asyncio.sleep(self._blocked_until - time.monotonic())
+        await self._sync(self.text, final=True)
+        return self.messages[-1] if self.messages else None
+
+    async def _sync(self, text: str, final: bool = False) -> None:
+        self._last_edit = time.monotonic()
+        chunks = chunk_html(self.render(text), self.max_length) if text.strip() else []
+        if not chunks:
+            return
+        try:
+            for i, chunk in enumerate(chunks):
+                if i < len(self.messages):
+                    if chunk != self._sent[i]:
+                        await self._edit(i, chunk)
+                else:
+                    bot_message = await self.message.reply_text(
+                        chunk, parse_mode=ParseMode.HTML, reply_markup=self.reply_markup
+                    )
+                    self.messages.append(bot_message)
+                    self._sent.append(chunk)
+            if final:
+                # Окончательный текст может оказаться короче потока (например, после перевода)
+                for bot_message in self.messages[len(chunks):]:
+                    await bot_message.delete()
+                del self.messages[len(chunks):]
+                del self._sent[len(chunks):]
+        except RetryAfter as e:
+            delay = e.retry_after
+            if isinstance(delay, datetime.timedelta):
+                delay = delay.total_seconds()
+            self._blocked_until = time.monotonic() + delay
+            logger.warning(f"Stream edits throttled by Telegram for {delay}s.")
+            if final:
+                await asyncio.sleep(delay)
+                await self._sync(text, final=True)
+        except (BadRequest, TimedOut) as e:
+            # Промежуточное обновление можно пропустить: следующее перерисует текст целиком
+            if final:
+                raise
+            logger.warning(f"Stream edit skipped: {e}")
+
+    async def _edit(self, index: int, chunk: str) -> None:
+        try:
+            await self.messages[index].edit_text(chunk, parse_mode=ParseMode.HTML)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self._sent[index] = chunk
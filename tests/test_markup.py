@@ -0,0 +1,180 @@
+"""
+Свойства markup.validate_html и markup.chunk_html на случайных входах с фиксированными seed.
+
+validate_html должен совпадать символ в символ с прежней реализацией на BeautifulSoup
+(html.parser) на строках из фрагментов, типичных для ответов LLM, и из «неудобных» фрагментов
+(незакрытые и перепутанные теги, сущности без ';', одиночные < и &, комментарии, <script>, <pre>,
+атрибуты с кавычками). chunk_html на очищенных длинных ответах со случайными лимитами должен
+укладывать каждую часть в свой лимит, сохранять баланс тегов в каждой части и не терять видимый
+текст (разрезы убирают только пробельные символы).
+
+Генераторы и проверки используются и в benchmarks/bench_html.py (там — с большим числом случаев).
+
+Запуск: python -m pytest -q tests
+"""
+import re
+import random
+import warnings
+from typing import List, Optional
+
+import pytest
+from bs4 import BeautifulSoup
+
+from markup import chunk_html, validate_html
+
+warnings.filterwarnings("ignore", module="bs4")
+
+SEEDS = (1, 2, 3, 4, 5)
+EQUIVALENCE_CASES = 2000
+CHUNK_CASES = 200
+
+LLM_FRAGMENTS = [
+    "<b>", "</b>", "<i>", "</i>", "<a href=\"https://www.google.com/maps/place/?q=place_id:ChIJ123\">", "</a>",
+    "Café Frida", " — ", "rating 4.5 ⭐", "\n", "\n\n", " ", "Open now", "🍽️", "​", "<br>", "<br/>",
+    "Precio: $$", "AT&T", "&amp;", "&quot;", "&nbsp;", "&#39;", "&#x1F600;", "5 < 6", "x > y", "Tom & Jerry",
+    "<p>", "</p>", "<ul>", "<li>", "</li>", "</ul>", "<strong>", "</strong>", "<em>", "<u>", "</u>",
+    "<a>", "<a href='x?a=1&b=2'>", "<a href=x title=\"say 'hi'\">", "<b class=\"a  b\" id=t>",
+]
+NASTY_FRAGMENTS = [
+    "<", ">", "&", "&#", "&#12", "&#x", "&am", "&amp", "&foo;", "&foo", "&#0;", "&#128;", "&#xD800;", "&#1114112;",
+    "</", "</>", "</ b>", "</b x=1>", "<b", "<b ", "<a href", "<a href=", "<a href='", "<b/>", "<i/>", "<br>", "</br>",
+    "<img src=x>", "<hr/>", "<!-- c -->", "<!--", "<!x>", "<!DOCTYPE html>", "<?pi?>", "<![CDATA[x]]>",
+    "<script>", "</script>", "<style>", "</style>", "<pre>", "</pre>", "<textarea>", "</textarea>", "  ", "\t", "\r\n",
+    "<B>", "</I>", "<A HREF=\"u\">", "<a href=\"a'b&quot;c\">", "<a rel=' x  y '>", "<b x y=z>", "<span\n>", "é", "<3",
+]
+
+
+def reference_validate_html(text: str) -> str:
+    """Прежняя реализация из bot.py."""
+    soup = BeautifulSoup(text, "html.parser")
+    for br in soup.find_all("br"):
+        br.replace_with("\n")
+    allowed_tags = ["b", "i", "a"]
+    for tag in soup.find_all(True):
+        if tag.name not in allowed_tags:
+            tag.unwrap()
+        elif tag.name == "a":
+            if not tag.has_attr("href"):
+                tag.unwrap()
+    return str(soup)
+
+
+def shrink(fragments: list) -> list:
+    """Уменьшает пример расхождения, убирая фрагменты, пока расхождение сохраняется."""
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(fragments)):
+            candidate = fragments[:i] + fragments[i + 1:]
+            text = "".join(candidate)
+            if validate_html(text) != reference_validate_html(text):
+                fragments, changed = candidate, True
+                break
+    return fragments
+
+
+def find_mismatch(cases: int, seed: int) -> Optional[str]:
+    """Минимальный найденный вход, на котором validate_html расходится с эталоном, или None."""
+    rng = random.Random(seed)
+    for _ in range(cases):
+        pool = LLM_FRAGMENTS if rng.random() < 0.5 else LLM_FRAGMENTS + NASTY_FRAGMENTS
+        fragments = [rng.choice(pool) for _ in range(rng.randint(0, 40))]
+        text = "".join(fragments)
+        if validate_html(text) != reference_validate_html(text):
+            return "".join(shrink(fragments))
+    return None
+
+
+_TAG_RE = re.compile(r"<(/?)([a-z]+)[^>]*>")
+
+
+def chunk_problem(chunks: List[str], text: str, max_length: int, first_length: int) -> str:
+    """Описание нарушения свойств chunk_html или пустая строка."""
+    for n, chunk in enumerate(chunks):
+        limit = first_length if n == 0 else max_length
+        if len(chunk) > limit:
+            return f"chunk {n} has {len(chunk)} > {limit} chars"
+        stack = []
+        for match in _TAG_RE.finditer(chunk):
+            if not match.group(1):
+                stack.append(match.group(2))
+            elif not stack or stack.pop() != match.group(2):
+                return f"chunk {n} closes </{match.group(2)}> out of order"
+        if stack:
+            return f"chunk {n} leaves {stack} open"
+    visible = "".join(re.sub(r"\s+", "", _TAG_RE.sub("", chunk)) for chunk in chunks)
+    if visible != re.sub(r"\s+", "", _TAG_RE.sub("", text)):
+        return "visible text changed"
+    return ""
+
+
+WORDS = ["Café", "Frida", "rating", "4.5", "⭐", "&amp;", "Tom", "x &gt; y", "🍽️", "Open", "now", "Precio:", "$$",
+         "Chiapas", "cathedral", "coffee", "https://www.google.com/maps/place/?q=place_id:ChIJ123&amp;hl=en"]
+
+
+def random_words(rng: random.Random) -> str:
+    words = []
+    for _ in range(rng.randint(1, 12)):
+        word = rng.choice(WORDS)
+        if rng.random() < 0.01:
+            word = word * rng.randint(20, 80)  # длинное слово без пробелов
+        roll = rng.random()
+        if roll < 0.1:
+            word = f"<b>{word}</b>"
+        elif roll < 0.2:
+            word = f"<i>{word}</i>"
+        elif roll < 0.25:
+            word = f'<a href="https://maps.google.com/?q={rng.randint(1, 999)}">{word}</a>'
+        words.append(word)
+    line = " ".join(words)
+    if rng.random() < 0.2:
+        line = f"<{rng.choice('bi')}>{line}</{rng.choice('bi')}>"
+    return line
+
+
+def random_answer(rng: random.Random) -> str:
+    """Ответ из записей через пустую строку; иногда весь ответ внутри одного тега."""
+    entries = ["\n".join(random_words(rng) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(0, 60))]
+    answer = "\n\n".join(entries)
+    if rng.random() < 0.2:
+        answer = f"<b>{answer}</b>"
+    return validate_html(answer)
+
+
+def find_chunk_problem(cases: int, seed: int) -> Optional[str]:
+    """Описание первого нарушения свойств chunk_html (с лимитами и входом) или None."""
+    rng = random.Random(seed)
+    for _ in range(cases):
+        text = random_answer(rng)
+        max_length = rng.choice((4096, 1024, 500, 300))
+        first_length = rng.choice((max_length, 1024, 300))
+        problem = chunk_problem(chunk_html(text, max_length, first_length=first_length), text, max_length, first_length)
+        if problem:
+            return f"{problem} (max_length={max_length}, first_length={first_length}) on {text!r}"
+    return None
+
+
+def llm_answer(size: int) -> str:
+    """Ответ в формате handle_places_query: записи о местах через пустую строку."""
+    entry = ("<b>Café Frida</b> ⭐ 4.5\n<i>Traditional Chiapas food &amp; great coffee near the cathedral.</i>\n"
+             "<a href=\"https://www.google.com/maps/place/?q=place_id:ChIJ123&hl=en\">Open in Google Maps</a><br>\n\n")
+    return (entry * (size // len(entry) + 1))[:size]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_validate_html_matches_beautifulsoup(seed):
+    text = find_mismatch(EQUIVALENCE_CASES, seed)
+    assert text is None, (f"mismatch on {text!r}: expected {reference_validate_html(text)!r}, "
+                          f"got {validate_html(text)!r}")
+
+
+@pytest.mark.parametrize("size", (4 * 1024, 40 * 1024))
+def test_validate_html_matches_beautifulsoup_on_long_answers(size):
+    text = llm_answer(size)
+    assert validate_html(text) == reference_validate_html(text)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_chunk_html_keeps_limits_and_balanced_tags(seed):
+    problem = find_chunk_problem(CHUNK_CASES, seed)
+    assert problem is None, problem